@@ -0,0 +1,3 @@
+from .server import TicketCache
+from .server import LatencyRecorder
+from .server import TicketService
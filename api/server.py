@@ -0,0 +1,176 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from sqlalchemy.engine import Engine
+from orm.lookup import lookup_ticket
+
+
+"""
+准考證號碼查詢服務
+
+本機的 HTTP/JSON 唯讀服務:
+    - GET /tickets/<准考證號碼>: 該准考證號碼在所有年度、入學管道的錄取結果
+    - GET /stats: 查詢延遲 (p50/p99) 與快取命中統計
+
+查詢結果放在行程內的 LRU 快取，超過存活時間後重新查詢 (爬蟲寫入的新資料最晚在存活時間後可見)。
+"""
+
+
+class TicketCache:
+    """
+    TicketCache is a thread-safe LRU cache with a time-to-live for lookup results.
+
+    Functions:
+        - get: get a cached result (None when missing or expired)
+        - put: cache a result, evicting the least recently used one when full
+        - stats: size, hits, misses and hit rate
+    """
+    def __init__(self, size: int = 10000, ttl: float = 300.0) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class LatencyRecorder:
+    """
+    LatencyRecorder keeps the latencies of the most recent requests and reports their percentiles.
+    """
+    def __init__(self, window: int = 10000) -> None:
+        self.lock = threading.Lock()
+        self.samples: deque = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+        if not samples:
+            return {'requests': count, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        percentile = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+        return {
+            'requests': count,
+            'p50_ms': round(percentile(0.50), 3),
+            'p99_ms': round(percentile(0.99), 3),
+            'max_ms': round(samples[-1] * 1000, 3),
+        }
+
+
+class TicketService:
+    """
+    TicketService serves ticket lookups over a local HTTP/JSON API,
+    with an in-process LRU cache in front of the covering-index query.
+
+    Functions:
+        - lookup: admissions of a ticket across all years (cached)
+        - serve: run the HTTP server until interrupted
+        - shutdown: stop the HTTP server
+        - stats: latency percentiles and cache statistics
+    """
+    def __init__(self, db: Engine, cache_size: int = 10000, cache_ttl: float = 300.0) -> None:
+        self.logger = logging.getLogger('api')
+        self.db = db
+        self.cache = TicketCache(cache_size, cache_ttl)
+        self.latency = LatencyRecorder()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def lookup(self, ticket: str) -> List[Dict[str, Any]]:
+        admissions = self.cache.get(ticket)
+        if admissions is None:
+            with self.db.connect() as conn:
+                admissions = lookup_ticket(conn, ticket)
+            self.cache.put(ticket, admissions)
+        return admissions
+
+    def stats(self) -> dict:
+        return {'latency': self.latency.stats(), 'cache': self.cache.stats()}
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8080):
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.logger.info(f'准考證號碼查詢服務啟動: http://{host}:{self.server.server_port}/tickets/<准考證號碼>')
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.logger.info(f'准考證號碼查詢服務結束，統計: {self.stats()}')
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                start = time.perf_counter()
+                path = urlsplit(self.path).path.rstrip('/')
+                if path.startswith('/tickets/'):
+                    ticket = unquote(path[len('/tickets/'):]).strip()
+                    try:
+                        self._send(200, {'ticket': ticket, 'admissions': service.lookup(ticket)})
+                    except Exception as e:
+                        service.logger.error(f'查詢准考證號碼 {ticket} 失敗, 原因: {e}')
+                        self._send(500, {'error': 'lookup failed'})
+                    service.latency.record(time.perf_counter() - start)
+                elif path == '/stats':
+                    self._send(200, service.stats())
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def _send(self, status: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                service.logger.debug(f'{self.address_string()} {format % args}')
+
+        return Handler
@@ -0,0 +1,2 @@
+from .site import *
+from .server import *
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+from dataclasses import asdict
+import requests
+from conf import AppConfig
+from conf.config import DBConfig, FlareSolverrConfig, LogConfig, OcrConfig, ScrapeConfig, SinkConfig
+from bench.site import METHODS, SiteSpec, SyntheticSite
+from bench.server import SOLVER_PATH, STATS_PATH, Faults, start_server, stop_server
+from bench.startup import format_startup, run_startup
+from bench.memory import format_memory, run_memory
+
+
+"""
+離線壓力測試
+
+啟動模擬網站 (與 FlareSolverr)，以一般爬取相同的流程 (首頁 -> 學校列表 -> 科系列表 -> 榜單 -> sink)
+爬完所有入學管道，輸出每秒頁數、每秒寫入筆數與各階段耗時，用來比較改動前後的吞吐量。
+
+OCR 預設使用 warm 模式: 預先把模擬網站所有圖片的辨識結果放進 OCR 快取 (不需要 tesseract)，
+`--ocr tesseract` 則實際呼叫 tesseract 辨識。`--startup` 改為量測命令列的啟動時間 (見 bench/startup.py)，
+`--memory` 改為量測各種頁面解析時的記憶體用量 (見 bench/memory.py)。
+"""
+
+parser = argparse.ArgumentParser(prog='python -m bench', description='offline end-to-end load test against a mock site')
+parser.add_argument('--schools', type=int, default=10, help='schools per method (cross also lists half as many tech schools)')
+parser.add_argument('--departments', type=int, default=10, help='departments per school')
+parser.add_argument('--students', type=int, default=30, help='admitted students per department')
+parser.add_argument('--years', type=int, default=1, help='number of years per method (113, 112, ...)')
+parser.add_argument('--methods', type=str, default=','.join(METHODS), help='comma separated methods to crawl')
+parser.add_argument('--latency-ms', type=float, default=0.0, help='latency of every request to the mock site')
+parser.add_argument('--jitter', type=float, default=0.5, help='random jitter of the latency, as a fraction of it')
+parser.add_argument('--challenge-rate', type=float, default=0.0, help='probability of a Cloudflare challenge for requests without a valid clearance cookie')
+parser.add_argument('--error-rate', type=float, default=0.0, help='probability of an HTTP 500 response')
+parser.add_argument('--clearance-ttl', type=float, default=300.0, help='seconds a cf_clearance cookie from the fake FlareSolverr stays valid')
+parser.add_argument('--solve-ms', type=float, default=0.0, help='time the fake FlareSolverr takes per solve')
+parser.add_argument('--ocr', type=str, default='warm', choices=['warm', 'tesseract'], help='warm: pre-seed the OCR cache with every image of the mock site; tesseract: run real OCR')
+parser.add_argument('--pytesseract-path', type=str, default='tesseract', help='tesseract executable (with --ocr tesseract)')
+parser.add_argument('--ocr-workers', type=int, default=0, help='OCR service worker processes (with --ocr tesseract)')
+parser.add_argument('--sinks', type=str, default='sql', help='comma separated result sinks: sql, ndjson, csv')
+parser.add_argument('--workdir', type=str, default=None, help='directory of the benchmark database, logs and sink files (default: a temporary directory, removed afterwards)')
+parser.add_argument('--log-level', type=str, default='WARNING', help='log level of the crawl')
+parser.add_argument('--json', action='store_true', help='print the report as JSON')
+parser.add_argument('--seed', type=int, default=0, help='seed of the generated data and injected faults')
+parser.add_argument('--startup', action='store_true', help='measure startup time, memory and loaded modules of the CLI instead of crawling')
+parser.add_argument('--repeat', type=int, default=5, help='runs of each startup scenario (with --startup)')
+parser.add_argument('--memory', action='store_true', help='measure peak RSS and allocations of parsing each page type (sized by --schools/--departments/--students) instead of crawling')
+
+def build_config(arg, base_url: str, workdir: str) -> AppConfig:
+    return AppConfig(
+        flaresolverr=FlareSolverrConfig(flaresolverr_url=base_url + SOLVER_PATH.lstrip('/'), max_timeout=30, retry=3, delay=0),
+        database=DBConfig(type='sqlite', db_file=os.path.join(workdir, 'bench.sqlite3')),
+        logger=LogConfig(level=arg.log_level, file=os.path.join(workdir, 'bench.log')),
+        ocr=OcrConfig(pytesseract_path=arg.pytesseract_path, cache_path=os.path.join(workdir, 'ocr_cache.json'), workers=arg.ocr_workers),
+        scrape=ScrapeConfig(base_url=base_url),
+        sink=SinkConfig(targets=[sink.strip() for sink in arg.sinks.split(',') if sink.strip()], path=os.path.join(workdir, 'results')),
+    )
+
+def crawl(scraper, spec: SiteSpec):
+    # 與 Scraper.run 相同的流程，但不在入學管道之間等待
+    for current in scraper.fetch_available_years() or []:
+        if current.method not in spec.methods:
+            continue
+        for year in current.available_years:
+            scraper.crawlers[current.method].crawl(year)
+    for sink in scraper.sinks:
+        sink.flush()
+
+def run(arg) -> dict:
+    # 延後匯入，讓 --help 不需要初始化爬蟲的相依套件
+    from main import init, app_exit
+    from scrapers import Scraper
+    from scrapers.ocr import OCR
+    from scrapers.profiling import Spans
+
+    methods = tuple(method.strip() for method in arg.methods.split(',') if method.strip())
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        parser.error(f'unknown methods: {", ".join(sorted(unknown))}')
+    spec = SiteSpec(arg.schools, arg.departments, arg.students,
+                    tuple(str(113 - index) for index in range(arg.years)), methods, arg.seed)
+    faults = Faults(arg.latency_ms / 1000, arg.jitter, arg.challenge_rate, arg.error_rate,
+                    arg.clearance_ttl, arg.solve_ms / 1000, arg.seed)
+
+    workdir = arg.workdir or tempfile.mkdtemp(prefix='bench-')
+    os.makedirs(workdir, exist_ok=True)
+    process, base_url = start_server(spec, faults)
+    try:
+        config_path = os.path.join(workdir, 'config.yaml')
+        AppConfig.save(build_config(arg, base_url, workdir), config_path)
+        cfg, logger, db = init(config_path, ocr=arg.ocr == 'tesseract')
+        if arg.ocr == 'warm':
+            OCR().cache.update(SyntheticSite(spec).ocr_seed())
+
+        scraper = Scraper(cfg, db)
+        try:
+            start = time.perf_counter()
+            crawl(scraper, spec)
+            elapsed = time.perf_counter() - start
+        finally:
+            scraper.close()
+            app_exit(cfg, db)
+        server = requests.get(base_url + STATS_PATH.lstrip('/'), timeout=10).json()
+    finally:
+        stop_server(process)
+        if not arg.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # 成功取得的頁面數 (直接回應與 FlareSolverr 代為取得的)
+    pages = server['pages']
+    rows = max((sink.stats()['rows'] for sink in scraper.sinks), default=0)
+    return {
+        'spec': {'schools': spec.schools, 'departments': spec.departments, 'students': spec.students,
+                 'years': list(spec.years), 'methods': list(spec.methods)},
+        'faults': asdict(faults),
+        'ocr': arg.ocr,
+        'elapsed_seconds': round(elapsed, 3),
+        'pages': pages,
+        'pages_per_second': round(pages / elapsed, 1) if elapsed else 0.0,
+        'rows': rows,
+        'rows_expected': spec.expected_rows(),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else 0.0,
+        'server': server,
+        'ocr_cache': OCR().stats(),
+        'sinks': {sink.name: sink.stats() for sink in scraper.sinks},
+        'stages': Spans().report(),
+        'workdir': arg.workdir,
+    }
+
+def print_report(report: dict):
+    from scrapers.profiling import Spans
+    spec = report['spec']
+    server = report['server']
+    print(f'規模: {spec["schools"]} 所學校 × {spec["departments"]} 個科系 × {spec["students"]} 人，'
+          f'學年度 {",".join(spec["years"])}，入學管道 {",".join(spec["methods"])} (OCR: {report["ocr"]})')
+    print(f'耗時: {report["elapsed_seconds"]:.3f} 秒')
+    print(f'頁面: {report["pages"]} 頁，{report["pages_per_second"]:.1f} 頁/秒')
+    print(f'寫入: {report["rows"]} 筆 (預期 {report["rows_expected"]} 筆)，{report["rows_per_second"]:.1f} 筆/秒')
+    print(f'伺服器: 請求 {server["requests"]}，Cloudflare 驗證 {server["challenges"]}，錯誤 {server["errors"]}，'
+          f'找不到頁面 {server["not_found"]}，FlareSolverr 驗證 {server["solves"]} (失敗 {server["solve_failures"]})')
+    print(f'OCR 快取: {report["ocr_cache"]}')
+    print(Spans().format_report())
+
+if __name__ == '__main__':
+    arg = parser.parse_args()
+    if arg.startup:
+        startup = run_startup(arg.repeat)
+        print(json.dumps(startup, ensure_ascii=False, indent=2) if arg.json else format_startup(startup))
+        sys.exit(0)
+    if arg.memory:
+        memory = run_memory(arg.schools, arg.departments, arg.students)
+        print(json.dumps(memory, ensure_ascii=False, indent=2) if arg.json else format_memory(memory))
+        sys.exit(0)
+    report = run(arg)
+    if arg.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+    if report['rows'] != report['rows_expected']:
+        logging.getLogger('bench').warning(f'寫入筆數與預期不符: {report["rows"]} != {report["rows_expected"]}')
+        sys.exit(1)
@@ -0,0 +1,114 @@
+import sys
+import json
+import subprocess
+from dataclasses import asdict
+from typing import Dict, List, Tuple
+from bench.site import SiteSpec, SyntheticSite
+from bench.startup import ROOT
+
+
+"""
+各種頁面的解析記憶體用量
+
+每種頁面 (首頁、學校列表、各入學管道的科系列表與榜單) 在新的 process 中解析，回報:
+    - rss_peak: 解析期間的最大 RSS (Linux 解析前先以 /proc/self/clear_refs 重設最大值)
+    - parse_peak: tracemalloc 量到的 Python 物件配置峰值
+    - retained: 解析結束、尚未執行垃圾回收時仍然存活的記憶體 (包含解析結果；BeautifulSoup 的樹沒有拆除時會留到 GC 才釋放)
+"""
+
+# (頁面種類, 入學管道, 解析器)
+PAGE_TYPES: Tuple[Tuple[str, str, str], ...] = (
+    ('home', '', 'AvailableYearsParser'),
+    ('university_list', 'exam', 'UniversityListParser'),
+    ('department_list', 'exam', 'ExamDepartmentListParser'),
+    ('admission', 'exam', 'ExamAdmissionListParser'),
+    ('department_list', 'star', 'StarDepartmentListParser'),
+    ('admission', 'star', 'StarAdmissionListParser'),
+    ('department_list', 'cross', 'CrossDepartmentListParser'),
+    ('admission', 'cross', 'CrossAdmissionListParser'),
+    ('department_list', 'vtech', 'VtechDepartmentListParser'),
+    ('admission', 'vtech', 'VtechAdmissionParser'),
+    ('department_list', 'techreg', 'TechregDepartmentParser'),
+    ('admission', 'techreg', 'TechregAdmissionParser'),
+)
+
+# 子 process: 產生頁面、預先放入 OCR 快取後解析一次
+_PROBE = '''
+import gc, sys, json, tracemalloc
+from bench.site import SiteSpec, SyntheticSite
+from scrapers import webparser
+from scrapers.ocr import OCR
+
+def status(field):
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith(field + ':'))
+    except (OSError, StopIteration):
+        return None
+
+options = json.loads(sys.argv[1])
+site = SyntheticSite(SiteSpec(**options['spec']))
+html = site.render(options['path'])
+OCR().cache.update(site.ocr_seed(options['ocr_departments']))
+parser = getattr(webparser, options['parser'])()
+# 預先解析一次 (載入 lxml、建立快取)
+parser.parse(html)
+gc.collect()
+gc.disable()
+try:
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+except OSError:
+    pass
+baseline = status('VmRSS')
+tracemalloc.start()
+before = tracemalloc.get_traced_memory()[0]
+result = parser.parse(html)
+current, peak = tracemalloc.get_traced_memory()
+print(json.dumps({
+    'html_bytes': len(html.encode('utf-8')),
+    'baseline_kb': baseline,
+    'rss_peak_kb': status('VmHWM'),
+    'parse_peak_bytes': peak - before,
+    'retained_bytes': current - before,
+}))
+'''
+
+def page_path(site: SyntheticSite, page: str, method: str) -> str:
+    spec = site.spec
+    year = spec.years[0]
+    if page == 'home':
+        return '/'
+    if page == 'university_list':
+        return f'/{method}/university_list{year}.html'
+    school_code = site.schools(method)[0][0]
+    if page == 'department_list':
+        return f'/{method}/university_{school_code}_{year}.html'
+    return site.check_href(method, site.departments(school_code)[0][0], year, absolute=True)
+
+def measure(spec: SiteSpec, page: str, method: str, parser: str) -> Dict:
+    site = SyntheticSite(spec)
+    path = page_path(site, page, method)
+    # 只需要計算量測的榜單頁面的 OCR 快取
+    departments = [(method, spec.years[0], site.departments(site.schools(method)[0][0])[0][0])] if page == 'admission' and method in ('cross', 'vtech') else []
+    options = {'spec': dict(asdict(spec), years=list(spec.years), methods=list(spec.methods)), 'path': path, 'parser': parser,
+               'ocr_departments': departments}
+    result = subprocess.run([sys.executable, '-c', _PROBE, json.dumps(options)],
+                            cwd=ROOT, capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(f'memory probe failed: {parser} {path}\n{result.stderr}')
+    return dict(json.loads(result.stdout.strip().splitlines()[-1]), page=page, method=method, parser=parser, path=path)
+
+def run_memory(schools: int = 10, departments: int = 10, students: int = 30) -> List[Dict]:
+    spec = SiteSpec(schools, departments, students)
+    return [measure(spec, page, method, parser) for page, method, parser in PAGE_TYPES]
+
+def format_memory(report: List[Dict]) -> str:
+    def kb_to_mib(value):
+        return f'{value / 1024:.1f}' if value is not None else '-'
+    lines = [f'{"page":<16} {"method":<8} {"html(KiB)":>10} {"rss peak(MiB)":>14} {"rss delta(MiB)":>15} {"parse peak(MiB)":>16} {"retained(KiB)":>14}']
+    for row in report:
+        delta = row['rss_peak_kb'] - row['baseline_kb'] if row['rss_peak_kb'] is not None and row['baseline_kb'] is not None else None
+        lines.append(f'{row["page"]:<16} {row["method"] or "-":<8} {row["html_bytes"] / 1024:>10.1f} {kb_to_mib(row["rss_peak_kb"]):>14} '
+                     f'{kb_to_mib(delta):>15} {row["parse_peak_bytes"] / 1024 / 1024:>16.1f} {row["retained_bytes"] / 1024:>14.1f}')
+    return '\n'.join(lines)
@@ -0,0 +1,209 @@
+import json
+import time
+import random
+import secrets
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+from bench.site import SiteSpec, SyntheticSite
+
+
+"""
+模擬網站與 FlareSolverr 的 HTTP 伺服器
+
+在獨立的 process 中執行 (不與爬蟲競爭 GIL)，可以注入:
+    - 延遲: 每個請求固定延遲加上隨機抖動
+    - Cloudflare 驗證: 沒有有效 `cf_clearance` cookie 的請求依機率回傳 403 (`Server: cloudflare`)
+    - 錯誤: 依機率回傳 500
+
+`POST /flaresolverr/v1` 模擬 FlareSolverr 的 `request.get`，回傳頁面內容與新的 `cf_clearance` cookie
+(在 `clearance_ttl` 秒內不會再被要求驗證)。`GET /_stats` 回傳伺服器端的統計。
+"""
+
+SOLVER_PATH = '/flaresolverr/v1'
+STATS_PATH = '/_stats'
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+CHALLENGE_PAGE = '<!DOCTYPE html><html><head><title>Just a moment...</title></head><body>Checking your browser before accessing the site.</body></html>'
+
+
+@dataclass(frozen=True)
+class Faults:
+    # 每個請求的延遲 (秒)
+    latency: float = 0.0
+    # 延遲的隨機抖動比例 (0.5 代表 latency 的 ±50%)
+    jitter: float = 0.0
+    # 沒有有效 cf_clearance 時回傳 Cloudflare 驗證頁的機率
+    challenge_rate: float = 0.0
+    # 回傳 500 的機率
+    error_rate: float = 0.0
+    # cf_clearance 的有效秒數
+    clearance_ttl: float = 300.0
+    # FlareSolverr 每次驗證的耗時 (秒)
+    solve_latency: float = 0.0
+    seed: int = 0
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    MockServer serves a SyntheticSite with injected latency, challenges and errors,
+    and a fake FlareSolverr endpoint.
+
+    Functions:
+        - page: render a page and count it
+        - issue_clearance: create a cf_clearance token
+        - cleared: whether a cf_clearance token is still valid
+        - stats: served pages, challenges, errors and solves
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], site: SyntheticSite, faults: Faults) -> None:
+        super().__init__(address, MockHandler)
+        self.site = site
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.random = random.Random(faults.seed)
+        # cf_clearance -> 到期時間
+        self.clearances: Dict[str, float] = {}
+        self.counters = {'requests': 0, 'pages': 0, 'bytes': 0, 'challenges': 0, 'errors': 0, 'not_found': 0, 'solves': 0, 'solve_failures': 0}
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def roll(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def delay(self):
+        latency = self.faults.latency
+        if latency > 0:
+            time.sleep(max(0.0, latency * (1 + self.faults.jitter * (2 * self.roll() - 1))))
+
+    def page(self, path: str):
+        html = self.site.render(path)
+        if html is not None:
+            self.count('pages')
+            self.count('bytes', len(html.encode('utf-8')))
+        return html
+
+    def issue_clearance(self) -> str:
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.clearances[token] = time.monotonic() + self.faults.clearance_ttl
+        return token
+
+    def cleared(self, token: str) -> bool:
+        with self.lock:
+            expires = self.clearances.get(token)
+        return expires is not None and expires > time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # keep-alive，讓爬蟲的 session 重複使用連線
+    protocol_version = 'HTTP/1.1'
+    # 標頭與內容分開寫出，避免 Nagle 與 delayed ACK 造成每個請求約 40ms 的延遲
+    disable_nagle_algorithm = True
+    server: MockServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status: int, body: str, content_type: str = 'text/html; charset=utf-8', headers: Dict[str, str] = None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        if path == STATS_PATH:
+            self.send(200, json.dumps(server.stats()), 'application/json')
+            return
+        server.count('requests')
+        server.delay()
+        if server.faults.error_rate and server.roll() < server.faults.error_rate:
+            server.count('errors')
+            self.send(500, '<html><body>Internal Server Error</body></html>')
+            return
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        clearance = cookie['cf_clearance'].value if 'cf_clearance' in cookie else ''
+        if server.faults.challenge_rate and not server.cleared(clearance) and server.roll() < server.faults.challenge_rate:
+            server.count('challenges')
+            self.send(403, CHALLENGE_PAGE, headers={'Server': 'cloudflare', 'cf-mitigated': 'challenge'})
+            return
+        html = server.page(path)
+        if html is None:
+            server.count('not_found')
+            self.send(404, '<html><body>Not Found</body></html>')
+            return
+        self.send(200, html)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if urlsplit(self.path).path != SOLVER_PATH:
+            self.send(404, '<html><body>Not Found</body></html>')
+            return
+        if server.faults.solve_latency > 0:
+            time.sleep(server.faults.solve_latency)
+        url = payload.get('url', '')
+        html = server.page(urlsplit(url).path) if payload.get('cmd') == 'request.get' else None
+        if html is None:
+            server.count('solve_failures')
+            self.send(200, json.dumps({'status': 'error', 'message': f'Error solving the challenge: {url}'}), 'application/json')
+            return
+        server.count('solves')
+        self.send(200, json.dumps({
+            'status': 'ok',
+            'message': 'Challenge solved!',
+            'solution': {
+                'url': url,
+                'status': 200,
+                'cookies': [{'name': 'cf_clearance', 'value': server.issue_clearance()}],
+                'userAgent': USER_AGENT,
+                'response': html,
+            },
+        }, ensure_ascii=False), 'application/json')
+
+
+def serve(spec: SiteSpec, faults: Faults, host: str, port: int, ready=None):
+    server = MockServer((host, port), SyntheticSite(spec), faults)
+    if ready is not None:
+        # 回傳實際的埠號 (port 為 0 時由系統分配)
+        ready.send(server.server_address[1])
+        ready.close()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def start_server(spec: SiteSpec, faults: Faults, host: str = '127.0.0.1', port: int = 0) -> Tuple[multiprocessing.Process, str]:
+    """
+    在背景 process 啟動模擬網站，回傳 (process, 網站根網址)
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=serve, args=(spec, faults, host, port, sender), daemon=True)
+    process.start()
+    sender.close()
+    if not receiver.poll(30):
+        process.terminate()
+        raise RuntimeError('mock site did not start')
+    return process, f'http://{host}:{receiver.recv()}/'
+
+def stop_server(process: multiprocessing.Process):
+    process.terminate()
+    process.join(5)
@@ -0,0 +1,347 @@
+import re
+import base64
+import hashlib
+from io import BytesIO
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+
+"""
+模擬網站的資料與頁面
+
+依設定的規模 (學校數 × 科系數 × 上榜人數) 產生固定 (同樣的 seed 產生同樣的內容) 的模擬資料，
+並以解析器預期的 HTML 結構輸出首頁、`university_list`、`university_{id}`、`check_*` 頁面，
+准考證號碼、姓名字形與備取名次以 base64 PNG 圖片呈現 (與真實網站相同，需要經過 OCR)。
+
+`ocr_seed` 依照解析器處理圖片的方式計算每張圖片的 OCR 快取 key，預先放進 OCR 快取後
+不需要安裝 tesseract 也能完整執行爬取流程 (量測的是快取命中時的吞吐量)。
+"""
+
+METHODS = ('exam', 'star', 'cross', 'vtech', 'techreg')
+METHOD_NAMES = {
+    'exam': '分科測驗',
+    'star': '大學繁星',
+    'cross': '學測查榜',
+    'vtech': '統測甄選',
+    'techreg': '統測分發',
+}
+# 各入學管道榜單網址的後綴 (學測查榜的科技大學另外處理)
+CHECK_SUFFIX = {
+    'exam': '_NO_0_{year}_0_3',
+    'star': '_NO_0_{year}_0_3',
+    'cross': '_NO_1_{year}_0_0',
+    'vtech': '_NO_1_{year}_1_3',
+    'techreg': '_{year}',
+}
+EXAM_AREAS = ('台北', '新北', '桃園', '台中', '台南', '高雄')
+NAME_CHARS = '王李張陳林黃吳劉蔡楊許鄭謝郭洪曾周賴徐葉'
+GROUPS = ('電機類', '機械類', '商管類', '設計類', '餐旅類')
+
+_font = ImageFont.load_default()
+
+_routes = [
+    (re.compile(r'^/$'), 'home'),
+    (re.compile(r'^/cross/tech_university_list(\d+)\.html$'), 'tech_university_list'),
+    (re.compile(r'^/(\w+)/university_list(\d+)\.html$'), 'university_list'),
+    (re.compile(r'^/(\w+)/university_(\d+)_(\d+)\.html$'), 'department_list'),
+    (re.compile(r'^/(\w+)/check_(\d+)(?:_NO_\d)?_(\d+)(?:_\d_\d)?\.html$'), 'admission'),
+]
+
+
+@dataclass(frozen=True)
+class SiteSpec:
+    # 每個入學管道的學校數 (學測查榜另有一半數量的科技大學)
+    schools: int = 10
+    # 每所學校的科系數
+    departments: int = 10
+    # 每個科系的上榜人數
+    students: int = 30
+    # 學年度 (由新到舊)
+    years: Tuple[str, ...] = ('113',)
+    # 入學管道
+    methods: Tuple[str, ...] = METHODS
+    seed: int = 0
+
+    @property
+    def tech_schools(self) -> int:
+        return max(1, self.schools // 2)
+
+    def expected_rows(self) -> int:
+        # 每個科系的上榜人都會寫入一筆 AdmissionPerson
+        schools = sum(self.schools + (self.tech_schools if method == 'cross' else 0) for method in self.methods)
+        return schools * self.departments * self.students * len(self.years)
+
+
+def _png(image: Image.Image) -> str:
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def _draw_char(draw: ImageDraw.ImageDraw, x: int, char: str):
+    if char.isascii():
+        draw.text((x + 1, 4), char, fill=(0, 0, 0, 255), font=_font)
+        return
+    # 預設字型沒有中文字，依字元畫出固定的筆畫 (只需要圖片大小與解碼成本接近真實網站)
+    digest = hashlib.md5(char.encode('utf-8')).digest()
+    for index in range(0, 8, 2):
+        x0, y0 = x + digest[index] % 10, 2 + digest[index + 1] % 10
+        draw.rectangle((x0, y0, x0 + 2 + digest[index] % 4, y0 + 2 + digest[index + 1] % 4), fill=(0, 0, 0, 255))
+
+@lru_cache(maxsize=4096)
+def glyph(text: str, offset: int = 0) -> str:
+    """
+    文字圖片 (透明背景的 RGBA PNG data URI)，offset 為文字前的空白寬度 (備取名次圖片)
+    """
+    widths = [8 if char.isascii() else 16 for char in text]
+    image = Image.new('RGBA', (offset + sum(widths) + 4, 20), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    x = offset + 2
+    for char, width in zip(text, widths):
+        _draw_char(draw, x, char)
+        x += width
+    return _png(image)
+
+
+class SyntheticSite:
+    """
+    SyntheticSite generates deterministic admission data at a configurable scale
+    and renders it in the markup the parsers expect.
+
+    Functions:
+        - render: the HTML of a path (None when the path does not exist)
+        - ocr_seed: OCR cache entries of every image on the site
+        - pages: every page path of the site
+    """
+    def __init__(self, spec: SiteSpec) -> None:
+        self.spec = spec
+
+    # 資料
+    def schools(self, method: str, tech: bool = False) -> List[Tuple[str, str]]:
+        if tech:
+            return [(f'{500 + index:03d}', f'模擬科技{index:03d}大學') for index in range(1, self.spec.tech_schools + 1)]
+        return [(f'{index:03d}', f'模擬{index:03d}大學') for index in range(1, self.spec.schools + 1)]
+
+    def school(self, method: str, school_code: str) -> Optional[Tuple[str, str, bool]]:
+        for tech in ((False, True) if method == 'cross' else (False,)):
+            for code, name in self.schools(method, tech):
+                if code == school_code:
+                    return code, name, tech
+        return None
+
+    def departments(self, school_code: str) -> List[Tuple[str, str]]:
+        return [(f'{school_code}{index:03d}', f'模擬學系{index:03d}') for index in range(1, self.spec.departments + 1)]
+
+    def students(self, method: str, year: str, department_id: str) -> List[Dict[str, str]]:
+        base = (METHODS.index(method) * 1000000 + int(department_id)) * self.spec.students + self.spec.seed
+        students = []
+        for index in range(self.spec.students):
+            number = base + index
+            rank = number % 40 + 1
+            students.append({
+                'ticket': f'{(number * 7919 + int(year)) % 100000000:08d}',
+                'name': NAME_CHARS[number % len(NAME_CHARS)] + '*' + NAME_CHARS[(number // 7) % len(NAME_CHARS)],
+                'exam_area': EXAM_AREAS[number % len(EXAM_AREAS)],
+                # 正取、備取N、未錄取
+                'status': ('正取', f'備取{rank}', '未錄取')[number % 3],
+                'rank': str(rank),
+                'admitted': number % 5 == 0,
+            })
+        return students
+
+    def pages(self) -> Iterator[str]:
+        yield '/'
+        for method in self.spec.methods:
+            for year in self.spec.years:
+                listings = [(False, f'/{method}/university_list{year}.html')]
+                if method == 'cross':
+                    listings.append((True, f'/cross/tech_university_list{year}.html'))
+                for tech, path in listings:
+                    yield path
+                    for school_code, _ in self.schools(method, tech):
+                        yield f'/{method}/university_{"1" if tech else ""}{school_code}_{year}.html'
+                        for department_id, _ in self.departments(school_code):
+                            yield self.check_href(method, department_id, year, tech, absolute=True)
+
+    def check_href(self, method: str, department_id: str, year: str, tech: bool = False, absolute: bool = False) -> str:
+        if tech:
+            href = f'check_1{department_id}_NO_1_{year}_1_1.html'
+        else:
+            href = f'check_{department_id}' + CHECK_SUFFIX[method].format(year=year) + '.html'
+        return f'/{method}/{href}' if absolute else href
+
+    # 頁面
+    def render(self, path: str) -> Optional[str]:
+        for pattern, name in _routes:
+            match = pattern.match(path)
+            if match:
+                return getattr(self, f'_{name}')(*match.groups())
+        return None
+
+    def _page(self, body: str) -> str:
+        return f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>mock</title></head><body>{body}</body></html>'
+
+    def _home(self) -> str:
+        items = ''.join(
+            f'<li><a href="/{method}/">{METHOD_NAMES[method]}</a><ul>'
+            + ''.join(f'<li><a href="/{method}/university_list{year}.html">{year}學年度</a></li>' for year in self.spec.years)
+            + '</ul></li>'
+            for method in self.spec.methods)
+        return self._page(f'<ul class="navigation">{items}</ul>')
+
+    def _tech_university_list(self, year: str) -> Optional[str]:
+        return self._listing('cross', year, True)
+
+    def _university_list(self, method: str, year: str) -> Optional[str]:
+        return self._listing(method, year, False)
+
+    def _listing(self, method: str, year: str, tech: bool) -> Optional[str]:
+        if method not in self.spec.methods or year not in self.spec.years:
+            return None
+        cells = [
+            f'<td><div>全部放榜</div><div></div><div id="releasedate">7/1</div></td>'
+            f'<td><a href="university_{"1" if tech else ""}{code}_{year}.html">{code} {name}</a></td>'
+            for code, name in self.schools(method, tech)]
+        # 每列兩所學校
+        rows = ''.join(f'<tr>{"".join(cells[index:index + 2])}</tr>' for index in range(0, len(cells), 2))
+        return self._page(f'<table id="table1">{rows}</table>')
+
+    def _department_list(self, method: str, school_path: str, year: str) -> Optional[str]:
+        if method not in self.spec.methods or year not in self.spec.years:
+            return None
+        tech = method == 'cross' and len(school_path) == 4 and school_path.startswith('1')
+        school = self.school(method, school_path[1:] if tech else school_path)
+        if school is None or school[2] != tech:
+            return None
+        rows = []
+        for index, (department_id, department_name) in enumerate(self.departments(school[0])):
+            href = self.check_href(method, department_id, year, tech)
+            values = self._department_values(method, index)
+            if method in ('exam', 'star'):
+                cell = '<div id="university_dep_row_height">{}</div>'
+                rows.append('<tr><td>' + ''.join(cell.format(value) for value in [
+                    f'({department_id})', department_name, f'<a href="{href}">榜單</a>',
+                    values['average_score'], f'<img title="{values["weight"]}" src="/weight.png"/>',
+                ]) + '</td></tr>')
+            else:
+                last = {'cross': '已放榜', 'vtech': values['group'], 'techreg': values['average_score']}[method]
+                cell = '<td id="university_dep_row_height">{}</td>'
+                rows.append('<tr>' + ''.join(cell.format(value) for value in [
+                    f'({department_id})', department_name, f'<a href="{href}">榜單</a>', values['group'], last,
+                ]) + '</tr>')
+        return self._page(f'<table id="table1">{"".join(rows)}</table>')
+
+    def _department_values(self, method: str, index: int) -> Dict[str, str]:
+        return {
+            'average_score': f'{400 + index * 3.17:.2f}',
+            'weight': '國文x1.00 英文x1.25 數學Ax1.50',
+            'group': GROUPS[index % len(GROUPS)],
+        }
+
+    def _admission(self, method: str, department_path: str, year: str) -> Optional[str]:
+        if method not in self.spec.methods or year not in self.spec.years:
+            return None
+        tech = method == 'cross' and len(department_path) == 7
+        department_id = department_path[1:] if tech else department_path
+        school = self.school(method, department_id[:3])
+        if school is None or school[2] != tech:
+            return None
+        departments = dict(self.departments(school[0]))
+        if department_id not in departments:
+            return None
+        school_name, department_name = school[1], departments[department_id]
+        students = self.students(method, year, department_id)
+        renderer = getattr(self, f'_{method}_admission')
+        return self._page(f'<div id="mainContent">{renderer(school[0], school_name, department_id, department_name, students)}</div>')
+
+    def _exam_admission(self, school_code, school_name, department_id, department_name, students) -> str:
+        info = ''.join(f'<tr><td>{label}</td><td>{value}</td></tr>' for label, value in [
+            ('項目', '內容'), ('加權', '國文x1.00 英文x1.25'), ('一般生', '412.35 國>英>數'),
+            ('原住民', '350.10'), ('退伍軍人', '--'), ('僑生', '--'),
+        ])
+        rows = ''.join(
+            f'<tr><td>{index + 1}</td><td></td><td>{student["ticket"]} {student["exam_area"]}</td>'
+            f'<td>{student["name"]}</td><td>{school_name} {department_name}</td></tr>'
+            for index, student in enumerate(students))
+        return f'<table>{info}</table><table>{rows}</table>'
+
+    def _star_admission(self, school_code, school_name, department_id, department_name, students) -> str:
+        rows = ''.join(
+            f'<tr><td>{index + 1}</td><td></td><td>{student["ticket"]} {student["exam_area"]}</td>'
+            f'<td>{student["name"]}</td><td>{school_name} {department_name}</td></tr>'
+            for index, student in enumerate(students))
+        return f'<table>{rows}</table>'
+
+    def _techreg_admission(self, school_code, school_name, department_id, department_name, students) -> str:
+        info = ''.join(f'<tr><td>{label}</td><td>{value}</td><td></td><td></td></tr>' for label, value in [
+            ('身分', '最低分數'), ('一般生', '612.50'), ('原住民', '580.00'), ('退伍軍人', '--'), ('僑生', '--'),
+        ])
+        rows = ''.join(
+            f'<tr><td>{index + 1}</td><td></td><td>{student["ticket"]} {student["name"].replace("*", "O")}</td></tr>'
+            for index, student in enumerate(students))
+        return f'<table>{info}</table><table>{rows}</table>'
+
+    def _cross_admission(self, school_code, school_name, department_id, department_name, students) -> str:
+        return self._apply_admission(school_code, school_name, department_id, department_name, students, True)
+
+    def _vtech_admission(self, school_code, school_name, department_id, department_name, students) -> str:
+        return self._apply_admission(school_code, school_name, department_id, department_name, students, False)
+
+    def _apply_admission(self, school_code, school_name, department_id, department_name, students, exam_area: bool) -> str:
+        # 其他申請的校系 (未錄取)，讓每位上榜人的錄取情況有多列
+        others = [name for code, name in self.departments(school_code) if code != department_id][:1]
+        rows = []
+        for index, student in enumerate(students):
+            ticket = f'<img src="{glyph(student["ticket"])}"/>' + (f'<a>考區:{student["exam_area"]}</a>' if exam_area else '')
+            first, last = student['name'].split('*')
+            name = f'<img src="{glyph(first)}"/>*<img src="{glyph(last)}"/>'
+            statuses = [self._status_row(school_name, department_name, student)]
+            statuses += [self._status_row(school_name, other, dict(student, status='未錄取', admitted=False)) for other in others]
+            rows.append(f'<tr><td>{index + 1}</td><td></td><td>{ticket}</td><td>{name}</td>'
+                        f'<td><table>{"".join(statuses)}</table></td></tr>')
+        return f'<table>{"".join(rows)}</table>'
+
+    def _status_row(self, school_name: str, department_name: str, student: Dict) -> str:
+        admitted = '<img title="分發錄取" src="/admitted.png"/>' if student['admitted'] else ''
+        if student['status'] == '正取':
+            status = f'<div class="leftred"><img src="{glyph("")}"/></div>'
+        elif student['status'] == '未錄取':
+            status = f'<div class=""><img src="{glyph("")}"/></div>'
+        else:
+            status = f'<div class="leftgreen"><img src="{glyph(student["rank"], offset=45)}"/></div>'
+        return (f'<tr><td>{admitted}</td><td><a>{school_name} {department_name}</a></td>'
+                f'<td>{status}<div class="retestdate"></div></td></tr>')
+
+    # OCR 快取
+    def ocr_departments(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        榜單需要 OCR 的科系 (入學管道, 學年度, 科系代碼)
+        """
+        for method in ('cross', 'vtech'):
+            if method not in self.spec.methods:
+                continue
+            for year in self.spec.years:
+                for tech in ((False, True) if method == 'cross' else (False,)):
+                    for school_code, _ in self.schools(method, tech):
+                        for department_id, _ in self.departments(school_code):
+                            yield method, year, department_id
+
+    def ocr_seed(self, departments: Optional[Iterable[Tuple[str, str, str]]] = None) -> Dict[str, str]:
+        """
+        依照解析器處理圖片的方式 (webparser.submit_name_ocr、submit_school_status_ocr) 計算每張圖片的 OCR 快取 key，
+        departments 只計算指定科系的准考證號碼圖片 (預設為全部科系)
+        """
+        from scrapers.ocr import OCR, crop_image_by_x_axis, dilate, put_center, replace_transparent_background
+        ocr = OCR()
+        seed: Dict[str, str] = {}
+        for method, year, department_id in (self.ocr_departments() if departments is None else departments):
+            for student in self.students(method, year, department_id):
+                seed[ocr.cache_key(glyph(student['ticket']))] = student['ticket']
+        for char in NAME_CHARS:
+            image = dilate(put_center(glyph(char), (255, 255, 255), scale=2), kernel=(2, 2), iterations=2)
+            seed[ocr.cache_key(image)] = char
+        for rank in range(1, 41):
+            image = replace_transparent_background(crop_image_by_x_axis(glyph(str(rank), offset=45), start_x=45))
+            seed[ocr.cache_key(image)] = str(rank)
+        return seed
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+
+"""
+啟動時間
+
+以新的 process 多次執行各情境 (e.g. `main.py --version`)，量測耗時 (包含直譯器啟動) 與最大 RSS，
+並列出結束時已經載入的重量級相依套件，確認用不到的套件 (cv2、pytesseract 等) 沒有在啟動時載入。
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('sqlalchemy', 'bs4', 'lxml', 'cloudscraper', 'requests', 'PIL', 'numpy', 'cv2', 'pytesseract', 'pyarrow')
+# (情境名稱, 執行的程式碼)
+SCENARIOS: Tuple[Tuple[str, str], ...] = (
+    ('python', 'pass'),
+    ('version', "sys.argv = ['main.py', '--version']; runpy.run_path('main.py', run_name='__main__')"),
+    ('import main', 'import main'),
+    ('techreg crawl', "import main; main.needs_ocr('techreg'); from scrapers import Scraper"),
+    # 學測查榜、統測甄選第一次辨識時才載入 cv2、numpy、pytesseract
+    ('cross crawl', "import main; main.needs_ocr('cross'); from scrapers import Scraper; from scrapers.ocr import dilate, set_tesseract_cmd; "
+                    "from PIL import Image; set_tesseract_cmd('tesseract'); dilate(Image.new('RGB', (4, 4)))"),
+)
+
+# 在子 process 結束時輸出已載入的套件與最大 RSS
+# (Linux 使用 /proc 的 VmHWM，fork 之後 exec 會重新計算；ru_maxrss 會包含 fork 前父 process 的用量)
+_PROBE = '''
+import sys, json, atexit, runpy
+def _report():
+    rss = None
+    try:
+        with open('/proc/self/status') as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:
+            pass
+    heavy = [name for name in {heavy!r} if name in sys.modules]
+    sys.__stderr__.write('\\n@startup ' + json.dumps({{'rss_kb': rss, 'modules': heavy}}) + '\\n')
+atexit.register(_report)
+{code}
+'''
+
+def measure(code: str, repeat: int) -> Dict:
+    times: List[float] = []
+    probe = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', _PROBE.format(heavy=HEAVY_MODULES, code=code)],
+                                cwd=ROOT, capture_output=True, text=True, encoding='utf-8')
+        times.append(time.perf_counter() - start)
+        lines = [line for line in result.stderr.splitlines() if line.startswith('@startup ')]
+        if not lines:
+            raise RuntimeError(f'startup scenario failed: {code}\n{result.stderr}')
+        probe = json.loads(lines[-1][len('@startup '):])
+    return {
+        'min_ms': round(min(times) * 1000, 1),
+        'median_ms': round(statistics.median(times) * 1000, 1),
+        'rss_mib': round(probe['rss_kb'] / 1024, 1) if probe.get('rss_kb') else None,
+        'modules': probe['modules'],
+    }
+
+def run_startup(repeat: int = 5) -> Dict[str, Dict]:
+    return {name: measure(code, repeat) for name, code in SCENARIOS}
+
+def format_startup(report: Dict[str, Dict]) -> str:
+    lines = [f'{"scenario":<14} {"min(ms)":>9} {"median(ms)":>11} {"rss(MiB)":>9}  loaded modules']
+    for name, row in report.items():
+        rss = f'{row["rss_mib"]:>9.1f}' if row['rss_mib'] is not None else f'{"-":>9}'
+        lines.append(f'{name:<14} {row["min_ms"]:>9.1f} {row["median_ms"]:>11.1f} {rss}  {", ".join(row["modules"]) or "-"}')
+    return '\n'.join(lines)
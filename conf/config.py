@@ -1,5 +1,6 @@
 import yaml
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, validator
 
 
@@ -20,12 +21,55 @@ class DBConfig(BaseModel):
     charset: str = 'utf8mb4'
     # 資料庫連線檔案路徑(僅適用於sqlite)
     db_file: str = 'db.sqlite3'
+    # 連線池大小
+    pool_size: int = 5
+    # 連線池滿時最多可額外建立的連線數
+    max_overflow: int = 10
+    # 取出連線前先確認連線是否可用
+    pool_pre_ping: bool = True
+    # 連線使用超過幾秒後重新建立 (避免被資料庫端的 idle timeout 中斷)
+    pool_recycle: int = 3600
+    # 等待可用連線的秒數上限
+    pool_timeout: int = 30
+    # 取得連線等待超過幾毫秒寫入 log
+    pool_slow_checkout_ms: int = 100
+    # sqlite 效能設定檔，為下列值之一: safe, fast, bulk (僅適用於sqlite)
+    sqlite_profile: str = 'fast'
+    # 覆寫效能設定檔中的個別 PRAGMA (未設定代表使用設定檔的值，僅適用於sqlite)
+    # journal mode (e.g. WAL, DELETE, MEMORY)
+    journal_mode: Optional[str] = None
+    # 同步等級 (OFF, NORMAL, FULL)
+    synchronous: Optional[str] = None
+    # 快取頁數，負數代表 KiB
+    cache_size: Optional[int] = None
+    # mmap 大小 (bytes)
+    mmap_size: Optional[int] = None
+    # 暫存資料位置 (DEFAULT, FILE, MEMORY)
+    temp_store: Optional[str] = None
+    # 資料庫被鎖定時的等待時間 (毫秒)
+    busy_timeout: Optional[int] = None
     
     @validator('type')
     def check_type(cls, v):
         if v not in ['mysql', 'sqlite', 'postgresql', 'mssql']:
             raise ValueError('type must be one of: mysql, sqlite, postgresql, mssql')
         return v
+    
+    @validator('sqlite_profile')
+    def check_sqlite_profile(cls, v):
+        if v not in ['safe', 'fast', 'bulk']:
+            raise ValueError('sqlite_profile must be one of: safe, fast, bulk')
+        return v
+    
+    def sqlite_overrides(self) -> Dict[str, Any]:
+        return {
+            'journal_mode': self.journal_mode,
+            'synchronous': self.synchronous,
+            'cache_size': self.cache_size,
+            'mmap_size': self.mmap_size,
+            'temp_store': self.temp_store,
+            'busy_timeout': self.busy_timeout,
+        }
 
 class FlareSolverrConfig(BaseModel):
     # flaresolverr 服務網址
@@ -36,6 +80,10 @@ class FlareSolverrConfig(BaseModel):
     retry: int = 5
     # retry 延遲時間(秒)
     delay: int = 5
+    # 每個 worker 的 session 保留連線的主機數量
+    pool_connections: int = 10
+    # 每個主機保留的連線數量
+    pool_maxsize: int = 10
     
 class LogConfig(BaseModel):
     # 日誌等級
@@ -50,12 +98,121 @@ class OcrConfig(BaseModel):
     pytesseract_path: str = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
     # ocr cache path
     cache_path: str = 'ocr_cache.json'
+    # OCR 服務的 worker process 數量 (0 代表不啟用，直接在解析時辨識)
+    workers: int = 4
+    # 感知雜湊快取的漢明距離門檻 (負數代表停用第二層快取)
+    perceptual_threshold: int = 2
+
+class ScrapeConfig(BaseModel):
+    # 網站根網址 (壓力測試時指向本機的模擬網站)
+    base_url: str = 'https://www.com.tw/'
+    # 各入學管道要解析的欄位 (e.g. cross: [ticket, schools, status])，未設定代表全部解析
+    # 未要求的昂貴欄位 (姓名字形 OCR、二階甄試狀態圖片 OCR) 會直接略過
+    fields: Dict[str, List[str]] = {}
+    
+    @validator('base_url')
+    def check_base_url(cls, v):
+        # 爬蟲直接在後面接上路徑
+        return v if v.endswith('/') else v + '/'
+    
+    @validator('fields')
+    def check_fields(cls, v):
+        # 拼錯的欄位名稱會讓可以略過的欄位全部被略過，未知的入學管道、欄位名稱直接報錯
+        if v:
+            from scrapers.crawlers import check_fields
+            check_fields(v)
+        return v
+
+class WriterConfig(BaseModel):
+    # 是否啟用背景寫入執行緒 (停用時每個科系各自 commit)
+    enabled: bool = True
+    # 佇列上限 (科系數)，佇列滿時爬蟲會等待寫入
+    queue_size: int = 64
+    # 累積多少筆資料就 commit
+    batch_rows: int = 5000
+    # 距離上次 commit 最多幾秒
+    flush_interval: float = 5.0
+
+class SinkConfig(BaseModel):
+    # 爬取結果的輸出，可同時啟用多個: sql (資料庫), ndjson, csv
+    targets: List[str] = ['sql']
+    # ndjson / csv 的輸出檔案路徑 (會依格式加上 .ndjson.gz、.csv.gz 副檔名)
+    path: str = 'results'
+    # 是否以 gzip 壓縮
+    compress: bool = True
+    # 每寫入幾個科系 flush 一次
+    flush_records: int = 100
+    # 距離上次 flush 最多幾秒
+    flush_interval: float = 5.0
+    
+    @validator('targets')
+    def check_targets(cls, v):
+        for target in v:
+            if target not in ['sql', 'ndjson', 'csv']:
+                raise ValueError('targets must be some of: sql, ndjson, csv')
+        if len(set(v)) != len(v):
+            raise ValueError('targets must not contain duplicates')
+        return v
+
+class ChangefeedConfig(BaseModel):
+    # 是否在寫入資料庫時輸出榜單變動事件 (需要啟用 sql 輸出)
+    enabled: bool = False
+    # 事件檔案路徑 (NDJSON，只附加)
+    path: str = 'changes.ndjson'
+    # 每次 commit 寫入事件後是否 fsync (較安全但較慢)
+    fsync: bool = False
+
+class WatchConfig(BaseModel):
+    # 最短輪詢間隔 (秒)，有學校放榜時回到此間隔
+    min_interval: float = 5.0
+    # 最長輪詢間隔 (秒)
+    max_interval: float = 60.0
+    # 沒有學校放榜時，輪詢間隔乘上的倍數
+    backoff: float = 1.5
+    # 同時爬取的學校數
+    workers: int = 4
+    # 啟動時是否爬取已經放榜的學校 (否則只記錄目前的放榜狀態)
+    initial_crawl: bool = False
+
+class ApiConfig(BaseModel):
+    # 准考證號碼查詢服務的監聽位址
+    host: str = '127.0.0.1'
+    # 監聽埠號
+    port: int = 8080
+    # LRU 快取的准考證號碼數量 (0 代表不快取)
+    cache_size: int = 10000
+    # 快取存活秒數，超過後重新查詢資料庫
+    cache_ttl: float = 300.0
+
+class MetricsConfig(BaseModel):
+    # 是否啟動 Prometheus 指標輸出 (GET /metrics)
+    enabled: bool = False
+    # 監聽位址
+    host: str = '127.0.0.1'
+    # 監聽埠號
+    port: int = 9108
+
+class PlanConfig(BaseModel):
+    # 每個入學管道、學年度抽樣解析的榜單頁數 (用來預估 OCR 數量與寫入筆數)
+    sample_pages: int = 3
+    # 每個請求的預估秒數 (未設定代表使用規劃時實際量到的平均)
+    request_seconds: Optional[float] = None
+    # tesseract 辨識一張圖片的預估秒數 (有多個 OCR worker 時會平分)
+    ocr_seconds: float = 0.3
 
 class AppConfig(BaseModel):
     flaresolverr: FlareSolverrConfig = FlareSolverrConfig()
     database: DBConfig = DBConfig()
     logger: LogConfig = LogConfig()
     ocr: OcrConfig = OcrConfig()
+    scrape: ScrapeConfig = ScrapeConfig()
+    writer: WriterConfig = WriterConfig()
+    sink: SinkConfig = SinkConfig()
+    changefeed: ChangefeedConfig = ChangefeedConfig()
+    watch: WatchConfig = WatchConfig()
+    api: ApiConfig = ApiConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    plan: PlanConfig = PlanConfig()
     
     @staticmethod
     def save(cfg, path: str = 'config.yaml'):
@@ -1,23 +1,75 @@
 import os
+import sys
+import json
 import shutil
-import pytesseract
 import logging
 import argparse
-from sqlalchemy.engine import URL
-from sqlalchemy import create_engine
 from pydantic import ValidationError
-from orm import Base
 from conf import AppConfig
-from scrapers import Scraper
-from scrapers.ocr import OCR
+from conf.config import SinkConfig
+from scrapers.metrics import Metrics
+from scrapers.profiling import STAGES, Spans
+from scrapers.ocr_cache import MERGE_STRATEGIES, export_cache, merge_caches, read_cache_file
+# 資料庫、爬蟲、OCR 相關的模組 (sqlalchemy、bs4、cloudscraper、cv2、pytesseract) 載入很慢，
+# 各指令在需要時才載入，`--version`、`--changes` 等指令不需要載入
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-c', '--config_file', type=str, default='config.yaml', help='config file path')
 parser.add_argument('-m', '--method', type=str, default=None, help='scrape method')
 parser.add_argument('-y', '--year', type=str, default=None, help='scrape year')
+parser.add_argument('-f', '--fields', type=str, default=None, help='comma separated fields to parse, e.g. ticket,schools,status (applies to --method, or every method when omitted)')
+parser.add_argument('-s', '--sinks', type=str, default=None, help='comma separated result sinks: sql, ndjson, csv (overrides sink.targets in the config file)')
+parser.add_argument('--backfill', action='store_true', help='bulk backfill: stage admission persons in an unindexed table and merge them at the end')
+parser.add_argument('--backfill-scores', action='store_true', help='recompute numeric score columns of existing admission lists from the raw strings')
+parser.add_argument('--export-parquet', type=str, default=None, metavar='DIR', help='export admission data as Parquet partitioned by method and year (only changed partitions, requires pyarrow)')
+parser.add_argument('--export-full', action='store_true', help='with --export-parquet, rewrite every partition instead of only the changed ones')
+parser.add_argument('--watch', action='store_true', help='release day watch mode: poll the university lists of the current year and crawl schools as soon as they release (-m / -y restrict the method and year)')
+parser.add_argument('--changes', type=int, nargs='?', const=0, default=None, metavar='CURSOR', help='follow the change event log from a byte offset (default: the beginning) and print events as NDJSON')
+parser.add_argument('--plan', action='store_true', help='dry run: fetch only the university and department lists, sample admission pages and print the crawl plan (frontier, requests, OCR volume, rows, time) as JSON (-m / -y restrict the method and year)')
+parser.add_argument('--serve', action='store_true', help='serve the ticket lookup HTTP/JSON API (GET /tickets/<ticket>, GET /stats)')
+parser.add_argument('--profile', type=str, default=None, choices=STAGES, help='sample cProfile for one stage of the crawl (fetch, parse, ocr, enqueue, save) and write the results to --profile-dir')
+parser.add_argument('--profile-dir', type=str, default='profile', metavar='DIR', help='output directory of --profile')
+parser.add_argument('--profile-rate', type=int, default=10, metavar='N', help='with --profile, profile one of every N spans of the stage')
+parser.add_argument('--profile-memory', action='store_true', help='with --profile, also take tracemalloc snapshots of the sampled spans')
 parser.add_argument('-v', '--version', action='version', version='Admission Scrapers 1.0.0')
+parser.add_argument('--ocr-export', type=str, default=None, metavar='FILE', help='export OCR cache to a compact versioned file')
+parser.add_argument('--ocr-import', type=str, nargs='+', default=None, metavar='FILE', help='merge exported OCR caches into the local OCR cache')
+parser.add_argument('--ocr-merge', type=str, nargs='+', default=None, metavar='FILE', help='merge exported OCR caches into the file given by --ocr-export')
+parser.add_argument('--ocr-strategy', type=str, default='majority', choices=MERGE_STRATEGIES, help='conflict resolution when merging OCR caches')
+
+def needs_ocr(scrape_method: str = None) -> bool:
+    # 只有學測查榜、統測甄選的榜單需要 OCR (未指定入學管道時會爬取全部)
+    from scrapers.crawlers import Crawler
+    return any(crawler.uses_ocr for crawler in Crawler.__subclasses__() if scrape_method in (None, crawler.method))
+
+def apply_fields(config: AppConfig, fields: str = None, scrape_method: str = None):
+    # 命令列指定的欄位 (-f) 覆蓋設定檔，未指定入學管道時套用到全部 (各入學管道只取它有的欄位)
+    from scrapers.crawlers import field_names
+    if not fields:
+        return
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    known = field_names()
+    if scrape_method not in (None, *known):
+        parser.error(f'unknown method: {scrape_method}')
+    methods = {method: names for method, names in known.items() if scrape_method in (None, method)}
+    unknown = [field for field in fields if not any(field in names for names in methods.values())]
+    if unknown:
+        expected = sorted({name for names in methods.values() for name in names})
+        parser.error(f'unknown --fields: {", ".join(unknown)} (expected: {", ".join(expected)})')
+    for method, names in methods.items():
+        selected = [field for field in fields if field in names]
+        if selected:
+            config.scrape.fields[method] = selected
+
+def init(config_path: str, backfill: bool = False, ocr: bool = True, sinks: str = None, writer: bool = True):
+    from sqlalchemy.engine import URL
+    from sqlalchemy import create_engine
+    from orm.migrate import migrate
+    from orm.engine import TimedQueuePool, apply_sqlite_profile, executemany_options
+    from scrapers.ocr import OCR, set_tesseract_cmd
+    from scrapers.ocr_service import OCRService
+    from scrapers.writer import BatchWriter
 
-def init(config_path: str):
     def init_config(config_path: str) -> AppConfig:
         try:
             return AppConfig.load(config_path)
@@ -55,14 +107,34 @@ def init(config_path: str):
                 query={'charset': config.database.charset}
             )
         # create engine
-        engine = create_engine(build_connection_string(), echo=False)
+        db_config = config.database
+        options = dict(
+            echo=False,
+            poolclass=TimedQueuePool,
+            pool_size=db_config.pool_size,
+            max_overflow=db_config.max_overflow,
+            pool_pre_ping=db_config.pool_pre_ping,
+            pool_recycle=db_config.pool_recycle,
+            pool_timeout=db_config.pool_timeout,
+            **executemany_options(db_config.type),
+        )
+        if db_config.type == 'sqlite':
+            # sqlite 預設每次都建立新連線 (NullPool)，PRAGMA 與頁面快取無法延續，改用連線池
+            options['connect_args'] = {'check_same_thread': False}
+        engine = create_engine(build_connection_string(), **options)
+        engine.pool.slow_checkout = db_config.pool_slow_checkout_ms / 1000
+        if db_config.type == 'sqlite':
+            apply_sqlite_profile(engine, db_config.sqlite_profile, db_config.sqlite_overrides())
         # migrate database schema
-        Base.metadata.create_all(engine)
+        migrate(engine)
+        # 啟動背景寫入執行緒 (多個科系合併成一個 transaction)，不寫入資料庫或只讀取資料庫的指令不需要
+        if writer and config.writer.enabled and 'sql' in config.sink.targets:
+            BatchWriter().start(engine, config.writer.queue_size, config.writer.batch_rows, config.writer.flush_interval)
         return engine
     
     def init_ocr_engine(config: AppConfig):
         # 初始化 OCR 引擎 (使用 Tesseract)
-        pytesseract.pytesseract.tesseract_cmd = config.ocr.pytesseract_path
+        set_tesseract_cmd(config.ocr.pytesseract_path)
         # 複製 Tesseract 訓練資料到指定路徑
         pytesseract_dir = os.path.dirname(config.ocr.pytesseract_path)
         tessdata_path = os.path.join(pytesseract_dir, 'tessdata', 'chi_tra_mjh.traineddata')
@@ -76,24 +148,202 @@ def init(config_path: str):
                 shutil.copy(resources_file, tessdata_path)
             except PermissionError:
                 raise PermissionError('Please run as administrator!')
-        # OCR Cache 路徑
-        OCR().load_cache(config.ocr.cache_path)
+        # OCR Cache 路徑 (第一次查詢時才載入)
+        OCR().configure(config.ocr.cache_path, config.ocr.perceptual_threshold)
+        # OCR 服務 (多個 worker process 平行辨識)，第一次快取沒有命中時才啟動
+        OCRService().configure(config.ocr.workers, config.ocr.pytesseract_path)
         
     config = init_config(config_path)
-    init_ocr_engine(config)
-    return config, init_logger(config), init_db(config)
+    if sinks:
+        # 命令列指定的輸出覆蓋設定檔
+        try:
+            config.sink = SinkConfig(**dict(config.sink.dict(), targets=[sink.strip() for sink in sinks.split(',') if sink.strip()]))
+        except ValidationError as e:
+            parser.error(f'invalid --sinks: {e}')
+    if backfill and 'sql' not in config.sink.targets:
+        parser.error('--backfill requires the sql sink')
+    if backfill and config.database.type == 'sqlite':
+        # 回填時使用 bulk 設定檔，結束時恢復
+        config.database.sqlite_profile = 'bulk'
+    if ocr:
+        init_ocr_engine(config)
+    logger = init_logger(config)
+    if config.metrics.enabled:
+        # Prometheus 指標輸出 (背景執行緒)
+        Metrics().start(config.metrics.host, config.metrics.port)
+    return config, logger, init_db(config)
 
-def app_exit(config: AppConfig):
-    # 保存 OCR Cache 
-    OCR().save_cache(config.ocr.cache_path)
+def app_exit(config: AppConfig, db=None):
+    from orm.engine import restore_sqlite_profile
+    from scrapers.ocr import OCR
+    from scrapers.ocr_service import OCRService
+    from scrapers.writer import BatchWriter
+    # 寫入剩餘的資料
+    BatchWriter().shutdown()
+    if db is not None:
+        logging.getLogger('main').info(f'資料庫連線池統計: {db.pool.stats()}')
+        # 恢復 sqlite bulk 設定檔放寬的設定
+        restore_sqlite_profile(db, config.database.sqlite_profile)
+    # 等待 OCR 服務處理完畢
+    OCRService().shutdown()
+    # 保存 OCR Cache (沒有使用 OCR 時快取檔不會載入，也不需要寫回)
+    if OCR().loaded:
+        logging.getLogger('main').info(f'OCR 快取命中統計: {OCR().stats()}')
+        OCR().save_cache(config.ocr.cache_path)
+    Metrics().shutdown()
+    # 各階段耗時統計 (與效能分析結果)
+    Spans().finish()
+    
+def ocr_cache_command(config_path, arg):
+    # OCR 快取匯出、匯入、合併 (不需要初始化資料庫與 OCR 引擎)
+    from scrapers.ocr import OCR
+    config = AppConfig.load(config_path)
+    ocr = OCR()
+    ocr.load_cache(config.ocr.cache_path)
+    
+    if arg.ocr_merge:
+        if not arg.ocr_export:
+            parser.error('--ocr-merge requires --ocr-export as output file')
+        if arg.ocr_import:
+            # 合併只寫入輸出檔，不會修改本機快取，兩者不能同時使用
+            parser.error('--ocr-merge cannot be combined with --ocr-import')
+        merged, conflicts = merge_caches([read_cache_file(path) for path in arg.ocr_merge], arg.ocr_strategy)
+        export_cache(merged, arg.ocr_export)
+        print(f'已合併 {len(arg.ocr_merge)} 份 OCR 快取至 {arg.ocr_export}，共 {len(merged["exact"])} 筆，衝突 {conflicts} 筆')
+        return
     
-def main(config_path, scrape_method, scrape_year):
-    cfg, logger, db = init(config_path)
+    if arg.ocr_import:
+        sources = [ocr.dump_cache()] + [read_cache_file(path) for path in arg.ocr_import]
+        merged, conflicts = merge_caches(sources, arg.ocr_strategy)
+        ocr.restore_cache(merged)
+        ocr.save_cache(config.ocr.cache_path)
+        print(f'已匯入 {len(arg.ocr_import)} 份 OCR 快取，共 {len(merged["exact"])} 筆，衝突 {conflicts} 筆')
+    
+    if arg.ocr_export:
+        export_cache(ocr.dump_cache(), arg.ocr_export)
+        print(f'已匯出 OCR 快取至 {arg.ocr_export}，共 {len(ocr.cache)} 筆')
+    
+def scores_command(config_path):
+    # 重新計算既有榜單的分數數值欄位 (不需要初始化 OCR 引擎)
+    from orm.scores import backfill_scores
+    cfg, logger, db = init(config_path, ocr=False, writer=False)
+    with db.begin() as conn:
+        updated = backfill_scores(conn)
+    logger.info(f'分數數值欄位回填完成，共更新 {updated} 筆榜單')
+
+def export_command(config_path, output, method=None, year=None, full=False):
+    # 匯出 Parquet 分區 (不需要初始化 OCR 引擎)，-m / -y 可只匯出指定的錄取方式、學年度
+    from orm.export import export_parquet
+    from scrapers.crawlers import Crawler
+    cfg, logger, db = init(config_path, ocr=False, writer=False)
+    method_names = {crawler.method: crawler.method_name for crawler in Crawler.__subclasses__()}
+    if method and method not in method_names:
+        parser.error(f'unknown method: {method}')
+    stats = export_parquet(db, output, method_names.get(method), int(year) if year else None, full)
+    logger.info(f'Parquet 匯出統計: {stats}')
+
+def watch_command(config_path, scrape_method=None, scrape_year=None, fields=None, sinks=None):
+    from scrapers import Scraper
+    from scrapers.watch import Watcher
+    cfg, logger, db = init(config_path, ocr=needs_ocr(scrape_method), sinks=sinks)
+    apply_fields(cfg, fields, scrape_method)
+    scraper = Scraper(cfg, db)
+    try:
+        methods = [scrape_method] if scrape_method else list(scraper.crawlers)
+        if scrape_method not in (None, *scraper.crawlers):
+            parser.error(f'unknown method: {scrape_method}')
+        if scrape_year:
+            years = {method: scrape_year for method in methods}
+        else:
+            # 未指定學年度時監看各入學管道最新的學年度
+            available = {current.method: current.available_years for current in scraper.fetch_available_years() or []}
+            years = {method: max(available[method], key=int) for method in methods if available.get(method)}
+        Watcher({method: scraper.crawlers[method] for method in years}, years, cfg.watch).run()
+    finally:
+        app_exit(cfg, db)
+        scraper.close()
+
+def changes_command(config_path, cursor=0):
+    # 持續輸出變動事件 (不需要初始化資料庫)，每筆事件附上讀取下一筆的 cursor
+    from orm.changefeed import follow_changes
+    config = AppConfig.load(config_path)
+    try:
+        for item, cursor in follow_changes(config.changefeed.path, cursor):
+            print(json.dumps(dict(item, cursor=cursor), ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        print(f'下次由 --changes {cursor} 繼續讀取', file=sys.stderr)
+
+def plan_command(config_path, scrape_method=None, scrape_year=None, fields=None):
+    # 爬取計畫 (不需要初始化資料庫、不呼叫 tesseract)，計畫以 JSON 輸出到 stdout，log 輸出到 stderr
+    from scrapers.crawlers import Crawler
+    from scrapers.ocr import OCR
+    from scrapers.plan import Planner
+    config = AppConfig.load(config_path)
+    logging.basicConfig(level=config.logger.level, format=config.logger.format)
+    # 未要求的 OCR 欄位不會送出辨識，預估的 OCR 數量也會跟著改變
+    apply_fields(config, fields, scrape_method)
+    crawlers = {crawler.method: crawler(config, None) for crawler in Crawler.__subclasses__()}
+    if scrape_method not in (None, *crawlers):
+        parser.error(f'unknown method: {scrape_method}')
+    if needs_ocr(scrape_method):
+        # 以既有的 OCR 快取計算命中率
+        OCR().configure(config.ocr.cache_path, config.ocr.perceptual_threshold)
+    plan = Planner(crawlers, config).plan(scrape_method, scrape_year)
+    json.dump(plan, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+def serve_command(config_path):
+    # 准考證號碼查詢服務 (唯讀，不需要初始化 OCR 引擎與寫入執行緒)
+    from api import TicketService
+    cfg, logger, db = init(config_path, ocr=False, writer=False)
+    TicketService(db, cfg.api.cache_size, cfg.api.cache_ttl).serve(cfg.api.host, cfg.api.port)
+
+def main(config_path, scrape_method, scrape_year, fields=None, backfill=False, sinks=None):
+    from orm.backfill import Backfill
+    from scrapers import Scraper
+    from scrapers.writer import BatchWriter
+    # -m、-y 同時設定時只爬取指定的入學管道
+    cfg, logger, db = init(config_path, backfill, ocr=needs_ocr(scrape_method if scrape_year else None), sinks=sinks)
+    apply_fields(cfg, fields, scrape_method)
     logger.info('initialized configuration, start to scraping data!')
-    crawler = Scraper(cfg, db)
-    crawler.run(scrape_method, scrape_year)
-    app_exit(cfg)
+    loader = None
+    if backfill:
+        loader = Backfill(db)
+        loader.begin()
+    crawler = Scraper(cfg, db, loader)
+    try:
+        crawler.run(scrape_method, scrape_year)
+        if loader:
+            # 等待所有資料寫入暫存表後再合併
+            BatchWriter().shutdown()
+            loader.finish()
+    except BaseException:
+        if loader:
+            BatchWriter().shutdown()
+            loader.abort()
+        raise
+    finally:
+        app_exit(cfg, db)
+        crawler.close()
+        logger.info(f'榜單變動統計: {crawler.change_stats()}')
     
 if __name__ == '__main__':
     arg = parser.parse_args()
-    main(arg.config_file, arg.method, arg.year)
\ No newline at end of file
+    if arg.profile:
+        Spans().enable_profiling(arg.profile, arg.profile_dir, arg.profile_rate, arg.profile_memory)
+    if arg.ocr_export or arg.ocr_import or arg.ocr_merge:
+        ocr_cache_command(arg.config_file, arg)
+    elif arg.backfill_scores:
+        scores_command(arg.config_file)
+    elif arg.watch:
+        watch_command(arg.config_file, arg.method, arg.year, arg.fields, arg.sinks)
+    elif arg.changes is not None:
+        changes_command(arg.config_file, arg.changes)
+    elif arg.plan:
+        plan_command(arg.config_file, arg.method, arg.year, arg.fields)
+    elif arg.serve:
+        serve_command(arg.config_file)
+    elif arg.export_parquet:
+        export_command(arg.config_file, arg.export_parquet, arg.method, arg.year, arg.export_full)
+    else:
+        main(arg.config_file, arg.method, arg.year, arg.fields, arg.backfill, arg.sinks)
\ No newline at end of file
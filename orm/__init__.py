@@ -3,3 +3,4 @@ from .model import AdmissionList
 from .model import AdmissionPerson
 from .model import AdmissionType
 from .model import SchoolDepartment
+from .model import SchemaRevision
@@ -0,0 +1,223 @@
+import io
+import csv
+import time
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Column, Index, Integer, MetaData, Table, bindparam, event, func, insert, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from orm.model import AdmissionList, AdmissionPerson
+from orm.bulk import PERSON_FIELDS, dedup_persons
+
+
+"""
+大量回填 (backfill) 模式
+
+回填所有歷史年度時，上榜人資料先寫入沒有任何索引的暫存表 (各資料庫最快的批次寫入方式:
+SQLite/MySQL 多筆 VALUES 的 INSERT、PostgreSQL COPY、MSSQL fast_executemany)，
+爬取結束後才在暫存表建立索引，並以一個 set-based 的 upsert 合併到正式的 AdmissionPerson。
+榜單的內容指紋與新榜單的變動事件也延後到合併成功後才寫入，
+執行失敗時直接刪除暫存表並捨棄這些指紋與事件，正式資料不受影響，下次爬取會重新寫入這些科系。
+"""
+
+logger = logging.getLogger('backfill')
+
+STAGING_TABLE = 'AdmissionPersonStaging'
+# session.info 中暫存延後項目的 key: (Backfill, [(榜單ID, 指紋, ChangeLog, 事件)])
+_DEFERRED = 'backfill'
+
+_person_table = AdmissionPerson.__table__
+# 暫存表: 與 AdmissionPerson 相同的欄位，加上寫入順序 Seq，不建立任何索引與主鍵
+staging_metadata = MetaData()
+staging_table = Table(
+    STAGING_TABLE, staging_metadata,
+    Column('Seq', Integer, nullable=False),
+    *[Column(column.name, column.type, nullable=column.nullable) for column in _person_table.columns if column.name != 'Id'],
+)
+staging_index = Index('idx_admission_person_staging_key', staging_table.c.AdmissionListId, staging_table.c.AdmissionTicket, staging_table.c.Seq)
+
+# 正式表與暫存表共用的欄位 (Column 名稱)
+PERSON_COLUMNS = ['AdmissionListId'] + [AdmissionPerson.__mapper__.columns[field].name for field in PERSON_FIELDS]
+UPDATE_COLUMNS = [name for name in PERSON_COLUMNS if name not in ('AdmissionListId', 'AdmissionTicket')]
+
+
+class Backfill:
+    """
+    Backfill stages AdmissionPerson rows in an unindexed staging table during the run,
+    then indexes the staging table and merges it into the live table in one transaction.
+
+    Functions:
+        - begin: (re)create the staging table
+        - stage: load rows into the staging table with the backend's fastest bulk path
+        - defer: hold a list's fingerprint and change events until the merge commits
+        - finish: build the staging index, merge into AdmissionPerson, store the deferred fingerprints and drop the staging table
+        - abort: drop the staging table and discard the deferred fingerprints and events, leaving the live table untouched
+    """
+    def __init__(self, db: Engine) -> None:
+        self.db = db
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.staged = 0
+        self.active = False
+        self.started_at = 0.0
+        # 合併成功後才寫入的榜單內容指紋 (榜單ID -> 指紋) 與變動事件
+        self.fingerprints: Dict[int, Optional[str]] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.changelog = None
+
+    def begin(self):
+        # 清除上次中斷留下的暫存表
+        staging_metadata.drop_all(self.db)
+        staging_metadata.create_all(self.db)
+        # create_all 會一併建立索引，回填期間先移除 (合併前才建立)
+        with self.db.begin() as conn:
+            staging_index.drop(conn)
+        self.seq, self.staged = 0, 0
+        self.fingerprints, self.events = {}, []
+        self.active = True
+        self.started_at = time.perf_counter()
+        logger.info(f'回填模式: 上榜人資料先寫入暫存表 {STAGING_TABLE}')
+
+    def stage(self, session: Session, admission_list_id: int, rows: List[Dict[str, Any]]) -> int:
+        persons = dedup_persons(admission_list_id, rows)
+        if not persons:
+            return 0
+        columns = AdmissionPerson.__mapper__.columns
+        with self.lock:
+            start = self.seq
+            self.seq += len(persons)
+            self.staged += len(persons)
+        values = [dict({columns[field].name: row.get(field) for field in PERSON_FIELDS},
+                       Seq=start + index, AdmissionListId=admission_list_id)
+                  for index, row in enumerate(persons.values(), 1)]
+
+        dialect = session.bind.dialect.name
+        if dialect == 'postgresql':
+            self._copy(session.connection(), values)
+        elif dialect in ('sqlite', 'mysql'):
+            # 多筆 VALUES 的 INSERT，每批不超過資料庫的參數上限
+            chunk = max(1, self._max_parameters(dialect) // len(values[0]))
+            for offset in range(0, len(values), chunk):
+                session.execute(insert(staging_table).values(values[offset:offset + chunk]))
+        else:
+            session.execute(insert(staging_table), values)
+        return len(values)
+
+    def defer(self, session: Session, admission_list_id: int, fingerprint: Optional[str], changelog=None, events: Optional[List[Dict[str, Any]]] = None):
+        # 上榜人還在暫存表時不寫入指紋，否則中止後下次爬取會因為指紋相同而略過這個科系
+        # (session commit 成功後才記錄，rollback 的榜單不會留下)
+        _, pending = session.info.setdefault(_DEFERRED, (self, []))
+        pending.append((admission_list_id, fingerprint, changelog, events))
+
+    def _accept(self, items: List[tuple]):
+        with self.lock:
+            for admission_list_id, fingerprint, changelog, events in items:
+                self.fingerprints[admission_list_id] = fingerprint
+                if changelog is not None and events:
+                    self.changelog = changelog
+                    self.events.extend(events)
+
+    def finish(self):
+        if not self.active:
+            return
+        start = time.perf_counter()
+        with self.db.begin() as conn:
+            # 延後到合併前才建立索引
+            staging_index.create(conn)
+            merged = self._merge(conn)
+            if self.fingerprints:
+                table = AdmissionList.__table__
+                conn.execute(update(table).where(table.c.Id == bindparam('list_id')).values(Fingerprint=bindparam('fingerprint')),
+                             [{'list_id': list_id, 'fingerprint': fingerprint} for list_id, fingerprint in self.fingerprints.items()])
+            staging_table.drop(conn)
+        self.active = False
+        # 合併已經 commit，事件對應的上榜人都已寫入
+        if self.changelog is not None:
+            self.changelog.append(self.events)
+        self.fingerprints, self.events = {}, []
+        logger.info(f'回填完成: 暫存 {self.staged} 筆，合併 {merged} 筆上榜資料，'
+                    f'合併耗時 {time.perf_counter() - start:.1f} 秒，總耗時 {time.perf_counter() - self.started_at:.1f} 秒')
+
+    def abort(self):
+        if not self.active:
+            return
+        staging_metadata.drop_all(self.db)
+        self.active = False
+        logger.warning(f'回填中止，已刪除暫存表 (暫存 {self.staged} 筆未合併，捨棄 {len(self.fingerprints)} 個榜單的指紋與 {len(self.events)} 筆事件)')
+        self.fingerprints, self.events = {}, []
+
+    def _max_parameters(self, dialect: str) -> int:
+        if dialect == 'sqlite':
+            # SQLite 3.32 以前每個語句最多 999 個參數
+            return 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+        return 65535
+
+    def _copy(self, connection: Connection, values: List[Dict[str, Any]]):
+        # 以 CSV 格式 COPY 進暫存表，None 以 \N 表示
+        names = ['Seq'] + PERSON_COLUMNS
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for value in values:
+            writer.writerow(['\\N' if value[name] is None else value[name] for name in names])
+        buffer.seek(0)
+        quote = connection.dialect.identifier_preparer.quote
+        statement = f"COPY {quote(STAGING_TABLE)} ({', '.join(quote(name) for name in names)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+        finally:
+            cursor.close()
+
+    def _occurrence(self, occurrence: int):
+        # 同一個 (榜單, 准考證號碼) 依寫入順序編號，只取第 occurrence 筆
+        ranked = select(*[staging_table.c[name] for name in PERSON_COLUMNS],
+                        func.row_number().over(partition_by=[staging_table.c.AdmissionListId, staging_table.c.AdmissionTicket],
+                                               order_by=staging_table.c.Seq).label('Occurrence')).subquery()
+        return select(*[ranked.c[name] for name in PERSON_COLUMNS]).where(ranked.c.Occurrence == occurrence)
+
+    def _merge(self, conn: Connection) -> int:
+        """
+        依重複寫入的次數分輪合併 (通常只有一輪)，每一輪都以 COALESCE 保留既有的值，
+        與一般模式逐次 upsert 的結果相同
+        """
+        keys = [staging_table.c.AdmissionListId, staging_table.c.AdmissionTicket]
+        counts = select(func.count().label('Count')).select_from(staging_table).group_by(*keys).subquery()
+        rounds = conn.execute(select(func.max(counts.c.Count))).scalar() or 0
+        return sum(self._merge_occurrence(conn, occurrence) for occurrence in range(1, rounds + 1))
+
+    def _merge_occurrence(self, conn: Connection, occurrence: int) -> int:
+        dialect = conn.dialect.name
+        table = _person_table
+        if dialect in ('sqlite', 'postgresql'):
+            statement = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table).from_select(PERSON_COLUMNS, self._occurrence(occurrence))
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.AdmissionListId, table.c.AdmissionTicket],
+                set_={name: func.coalesce(statement.excluded[name], table.c[name]) for name in UPDATE_COLUMNS},
+            )
+        elif dialect == 'mysql':
+            statement = mysql.insert(table).from_select(PERSON_COLUMNS, self._occurrence(occurrence))
+            statement = statement.on_duplicate_key_update({name: func.coalesce(statement.inserted[name], table.c[name]) for name in UPDATE_COLUMNS})
+        else:
+            source = self._occurrence(occurrence).compile(conn, compile_kwargs={'literal_binds': True})
+            statement = text(
+                f'MERGE INTO {table.name} WITH (HOLDLOCK) AS target USING ({source}) AS source '
+                f'ON target.AdmissionListId = source.AdmissionListId AND target.AdmissionTicket = source.AdmissionTicket '
+                f'WHEN MATCHED THEN UPDATE SET {", ".join(f"target.{name} = COALESCE(source.{name}, target.{name})" for name in UPDATE_COLUMNS)} '
+                f'WHEN NOT MATCHED THEN INSERT ({", ".join(PERSON_COLUMNS)}) VALUES ({", ".join("source." + name for name in PERSON_COLUMNS)});'
+            )
+        return conn.execute(statement).rowcount
+
+
+@event.listens_for(Session, 'after_commit')
+def _accept_deferred(session: Session):
+    pending = session.info.pop(_DEFERRED, None)
+    if pending:
+        backfill, items = pending
+        backfill._accept(items)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deferred(session: Session):
+    session.info.pop(_DEFERRED, None)
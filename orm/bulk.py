@@ -0,0 +1,177 @@
+import json
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from orm.model import AdmissionPerson
+
+
+logger = logging.getLogger('orm')
+
+# 上榜人可以寫入的欄位 (屬性名稱)
+PERSON_FIELDS = ('admission_ticket', 'name', 'exam_area', 'second_stage_status', 'admission_status')
+
+def dedup_persons(admission_list_id: int, rows: List[Dict[str, Any]],
+                  skipped: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    # 以准考證號碼去除重複 (後出現的覆蓋先出現的)，並略過空的准考證號碼 (有提供 skipped 時加入略過的資料)
+    persons: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        ticket = row.get('admission_ticket')
+        if not ticket:
+            logger.warning(f'存入錄取資訊失敗, 原因: admission_ticket value is empty, 可能是欄位錯誤 (榜單ID: {admission_list_id})')
+            if skipped is not None:
+                skipped.append(row)
+            continue
+        persons[ticket] = row
+    return persons
+
+def content_fingerprint(values: Dict[str, Any], rows: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    計算榜單內容指紋: 榜單欄位加上依准考證號碼排序的上榜人資料 (SHA-1)
+
+    有空的准考證號碼 (e.g. OCR 辨識失敗) 時內容不完整，回傳 None，下次爬取一定重新比對
+    """
+    if any(not row.get('admission_ticket') for row in rows):
+        return None
+    persons = {row.get('admission_ticket'): row for row in rows if row.get('admission_ticket')}
+    content = json.dumps([sorted(values.items()), [sorted(row.items()) for _, row in sorted(persons.items())]],
+                         ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def supports_native_upsert(session: Session) -> bool:
+    return session.bind.dialect.name in ('sqlite', 'postgresql', 'mysql', 'mssql')
+
+def upsert_admission_persons(session: Session, admission_list_id: int, rows: List[Dict[str, Any]]) -> int:
+    """
+    批次寫入同一個榜單的上榜人資料，回傳寫入筆數
+
+    依靠 (AdmissionListId, AdmissionTicket) 的唯一索引，使用資料庫原生的 upsert
+    (`INSERT ... ON CONFLICT`、`ON DUPLICATE KEY UPDATE`、`MERGE`) 以一次 executemany 寫入，
+    不支援的資料庫則改用 `load_and_write_admission_persons`。
+
+    rows: 以 AdmissionPerson 屬性名稱為 key 的 dict，`admission_ticket` 為必填，
+          值為 None 的欄位 (未解析的欄位) 不會覆蓋資料庫既有的值
+    """
+    if not supports_native_upsert(session):
+        inserted, updated = load_and_write_admission_persons(session, admission_list_id, rows)
+        return inserted + updated
+
+    persons = dedup_persons(admission_list_id, rows)
+    if not persons:
+        return 0
+
+    columns = inspect(AdmissionPerson).columns
+    fields = [field for field in PERSON_FIELDS if any(row.get(field) is not None for row in persons.values())]
+    # executemany 需要每一筆的欄位一致，缺少的欄位補 None (更新時以 COALESCE 保留既有的值)
+    params = [{columns[field].name: row.get(field) for field in fields} for row in persons.values()]
+    for param in params:
+        param['AdmissionListId'] = admission_list_id
+    updatable = [columns[field].name for field in fields if field != 'admission_ticket']
+
+    dialect = session.bind.dialect.name
+    table = AdmissionPerson.__table__
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+        statement = insert.on_conflict_do_update(
+            index_elements=[table.c.AdmissionListId, table.c.AdmissionTicket],
+            set_={name: func.coalesce(insert.excluded[name], table.c[name]) for name in updatable},
+        ) if updatable else insert.on_conflict_do_nothing(index_elements=[table.c.AdmissionListId, table.c.AdmissionTicket])
+        session.execute(statement, params)
+    elif dialect == 'mysql':
+        insert = mysql.insert(table)
+        set_ = {name: func.coalesce(insert.inserted[name], table.c[name]) for name in updatable}
+        # 沒有可更新的欄位時，以自身賦值讓重複的資料維持不變
+        session.execute(insert.on_duplicate_key_update(set_ or {'AdmissionTicket': table.c.AdmissionTicket}), params)
+    else:
+        names = ['AdmissionListId'] + [columns[field].name for field in fields]
+        source = ', '.join(f':{name} AS {name}' for name in names)
+        update_set = ', '.join(f'target.{name} = COALESCE(source.{name}, target.{name})' for name in updatable)
+        statement = (
+            f'MERGE INTO {table.name} WITH (HOLDLOCK) AS target '
+            f'USING (SELECT {source}) AS source '
+            f'ON target.AdmissionListId = source.AdmissionListId AND target.AdmissionTicket = source.AdmissionTicket '
+            + (f'WHEN MATCHED THEN UPDATE SET {update_set} ' if update_set else '')
+            + f'WHEN NOT MATCHED THEN INSERT ({", ".join(names)}) VALUES ({", ".join("source." + name for name in names)});'
+        )
+        session.execute(text(statement), params)
+    return len(params)
+
+def load_and_write_admission_persons(session: Session, admission_list_id: int, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    批次寫入同一個榜單的上榜人資料，回傳 (新增筆數, 更新筆數)
+
+    先用一次查詢取得榜單中既有的 (准考證號碼 -> ID)，再將新增與更新分別以 executemany 寫入，
+    取代逐筆 `query(...).first()` 再 `add`/`update` 的寫法。
+    """
+    persons = dedup_persons(admission_list_id, rows)
+    if not persons:
+        return 0, 0
+
+    existing = dict(session.query(AdmissionPerson.admission_ticket, AdmissionPerson.id)
+                           .filter(AdmissionPerson.admission_list_id == admission_list_id))
+
+    inserts, updates = [], []
+    for ticket, row in persons.items():
+        values = {key: value for key, value in row.items() if value is not None}
+        values['admission_list_id'] = admission_list_id
+        if ticket in existing:
+            values['id'] = existing[ticket]
+            updates.append(values)
+        else:
+            inserts.append(values)
+
+    if inserts:
+        session.bulk_insert_mappings(AdmissionPerson, inserts)
+    if updates:
+        session.bulk_update_mappings(AdmissionPerson, updates)
+    return len(inserts), len(updates)
+
+def diff_admission_persons(session: Session, admission_list_id: int, rows: List[Dict[str, Any]],
+                           changes: Optional[List[Tuple[Any, Optional[Dict[str, Any]]]]] = None) -> Tuple[int, int, int]:
+    """
+    比對榜單中既有的上榜人資料，只寫入差異，回傳 (新增筆數, 更新筆數, 刪除筆數)
+
+    - 新增: 資料庫中沒有的准考證號碼
+    - 更新: 任一已解析 (不為 None) 的欄位與資料庫不同
+    - 刪除: 這次的榜單中已經沒有的准考證號碼 (有空的准考證號碼時不刪除，辨識失敗的可能就是既有的上榜人)
+
+    changes: 有提供時加入每一筆差異 (資料庫中的資料, 這次的資料)，新增時前者為 None，刪除時後者為 None
+    """
+    skipped: List[Dict[str, Any]] = []
+    persons = dedup_persons(admission_list_id, rows, skipped)
+    fields = [field for field in PERSON_FIELDS if field != 'admission_ticket']
+    existing = {row.admission_ticket: row for row in
+                session.query(AdmissionPerson.id, AdmissionPerson.admission_ticket, *[getattr(AdmissionPerson, field) for field in fields])
+                       .filter(AdmissionPerson.admission_list_id == admission_list_id)}
+
+    inserts, updates = [], []
+    for ticket, row in persons.items():
+        values = {key: value for key, value in row.items() if value is not None}
+        current = existing.get(ticket)
+        if current is None:
+            if changes is not None:
+                changes.append((None, dict(values)))
+            values['admission_list_id'] = admission_list_id
+            inserts.append(values)
+        elif any(getattr(current, key) != value for key, value in values.items() if key != 'admission_ticket'):
+            if changes is not None:
+                changes.append((current, dict(values)))
+            values['id'] = current.id
+            updates.append(values)
+    missing = [row for ticket, row in existing.items() if ticket not in persons]
+    if skipped and missing:
+        logger.warning(f'榜單中有 {len(skipped)} 筆空的准考證號碼，略過刪除 {len(missing)} 筆不在榜單中的上榜人 (榜單ID: {admission_list_id})')
+        missing = []
+    removed = [row.id for row in missing]
+    if changes is not None:
+        changes.extend((row, None) for row in missing)
+
+    if inserts:
+        session.bulk_insert_mappings(AdmissionPerson, inserts)
+    if updates:
+        session.bulk_update_mappings(AdmissionPerson, updates)
+    if removed:
+        session.execute(delete(AdmissionPerson).where(AdmissionPerson.id.in_(removed)))
+    return len(inserts), len(updates), len(removed)
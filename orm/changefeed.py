@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+"""
+榜單變動事件 (changefeed)
+
+寫入資料庫時同時產生結構化的變動事件，附加到本機的 NDJSON 檔 (只附加、不修改)，
+下游服務記住讀到的位置 (cursor，檔案的位元組位移)，之後從該位置繼續讀取新的事件即可，
+不需要反覆比對整張 AdmissionPerson 表。
+
+事件類型:
+    - list_published: 新的科系榜單 (資料庫中原本沒有的 (學年度, 入學管道, 校系))
+    - admitted: 榜單中新增的准考證號碼
+    - status_changed: 錄取狀態或二階甄試狀態改變 (e.g. 備取3 -> 正取)
+    - removed: 榜單中已經沒有的准考證號碼
+
+事件先暫存在 session 中，transaction commit 成功後才寫入檔案，rollback 時捨棄，
+因此檔案中的事件一定對應到已經 commit 的資料。回填模式的新榜單事件在上榜人合併成功後才寫入，
+既有榜單寫入暫存表的上榜人差異不會產生事件。
+"""
+
+logger = logging.getLogger('changefeed')
+
+EVENT_TYPES = ('list_published', 'admitted', 'status_changed', 'removed')
+# 會產生 status_changed 事件的上榜人欄位
+STATUS_FIELDS = ('admission_status', 'second_stage_status')
+
+# session.info 中暫存事件的 key: (ChangeLog, [事件])
+_PENDING = 'changefeed'
+
+
+class ChangeLog:
+    """
+    ChangeLog appends change events to a local NDJSON file. Every event gets a sequence number,
+    and a commit's events are written with a single write so readers never see half a transaction.
+
+    Functions:
+        - stage: hold events on a session until it commits
+        - append: write events to the file
+        - close: close the file
+        - stats: events written per type
+    """
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 接續檔案中最後一個事件的序號
+        self.seq = last_seq(path)
+        self.file = open(path, mode='ab')
+        self.counts: Dict[str, int] = {}
+        logger.info(f'變動事件寫入 {path}，目前序號: {self.seq}')
+
+    def stage(self, session: Session, events: List[Dict[str, Any]]):
+        if not events:
+            return
+        _, pending = session.info.setdefault(_PENDING, (self, []))
+        pending.extend(events)
+
+    def append(self, events: List[Dict[str, Any]]):
+        if not events:
+            return
+        with self.lock:
+            if self.file.closed:
+                logger.warning(f'變動事件檔已關閉，捨棄 {len(events)} 筆事件')
+                return
+            now = datetime.now().isoformat(timespec='milliseconds')
+            lines = []
+            for item in events:
+                self.seq += 1
+                lines.append(json.dumps(dict(seq=self.seq, time=now, **item), ensure_ascii=False))
+                self.counts[item['type']] = self.counts.get(item['type'], 0) + 1
+            self.file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'seq': self.seq, **{name: self.counts.get(name, 0) for name in EVENT_TYPES}}
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish(session: Session):
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        log, events = pending
+        log.append(events)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session: Session):
+    session.info.pop(_PENDING, None)
+
+def list_event(record: Any) -> Dict[str, Any]:
+    # record: scrapers.model.AdmissionRecord
+    return {
+        'method': record.method,
+        'year': record.year,
+        'school_code': record.school_code,
+        'school_name': record.school_name,
+        'department_code': record.department_code,
+        'department_name': record.department_name,
+    }
+
+def published_events(record: Any, persons: Dict[str, Dict[str, Any]], admitted: bool = True) -> List[Dict[str, Any]]:
+    """
+    新榜單的事件: list_published 與每位上榜人的 admitted (admitted 為 False 時只產生 list_published)
+    """
+    base = list_event(record)
+    events = [dict(base, type='list_published', persons=len(persons))]
+    if admitted:
+        events.extend(admitted_event(base, ticket, row) for ticket, row in persons.items())
+    return events
+
+def admitted_event(base: Dict[str, Any], ticket: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(base, type='admitted', ticket=ticket, name=row.get('name'),
+                admission_status=row.get('admission_status'), second_stage_status=row.get('second_stage_status'))
+
+def person_events(record: Any, changes: List[Tuple[Optional[Any], Optional[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    既有榜單的上榜人差異轉換成事件
+
+    changes: `diff_admission_persons` 產生的 (資料庫中的資料, 這次的資料)，新增時前者為 None，刪除時後者為 None
+    """
+    base = list_event(record)
+    events = []
+    for current, row in changes:
+        if current is None:
+            events.append(admitted_event(base, row['admission_ticket'], row))
+        elif row is None:
+            events.append(dict(base, type='removed', ticket=current.admission_ticket))
+        else:
+            for field in STATUS_FIELDS:
+                value = row.get(field)
+                if value is not None and value != getattr(current, field):
+                    events.append(dict(base, type='status_changed', ticket=current.admission_ticket,
+                                       field=field, previous=getattr(current, field), current=value))
+    return events
+
+def last_seq(path: str) -> int:
+    # 讀取檔案最後一行完整事件的序號 (只讀取檔案結尾)
+    if not os.path.exists(path):
+        return 0
+    with open(path, mode='rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        block = 4096
+        while True:
+            start = max(0, end - block)
+            f.seek(start)
+            lines = f.read(end - start).split(b'\n')
+            # 第一段可能是被截斷的行，最後一段是尚未寫完的行
+            complete = lines[1:-1] if start > 0 else lines[:-1]
+            for line in reversed(complete):
+                if line.strip():
+                    return json.loads(line)['seq']
+            if start == 0:
+                return 0
+            block *= 2
+
+def iter_changes(path: str, cursor: int = 0) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """
+    從 cursor (位元組位移) 讀取到目前的檔案結尾，產生 (事件, 該事件之後的 cursor)；只讀取完整的行
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, mode='rb') as f:
+        f.seek(cursor)
+        for line in f:
+            if not line.endswith(b'\n'):
+                # 尚未寫完的行，下次再讀取
+                return
+            cursor += len(line)
+            if line.strip():
+                yield json.loads(line), cursor
+
+def read_changes(path: str, cursor: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    從 cursor 讀取最多 limit 筆事件，回傳 (事件, 下次讀取的 cursor)
+    """
+    events = []
+    for item, next_cursor in iter_changes(path, cursor):
+        events.append(item)
+        cursor = next_cursor
+        if limit is not None and len(events) >= limit:
+            break
+    return events, cursor
+
+def follow_changes(path: str, cursor: int = 0, poll_interval: float = 1.0) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """
+    持續讀取新的事件 (類似 `tail -f`)，產生 (事件, 該事件之後的 cursor)
+    """
+    while True:
+        read = False
+        for item, cursor in iter_changes(path, cursor):
+            read = True
+            yield item, cursor
+        if not read:
+            time.sleep(poll_interval)
@@ -0,0 +1,160 @@
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+"""
+資料庫連線設定
+
+SQLite 的 PRAGMA 大多只對單一連線有效，因此在每個連線建立時 (engine `connect` 事件) 套用效能設定檔。
+連線池會記錄取得連線的等待時間，超過門檻時寫入 log。
+"""
+
+logger = logging.getLogger('orm')
+
+# SQLite 效能設定檔 (PRAGMA 名稱 -> 值)
+SQLITE_PROFILES: Dict[str, Dict[str, Any]] = {
+    # SQLite 預設值: rollback journal、每次 commit 都完整同步
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    # WAL 模式，commit 只寫入 WAL 不等待 checkpoint 同步，程式中斷也不會損壞資料庫
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    # 大量匯入 (backfill): 不同步到磁碟、journal 放在記憶體，作業系統當機時資料庫可能損壞，結束時會恢復 fast 的設定
+    'bulk': {
+        'journal_mode': 'MEMORY',
+        'synchronous': 'OFF',
+        'cache_size': -262144,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+# bulk 設定檔結束後恢復的設定
+SQLITE_RESTORE_PROFILE = 'fast'
+
+def sqlite_pragmas(profile: str, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f'sqlite profile must be one of: {", ".join(SQLITE_PROFILES)}')
+    pragmas = dict(SQLITE_PROFILES[profile])
+    pragmas.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    return pragmas
+
+def _execute_pragmas(dbapi_connection, pragmas: Dict[str, Any]):
+    cursor = dbapi_connection.cursor()
+    try:
+        # 先設定 busy_timeout，後面切換 journal mode 時遇到鎖定才會等待
+        for name, value in sorted(pragmas.items(), key=lambda item: item[0] != 'busy_timeout'):
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+def apply_sqlite_profile(engine: Engine, profile: str, overrides: Optional[Dict[str, Any]] = None):
+    """
+    在每個新連線套用 SQLite 效能設定檔，overrides 可覆寫設定檔中的個別 PRAGMA
+    """
+    pragmas = sqlite_pragmas(profile, overrides)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        _execute_pragmas(dbapi_connection, pragmas)
+
+    logger.info(f'SQLite 效能設定檔: {profile} {pragmas}')
+
+def restore_sqlite_profile(engine: Engine, profile: str):
+    """
+    bulk 設定檔結束時呼叫: 關閉所有連線，恢復 journal mode (會寫入資料庫檔案)、同步到磁碟並更新查詢統計
+    """
+    if engine.dialect.name != 'sqlite' or profile != 'bulk':
+        return
+    engine.dispose()
+    connection = engine.raw_connection()
+    try:
+        _execute_pragmas(connection, sqlite_pragmas(SQLITE_RESTORE_PROFILE))
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        cursor.execute('PRAGMA optimize')
+        cursor.close()
+    finally:
+        connection.close()
+    engine.dispose()
+    logger.info(f'SQLite 已從 bulk 恢復為 {SQLITE_RESTORE_PROFILE} 設定')
+
+
+class TimedQueuePool(QueuePool):
+    """
+    TimedQueuePool is a QueuePool that measures how long each checkout waits
+    (for a free connection, or for a new connection to be opened) and logs slow checkouts.
+    """
+    def __init__(self, *args, slow_checkout: float = 0.1, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # 等待超過幾秒寫入 log
+        self.slow_checkout = slow_checkout
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                if waited >= self.slow_checkout:
+                    self.slow_checkouts += 1
+            if waited >= self.slow_checkout:
+                logger.warning(f'取得資料庫連線等待 {waited * 1000:.1f} ms ({self.status()})')
+
+    def recreate(self):
+        # engine.dispose() 會重新建立連線池，保留門檻設定
+        pool = super().recreate()
+        pool.slow_checkout = self.slow_checkout
+        return pool
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'overflow': self.overflow(),
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow_checkouts,
+                'avg_wait_ms': round(self.wait_seconds / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 2),
+            }
+
+def executemany_options(db_type: str) -> Dict[str, Any]:
+    """
+    各資料庫驅動的 executemany 加速選項 (create_engine 參數)
+    """
+    if db_type == 'postgresql':
+        # psycopg2: INSERT 以 execute_values 合併成多筆 VALUES，UPDATE/DELETE 以 execute_batch 分頁送出
+        return {'executemany_mode': 'values_plus_batch', 'executemany_values_page_size': 1000, 'executemany_batch_page_size': 500}
+    if db_type == 'mssql':
+        # pyodbc: 以參數陣列一次送出，不再逐筆來回
+        return {'fast_executemany': True}
+    # mysqlclient 的 executemany 已會把 INSERT 合併成多筆 VALUES；sqlite 為行程內呼叫，不需要額外設定
+    return {}
@@ -0,0 +1,205 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from orm.model import AdmissionList, AdmissionPerson, AdmissionType, SchoolDepartment
+
+
+"""
+Parquet 匯出
+
+將 AdmissionList ⋈ AdmissionPerson ⋈ SchoolDepartment 的結果以串流方式分批讀出，
+寫成依錄取方式、學年度分區的 Parquet 檔 (hive 目錄格式: `method=<錄取方式>/year=<學年度>/data.parquet`)，
+分析時可以直接以 pyarrow/pandas/duckdb 讀取需要的欄位，不必再透過 ORM 查詢線上資料庫。
+
+每個分區以該分區所有榜單的內容指紋計算簽章並記錄在 `_manifest.json`，
+增量匯出時只重新寫入簽章有變動的分區，並刪除資料庫中已不存在的分區。
+
+需要另外安裝 pyarrow (`pip install pyarrow`)。
+"""
+
+logger = logging.getLogger('export')
+
+MANIFEST_FILE = '_manifest.json'
+# 2: 簽章包含匯出的校系、榜單欄位 (舊版的簽章無法比較，重新匯出所有分區)
+MANIFEST_VERSION = 2
+DATA_FILE = 'data.parquet'
+# 每次從資料庫讀取的筆數 (同時也是 Parquet 的 row group 大小)
+CHUNK_ROWS = 50000
+
+_list = AdmissionList.__table__
+_person = AdmissionPerson.__table__
+_department = SchoolDepartment.__table__
+_type = AdmissionType.__table__
+
+# 匯出的欄位 (分區欄位 Method、Year 記錄在目錄名稱中)
+LIST_COLUMNS = ['AverageScore', 'Weight', 'SameGradeOrder', 'GeneralGrade', 'NativeGrade', 'VeteranGrade', 'OverseaGrade',
+                'AverageScoreValue', 'GeneralGradeValue', 'NativeGradeValue', 'VeteranGradeValue', 'OverseaGradeValue',
+                'UniversityApply', 'GroupCode']
+DEPARTMENT_COLUMNS = ['SchoolCode', 'DepartmentCode', 'SchoolName', 'DepartmentName']
+PERSON_COLUMNS = ['AdmissionTicket', 'Name', 'ExamArea', 'SecondStageStatus', 'AdmissionStatus']
+EXPORT_COLUMNS = DEPARTMENT_COLUMNS + LIST_COLUMNS + PERSON_COLUMNS
+# 重複值很多的欄位使用字典編碼 (准考證號碼幾乎不重複，字典編碼反而較大)
+DICTIONARY_COLUMNS = ['SchoolCode', 'DepartmentCode', 'SchoolName', 'DepartmentName', 'ExamArea', 'SecondStageStatus', 'AdmissionStatus']
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet export requires pyarrow, please install it: pip install pyarrow') from None
+    return pyarrow, pyarrow.parquet
+
+def _arrow_schema(pa):
+    fields = []
+    for name in EXPORT_COLUMNS:
+        if name in DICTIONARY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        elif name.endswith('Value'):
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+def partition_key(method: str, year: int) -> str:
+    return f'{method}/{year}'
+
+def partition_path(root: Path, method: str, year: int) -> Path:
+    # 錄取方式名稱可能含有不適合當作目錄名稱的字元，以 URL 編碼 (pyarrow 讀取 hive 分區時會自動解碼)
+    return root / f'method={quote(method, safe="")}' / f'year={year}'
+
+def partition_signatures(db: Engine, method: Optional[str] = None, year: Optional[int] = None) -> Dict[Tuple[str, int], str]:
+    """
+    計算每個 (錄取方式, 學年度) 分區的簽章: 分區中所有榜單的 ID、內容指紋與匯出的校系、榜單欄位的 SHA-1
+    (只讀取榜單層級的資料，不需要掃描上榜人；`--backfill-scores` 只改寫分數數值欄位，不會改變內容指紋)
+    """
+    exported = [_department.c[name] for name in DEPARTMENT_COLUMNS] + [_list.c[name] for name in LIST_COLUMNS]
+    statement = (select(_type.c.Name, _list.c.Year, _list.c.Id, _list.c.Fingerprint, *exported)
+                 .join(_type, _type.c.Id == _list.c.Method)
+                 .join(_department, _department.c.Id == _list.c.SchoolDepartmentID)
+                 .order_by(_type.c.Name, _list.c.Year, _list.c.Id))
+    if method is not None:
+        statement = statement.where(_type.c.Name == method)
+    if year is not None:
+        statement = statement.where(_list.c.Year == year)
+
+    digests: Dict[Tuple[str, int], Any] = {}
+    with db.connect() as conn:
+        for name, list_year, *values in conn.execute(statement):
+            digest = digests.setdefault((name, list_year), hashlib.sha1())
+            digest.update(json.dumps(values, ensure_ascii=False).encode('utf-8'))
+    return {key: digest.hexdigest() for key, digest in digests.items()}
+
+def read_manifest(root: Path) -> Dict[str, Dict[str, Any]]:
+    path = root / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, mode='r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != MANIFEST_VERSION:
+        logger.warning(f'匯出目錄的 manifest 版本不符 ({data.get("version")})，將重新匯出所有分區')
+        return {}
+    return data.get('partitions', {})
+
+def write_manifest(root: Path, partitions: Dict[str, Dict[str, Any]]):
+    # 先寫入暫存檔再取代，避免中斷時留下不完整的 manifest
+    path = root / MANIFEST_FILE
+    tmp_path = root / f'.{MANIFEST_FILE}.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'partitions': partitions}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def export_partition(db: Engine, root: Path, method: str, year: int, chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    以串流方式讀取單一分區的資料並寫入 Parquet，回傳寫入筆數
+    """
+    pa, pq = _import_pyarrow()
+    schema = _arrow_schema(pa)
+    columns = [_department.c[name] for name in DEPARTMENT_COLUMNS] + [_list.c[name] for name in LIST_COLUMNS] + [_person.c[name] for name in PERSON_COLUMNS]
+    statement = (select(*columns)
+                 .select_from(_list)
+                 .join(_type, _type.c.Id == _list.c.Method)
+                 .join(_department, _department.c.Id == _list.c.SchoolDepartmentID)
+                 .join(_person, _person.c.AdmissionListId == _list.c.Id)
+                 .where(_type.c.Name == method, _list.c.Year == year)
+                 .order_by(_list.c.Id, _person.c.Id))
+
+    directory = partition_path(root, method, year)
+    directory.mkdir(parents=True, exist_ok=True)
+    # 以 . 開頭的暫存檔不會被 pyarrow/pandas 讀取，寫入完成後才取代正式檔案
+    tmp_path = directory / f'.{DATA_FILE}.tmp'
+    rows = 0
+    writer = pq.ParquetWriter(tmp_path, schema, compression='zstd', use_dictionary=DICTIONARY_COLUMNS)
+    try:
+        with db.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(statement)
+            for chunk in result.partitions(chunk_rows):
+                values = list(zip(*chunk))
+                arrays = []
+                for index, field in enumerate(schema):
+                    if pa.types.is_dictionary(field.type):
+                        arrays.append(pa.array(values[index], pa.string()).dictionary_encode())
+                    else:
+                        arrays.append(pa.array(values[index], field.type))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                rows += len(chunk)
+    except BaseException:
+        writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    writer.close()
+    os.replace(tmp_path, directory / DATA_FILE)
+    return rows
+
+def export_parquet(db: Engine, output: str, method: Optional[str] = None, year: Optional[int] = None,
+                   full: bool = False, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+    """
+    匯出 Parquet 分區 (method、year 可只匯出指定的錄取方式、學年度)，
+    full 為 False 時只重新寫入簽章有變動的分區，回傳匯出統計
+    """
+    _import_pyarrow()
+    root = Path(output)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(root)
+    signatures = partition_signatures(db, method, year)
+
+    stats = {'exported': 0, 'unchanged': 0, 'removed': 0, 'rows': 0}
+    for (name, list_year), signature in signatures.items():
+        key = partition_key(name, list_year)
+        entry = manifest.get(key)
+        if not full and entry and entry['signature'] == signature and (root / entry['path']).exists():
+            stats['unchanged'] += 1
+            continue
+        rows = export_partition(db, root, name, list_year, chunk_rows)
+        manifest[key] = {
+            'method': name,
+            'year': list_year,
+            'signature': signature,
+            'rows': rows,
+            'path': partition_path(Path(), name, list_year).joinpath(DATA_FILE).as_posix(),
+            'exported_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        # 每個分區完成就更新 manifest，中斷後重新執行只需匯出剩下的分區
+        write_manifest(root, manifest)
+        stats['exported'] += 1
+        stats['rows'] += rows
+        logger.info(f'已匯出 {name} {list_year} 學年度: {rows} 筆')
+
+    # 刪除資料庫中已不存在的分區 (只檢查本次匯出範圍內的分區)
+    for key, entry in list(manifest.items()):
+        if (method is not None and entry['method'] != method) or (year is not None and entry['year'] != year):
+            continue
+        if (entry['method'], entry['year']) not in signatures:
+            shutil.rmtree(partition_path(root, entry['method'], entry['year']), ignore_errors=True)
+            del manifest[key]
+            stats['removed'] += 1
+    write_manifest(root, manifest)
+    logger.info(f'Parquet 匯出完成: {stats}')
+    return stats
@@ -0,0 +1,45 @@
+from typing import Any, Dict, List
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from orm.model import AdmissionList, AdmissionPerson, AdmissionType, SchoolDepartment
+
+
+"""
+准考證號碼查詢
+
+「列出某個准考證號碼的所有錄取結果」會跨越所有年度與入學管道，
+AdmissionPerson 上的 (AdmissionTicket, AdmissionListId, AdmissionStatus, SecondStageStatus) 涵蓋索引
+讓查詢只需要讀取索引，再以主鍵取得榜單、校系與錄取方式。
+索引隨著寫入自動維護，不需要另外刷新查詢表。
+"""
+
+_list = AdmissionList.__table__
+_person = AdmissionPerson.__table__
+_department = SchoolDepartment.__table__
+_type = AdmissionType.__table__
+
+ticket_statement = (
+    select(_list.c.Year, _type.c.Name.label('Method'), _department.c.SchoolCode, _department.c.SchoolName,
+           _department.c.DepartmentCode, _department.c.DepartmentName, _person.c.AdmissionStatus, _person.c.SecondStageStatus)
+    .select_from(_person)
+    .join(_list, _list.c.Id == _person.c.AdmissionListId)
+    .join(_type, _type.c.Id == _list.c.Method)
+    .join(_department, _department.c.Id == _list.c.SchoolDepartmentID)
+)
+
+def lookup_ticket(conn: Connection, ticket: str) -> List[Dict[str, Any]]:
+    """
+    查詢准考證號碼在所有年度、入學管道的錄取結果 (新的年度在前)
+    """
+    statement = ticket_statement.where(_person.c.AdmissionTicket == ticket).order_by(
+        _list.c.Year.desc(), _type.c.Name, _department.c.SchoolCode, _department.c.DepartmentCode)
+    return [{
+        'year': row.Year,
+        'method': row.Method,
+        'school_code': row.SchoolCode,
+        'school_name': row.SchoolName,
+        'department_code': row.DepartmentCode,
+        'department_name': row.DepartmentName,
+        'admission_status': row.AdmissionStatus,
+        'second_stage_status': row.SecondStageStatus,
+    } for row in conn.execute(statement)]
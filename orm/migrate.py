@@ -0,0 +1,153 @@
+import logging
+from typing import Callable, List, Tuple
+from sqlalchemy import Table, MetaData, inspect, select, update, delete, func, and_, text
+from sqlalchemy.engine import Connection, Engine
+from orm.model import *
+from orm.scores import backfill_scores
+
+
+"""
+資料庫結構遷移
+
+新的資料庫直接以 `Base.metadata.create_all` 建立最新結構並標記為最新版本，
+既有的資料庫則依序執行尚未套用的遷移，每個遷移在同一個 transaction 內完成。
+"""
+
+logger = logging.getLogger('migrate')
+
+def _drop_index(conn: Connection, table_name: str, index_name: str):
+    reflected = Table(table_name, MetaData(), autoload_with=conn)
+    for index in reflected.indexes:
+        if index.name == index_name:
+            index.drop(conn)
+            logger.info(f'已移除索引 {table_name}.{index_name}')
+
+def _create_missing_indexes(conn: Connection, table: Table, names: List[str]):
+    # 只建立該遷移指定的索引 (模型中較新的索引可能參照尚未新增的欄位)
+    existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in names and index.name not in existing:
+            index.create(conn)
+            logger.info(f'已建立索引 {table.name}.{index.name}')
+
+def _add_missing_columns(conn: Connection, table: Table, names: List[str]):
+    # 新增該遷移指定、資料庫中沒有的欄位 (新欄位必須可為 NULL)
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    keyword = 'ADD' if conn.dialect.name == 'mssql' else 'ADD COLUMN'
+    for column in table.columns:
+        if column.name in names and column.name not in existing:
+            conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} {keyword} '
+                              f'{preparer.format_column(column)} {column.type.compile(conn.dialect)}'))
+            logger.info(f'已新增欄位 {table.name}.{column.name}')
+
+def _deduplicate(conn: Connection, table: Table, key_columns: List[str], references: List[Tuple[Table, str]]):
+    """
+    依自然鍵去除重複資料，保留 ID 最小的一筆 (原本的爬蟲都是更新 `first()` 查到的那一筆)，
+    並將參照到重複資料的外鍵改指向保留的那一筆
+    """
+    keys = [table.c[name] for name in key_columns]
+    groups = conn.execute(select(func.min(table.c.Id), *keys).group_by(*keys).having(func.count() > 1)).fetchall()
+    for keep_id, *values in groups:
+        condition = and_(*[column == value for column, value in zip(keys, values)], table.c.Id != keep_id)
+        duplicate_ids = [row[0] for row in conn.execute(select(table.c.Id).where(condition))]
+        for ref_table, ref_column in references:
+            conn.execute(update(ref_table).where(ref_table.c[ref_column].in_(duplicate_ids)).values({ref_column: keep_id}))
+        conn.execute(delete(table).where(table.c.Id.in_(duplicate_ids)))
+    if groups:
+        logger.info(f'{table.name} 去除 {len(groups)} 組重複資料')
+
+def _unique_natural_keys(conn: Connection):
+    """
+    Revision 1: 自然鍵改為唯一索引，並移除與主鍵重複的索引
+    """
+    admission_type = AdmissionType.__table__
+    school_department = SchoolDepartment.__table__
+    admission_list = AdmissionList.__table__
+    admission_person = AdmissionPerson.__table__
+
+    # 依照參照關係由上而下去除重複 (榜單合併後，上榜人才可能出現重複)
+    _deduplicate(conn, admission_type, ['Name'], [(admission_list, 'Method')])
+    _deduplicate(conn, school_department, ['SchoolCode', 'DepartmentCode'], [(admission_list, 'SchoolDepartmentID')])
+    _deduplicate(conn, admission_list, ['Year', 'Method', 'SchoolDepartmentID'], [(admission_person, 'AdmissionListId')])
+    _deduplicate(conn, admission_person, ['AdmissionListId', 'AdmissionTicket'], [])
+
+    # 先建立唯一索引再移除舊索引 (MySQL 的外鍵必須一直有可用的索引)
+    for table, names in [
+        (admission_type, ['uq_admission_type_name']),
+        (school_department, ['uq_school_department_code']),
+        (admission_list, ['uq_admission_list_year_method_school']),
+        (admission_person, ['uq_admission_person_listId_ticket']),
+    ]:
+        _create_missing_indexes(conn, table, names)
+    for table_name, index_name in [
+        ('AdmissionList', 'idx_admission_list_id'),
+        ('AdmissionList', 'idx_admission_list_year_method_school'),
+        ('AdmissionPerson', 'idx_admission_person_id'),
+        ('AdmissionPerson', 'idx_admission_person_listId_ticket'),
+        ('AdmissionType', 'idx_admission_type_id'),
+        ('SchoolDepartment', 'idx_school_department_id'),
+        ('SchoolDepartment', 'idx_school_department_code'),
+    ]:
+        _drop_index(conn, table_name, index_name)
+
+def _admission_fingerprint(conn: Connection):
+    """
+    Revision 2: 榜單新增內容指紋欄位
+    """
+    _add_missing_columns(conn, AdmissionList.__table__, ['Fingerprint'])
+
+def _score_values(conn: Connection):
+    """
+    Revision 3: 榜單新增分數數值欄位與 (錄取方式, 學年度, 分數) 索引，並由原始字串回填
+    """
+    _add_missing_columns(conn, AdmissionList.__table__, [
+        'AverageScoreValue', 'GeneralGradeValue', 'NativeGradeValue', 'VeteranGradeValue', 'OverseaGradeValue',
+    ])
+    _create_missing_indexes(conn, AdmissionList.__table__, [
+        'idx_admission_list_method_year_average_score',
+        'idx_admission_list_method_year_general_grade',
+        'idx_admission_list_method_year_native_grade',
+        'idx_admission_list_method_year_veteran_grade',
+        'idx_admission_list_method_year_oversea_grade',
+    ])
+    backfill_scores(conn)
+
+def _ticket_lookup_index(conn: Connection):
+    """
+    Revision 4: 上榜人新增 (准考證號碼, 榜單ID, 錄取狀態, 二階甄試狀態) 涵蓋索引
+    """
+    _create_missing_indexes(conn, AdmissionPerson.__table__, ['idx_admission_person_ticket'])
+
+# (版本, 遷移函式)，只能往後新增
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (1, _unique_natural_keys),
+    (2, _admission_fingerprint),
+    (3, _score_values),
+    (4, _ticket_lookup_index),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+def current_revision(conn: Connection) -> int:
+    return conn.execute(select(func.max(SchemaRevision.__table__.c.Revision))).scalar() or 0
+
+def migrate(engine: Engine):
+    fresh = not inspect(engine).has_table(AdmissionList.__tablename__)
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        revision = current_revision(conn)
+        if fresh and revision == 0:
+            # 新建立的資料庫已經是最新結構
+            conn.execute(SchemaRevision.__table__.insert().values(Revision=HEAD))
+            return
+
+    for target, migration in MIGRATIONS:
+        if target <= revision:
+            continue
+        logger.info(f'資料庫結構遷移: {revision} -> {target}')
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(SchemaRevision.__table__.insert().values(Revision=target))
+        revision = target
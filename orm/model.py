@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, create_engine, Index
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, create_engine, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import validates
 from sqlalchemy.ext.declarative import declarative_base
@@ -9,8 +9,14 @@ Base = declarative_base()
 class AdmissionList(Base):
     __tablename__ = 'AdmissionList'
     __table_args__ = (
-        Index("idx_admission_list_id", "Id", unique=True),
-        Index('idx_admission_list_year_method_school', 'Year', 'Method', 'SchoolDepartmentID'),
+        # 同一學年度、錄取方式、校系只會有一張榜單
+        Index('uq_admission_list_year_method_school', 'Year', 'Method', 'SchoolDepartmentID', unique=True),
+        # 依錄取方式、學年度查詢分數範圍
+        Index('idx_admission_list_method_year_average_score', 'Method', 'Year', 'AverageScoreValue'),
+        Index('idx_admission_list_method_year_general_grade', 'Method', 'Year', 'GeneralGradeValue'),
+        Index('idx_admission_list_method_year_native_grade', 'Method', 'Year', 'NativeGradeValue'),
+        Index('idx_admission_list_method_year_veteran_grade', 'Method', 'Year', 'VeteranGradeValue'),
+        Index('idx_admission_list_method_year_oversea_grade', 'Method', 'Year', 'OverseaGradeValue'),
     )
 
     # 榜單ID
@@ -38,11 +44,21 @@ class AdmissionList(Base):
     # 僑生錄取分數
     oversea_grade = Column('OverseaGrade', String(20), comment="僑生錄取分數", nullable=True)
     
+    # 分數的數值欄位 (由上方的原始字串解析，無法解析時為 NULL)
+    average_score_value = Column('AverageScoreValue', Float, comment="平均錄取分數 (數值)", nullable=True)
+    general_grade_value = Column('GeneralGradeValue', Float, comment="一般生錄取分數 (數值)", nullable=True)
+    native_grade_value = Column('NativeGradeValue', Float, comment="原住民錄取分數 (數值)", nullable=True)
+    veteran_grade_value = Column('VeteranGradeValue', Float, comment="退伍軍人錄取分數 (數值)", nullable=True)
+    oversea_grade_value = Column('OverseaGradeValue', Float, comment="僑生錄取分數 (數值)", nullable=True)
+    
     # 大學/科大個人申請(學測專用)
     university_apply = Column('UniversityApply', String(20), comment="大學/科大個人申請 (學測專用)", nullable=True)
     # 群組代碼 (統測專用)
     group_code = Column('GroupCode', String(20), comment="群組代碼 (統測專用)", nullable=True)
     
+    # 榜單內容指紋，內容與上次爬取相同時略過寫入
+    fingerprint = Column('Fingerprint', String(40), comment="榜單內容指紋 (SHA-1)", nullable=True)
+    
     # 一個榜單有很多人，一個人只會出現在一個榜單上 : 榜單->人 = 1->N
     admission_persons = relationship('AdmissionPerson', back_populates="admission_lists")
     # 一個榜單只會有一個錄取方式，一個錄取方式有很多榜單 : 錄取方式->榜單 = 1->N
@@ -54,8 +70,10 @@ class AdmissionList(Base):
 class AdmissionPerson(Base):
     __tablename__ = 'AdmissionPerson'
     __table_args__ = (
-        Index("idx_admission_person_id", "Id", unique=True),
-        Index('idx_admission_person_listId_ticket', 'AdmissionListId', 'AdmissionTicket'),
+        # 同一張榜單中准考證號碼不會重複
+        Index('uq_admission_person_listId_ticket', 'AdmissionListId', 'AdmissionTicket', unique=True),
+        # 依准考證號碼查詢所有年度的錄取結果 (涵蓋索引，不需要讀取資料列)
+        Index('idx_admission_person_ticket', 'AdmissionTicket', 'AdmissionListId', 'AdmissionStatus', 'SecondStageStatus'),
     )
     
     # ID
@@ -87,7 +105,7 @@ class AdmissionPerson(Base):
 class AdmissionType(Base):
     __tablename__ = 'AdmissionType'
     __table_args__ = (
-        Index("idx_admission_type_id", "Id", unique=True),
+        Index('uq_admission_type_name', 'Name', unique=True),
     )
     
     id = Column('Id', Integer, primary_key=True, comment="錄取方式的類型ID", autoincrement=True)
@@ -101,8 +119,7 @@ class AdmissionType(Base):
 class SchoolDepartment(Base):
     __tablename__ = 'SchoolDepartment'
     __table_args__ = (
-        Index("idx_school_department_id", "Id", unique=True),
-        Index("idx_school_department_code", "SchoolCode", "DepartmentCode"),
+        Index('uq_school_department_code', 'SchoolCode', 'DepartmentCode', unique=True),
     )
     
     id = Column('Id', Integer, primary_key=True, comment="校系ID", autoincrement=True)
@@ -114,6 +131,13 @@ class SchoolDepartment(Base):
     # 一個校系有很多榜單，一個榜單只會有一個校系 : 校系->榜單 = 1->N
     admission_lists = relationship('AdmissionList', back_populates="school_department")
     
+
+# 資料庫結構版本 (由 orm/migrate.py 維護)
+class SchemaRevision(Base):
+    __tablename__ = 'SchemaRevision'
+    
+    revision = Column('Revision', Integer, primary_key=True, comment="資料庫結構版本", autoincrement=False)
+    
     
 if __name__ == '__main__':
     engine = create_engine('sqlite:///test.db', echo=True)
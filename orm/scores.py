@@ -0,0 +1,64 @@
+import re
+import logging
+from typing import Optional
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.engine import Connection
+from orm.model import AdmissionList
+
+
+"""
+錄取分數數值欄位
+
+榜單上的分數是原始字串 (e.g. `450.1`、`--`、`未招生`)，另外存一份解析後的數值欄位，
+讓「錄取分數介於 X 與 Y 之間」這類查詢可以使用 (錄取方式, 學年度, 分數) 索引而不必逐筆轉型。
+"""
+
+logger = logging.getLogger('orm')
+
+# 原始字串欄位 -> 數值欄位 (屬性名稱)
+SCORE_FIELDS = {
+    'average_score': 'average_score_value',
+    'general_grade': 'general_grade_value',
+    'native_grade': 'native_grade_value',
+    'veteran_grade': 'veteran_grade_value',
+    'oversea_grade': 'oversea_grade_value',
+}
+
+score_pattern = re.compile(r'-?\d+(?:\.\d+)?')
+
+def parse_score(raw: Optional[str]) -> Optional[float]:
+    # 取出字串中的第一個數字，沒有數字 (e.g. `--`、`未招生`) 時回傳 None
+    if not raw:
+        return None
+    m = score_pattern.search(raw.replace(',', ''))
+    return float(m.group()) if m else None
+
+def score_values(values: dict) -> dict:
+    # 依榜單的原始分數欄位計算數值欄位 (只處理 values 中有的欄位)
+    return {value_field: parse_score(values[raw_field]) for raw_field, value_field in SCORE_FIELDS.items() if raw_field in values}
+
+def backfill_scores(conn: Connection, batch_size: int = 1000) -> int:
+    """
+    以原始字串重新計算所有榜單的數值欄位，只更新數值有變動的榜單，回傳更新筆數
+    """
+    table = AdmissionList.__table__
+    columns = AdmissionList.__mapper__.columns
+    raw_columns = [columns[raw_field] for raw_field in SCORE_FIELDS]
+    value_columns = [columns[value_field] for value_field in SCORE_FIELDS.values()]
+
+    rows = conn.execute(select(table.c.Id, *raw_columns, *value_columns).where(or_(*[column.isnot(None) for column in raw_columns])))
+    statement = (update(table).where(table.c.Id == bindparam('_id'))
+                 .values({column.name: bindparam(f'_{column.name}') for column in value_columns}))
+    updated, pending = 0, []
+    for row in rows.fetchall():
+        parsed = [parse_score(row._mapping[column.name]) for column in raw_columns]
+        if parsed != [row._mapping[column.name] for column in value_columns]:
+            pending.append(dict({f'_{column.name}': value for column, value in zip(value_columns, parsed)}, _id=row.Id))
+        if len(pending) >= batch_size:
+            conn.execute(statement, pending)
+            updated, pending = updated + len(pending), []
+    if pending:
+        conn.execute(statement, pending)
+        updated += len(pending)
+    logger.info(f'已更新 {updated} 筆榜單的分數數值欄位')
+    return updated
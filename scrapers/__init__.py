@@ -1,6 +1,24 @@
-from .meta import *
-from .scraper import *
-from .model import *
-from .webparser import *
-from .ocr import *
-from .crawlers import *
+import importlib
+
+
+"""
+子模組在第一次使用時才載入 (bs4、cloudscraper、sqlalchemy 等相依套件載入很慢)，
+只匯入 `scrapers.profiling`、`scrapers.metrics` 等輕量模組時不會載入整個爬蟲，
+`from scrapers import Scraper` 的寫法不變。
+"""
+
+# 依序尋找名稱所在的子模組 (與原本 `from .x import *` 的順序相同)
+_submodules = ('meta', 'scraper', 'model', 'webparser', 'ocr', 'ocr_service', 'writer', 'sinks', 'crawlers')
+
+def __getattr__(name: str):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    if name in _submodules:
+        return importlib.import_module(f'{__name__}.{name}')
+    for submodule in _submodules:
+        module = importlib.import_module(f'{__name__}.{submodule}')
+        if name in module.__dict__:
+            value = module.__dict__[name]
+            globals()[name] = value
+            return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
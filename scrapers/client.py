@@ -1,35 +1,120 @@
+import os
 import time
+import asyncio
 import logging
+import threading
 import requests
 import cloudscraper
-from scrapers.meta import Singleton
+from typing import Any, Dict, Optional, Tuple
+from scrapers.metrics import Metrics
+from scrapers.profiling import span
+
+
+"""
+請求客戶端
+
+每個 worker (執行緒) 各自持有一個 cloudscraper session (requests 的 Session 不保證執行緒安全)，
+FlareSolverr 取得的 Cloudflare 驗證 (cookies 與 User-Agent) 則由同一個 ClientFactory 的所有 session 共用，
+以 lock 保護，同一時間只有一個 worker 向 FlareSolverr 請求驗證，其他 worker 等待後直接使用新的驗證。
+
+- 執行緒: `ClientFactory.get` 自動使用目前執行緒的 session
+- asyncio: `ClientFactory.aget` 在 executor 的執行緒中請求，不會阻塞 event loop
+- process: fork 之後子 process 重新建立 session 與 lock (保留已取得的驗證)，pickle 時只傳遞設定與驗證
+"""
+
+# 請求網站的次數 (依狀態碼，`challenge` 為 Cloudflare 驗證失敗，`error` 為連線錯誤) 與延遲
+REQUESTS = Metrics().counter('scraper_client_requests_total', 'HTTP requests sent to the site by status code', ('status',))
+REQUEST_SECONDS = Metrics().histogram('scraper_client_request_seconds', 'Latency of HTTP requests sent to the site')
+# FlareSolverr 驗證次數 (依結果) 與延遲
+SOLVES = Metrics().counter('scraper_flaresolverr_solves_total', 'FlareSolverr solve requests by result', ('result',))
+SOLVE_SECONDS = Metrics().histogram('scraper_flaresolverr_solve_seconds', 'Latency of FlareSolverr solve requests')
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
 
 class ClientException(Exception):
     pass
 
-class Client(metaclass=Singleton):
-    
-    def __init__(self, 
-                 config, 
+
+class Clearance:
+    """
+    Clearance holds the Cloudflare clearance (cookies and user agent) shared by every session of a factory.
+
+    Functions:
+        - snapshot: current (generation, cookies, user agent)
+        - update: store a new clearance from FlareSolverr and bump the generation
+        - solving: lock held by the worker that is asking FlareSolverr for a new clearance
+    """
+    def __init__(self, cookies: Optional[Dict[str, str]] = None, user_agent: str = DEFAULT_USER_AGENT) -> None:
+        self.lock = threading.Lock()
+        self.solving = threading.Lock()
+        self.cookies = cookies
+        self.user_agent = user_agent
+        # 每次更新驗證加一，用來判斷等待期間是否已經有其他 worker 更新過
+        self.generation = 0
+
+    def snapshot(self) -> Tuple[int, Optional[Dict[str, str]], str]:
+        with self.lock:
+            return self.generation, dict(self.cookies) if self.cookies else None, self.user_agent
+
+    def update(self, cookies: Dict[str, str], user_agent: str):
+        with self.lock:
+            self.cookies = cookies
+            self.user_agent = user_agent
+            self.generation += 1
+
+    def __getstate__(self):
+        # lock 無法 pickle，只傳遞驗證內容
+        generation, cookies, user_agent = self.snapshot()
+        return {'cookies': cookies, 'user_agent': user_agent, 'generation': generation}
+
+    def __setstate__(self, state):
+        self.__init__(state['cookies'], state['user_agent'])
+        self.generation = state['generation']
+
+
+class Client:
+    """
+    Client is the session of one worker. It is not thread-safe by itself,
+    use `ClientFactory` to get the client of the current thread.
+
+    Functions:
+        - get: request a page, solving the Cloudflare challenge with FlareSolverr when needed
+        - close: close the session
+    """
+    def __init__(self,
+                 config,
+                 clearance: Optional[Clearance] = None,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
                  logger: logging.Logger = logging.getLogger('client')):
-        self.config = config            
+        self.config = config
         self.logger = logger
-        self.cookies = None
-        self.user_agent = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
+        self.clearance = clearance or Clearance()
         self.requests = cloudscraper.create_scraper()
-        
-    def _get(self, url):
-        # 思路簡單，就是先請求一次，如果 Cloudflare 驗證失敗，就用 FlareSolverr 來解決驗證問題(更新 cookies)
+        # 調整連線池大小 (保留 cloudscraper 的 https adapter 與其 TLS 設定)
+        for adapter in self.requests.adapters.values():
+            adapter.init_poolmanager(pool_connections, pool_maxsize, block=adapter._pool_block)
+
+    def _request(self, url, cookies, user_agent):
+        start = time.perf_counter()
+        status = 'error'
         try:
-            resp = self.requests.get(url, cookies=self.cookies, timeout=self.config.max_timeout, headers={
-                'User-Agent': self.user_agent
+            resp = self.requests.get(url, cookies=cookies, timeout=self.config.max_timeout, headers={
+                'User-Agent': user_agent
             })
-            # 檢查請求是否成功
-            if resp and resp.status_code == 200:
-                return resp.text
-            else:
-                raise ClientException(f'請求失敗，狀態碼: {resp.status_code}')
-        except (cloudscraper.exceptions.CloudflareChallengeError, ClientException) as e:
+            status = str(resp.status_code)
+            return resp
+        except cloudscraper.exceptions.CloudflareChallengeError:
+            status = 'challenge'
+            raise
+        finally:
+            REQUESTS.labels(status).inc()
+            REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+    def _solve(self, url):
+        start = time.perf_counter()
+        result = 'error'
+        try:
             resp = requests.post(self.config.flaresolverr_url, headers={'Content-Type': 'application/json'}, json={
                 "cmd": "request.get",
                 "url": url,
@@ -38,17 +123,50 @@ class Client(metaclass=Singleton):
             if resp and resp.status_code == 200:
                 j = resp.json()
                 if j and j.get('status') == 'ok':
+                    result = 'ok'
                     self.logger.info(f'FlareSolverr 請求成功，正在更新 cookies')
-                    self.cookies = {i['name']:i['value'] for i in j['solution']['cookies']}
-                    self.user_agent = j['solution']['userAgent']
+                    self.clearance.update({i['name']:i['value'] for i in j['solution']['cookies']}, j['solution']['userAgent'])
                     return j['solution']['response']
                 else:
+                    result = 'failed'
                     self.logger.error(f'FlareSolverr 請求失敗，可能是 Cloudflare 驗證失敗')
             else:
                 self.logger.error(f'FlareSolverr 請求失敗，可能是 FlareSolverr Server 未啟動')
                 raise Exception(f'請求失敗，狀態碼: {resp.status_code}')
-        
+        finally:
+            SOLVES.labels(result).inc()
+            SOLVE_SECONDS.observe(time.perf_counter() - start)
+
+    def _fetch(self, url, cookies, user_agent):
+        resp = self._request(url, cookies, user_agent)
+        # 檢查請求是否成功
+        if resp and resp.status_code == 200:
+            return resp.text
+        raise ClientException(f'請求失敗，狀態碼: {resp.status_code}')
+
+    def _get(self, url):
+        # 思路簡單，就是先請求一次，如果 Cloudflare 驗證失敗，就用 FlareSolverr 來解決驗證問題(更新 cookies)
+        generation, cookies, user_agent = self.clearance.snapshot()
+        try:
+            return self._fetch(url, cookies, user_agent)
+        except (cloudscraper.exceptions.CloudflareChallengeError, ClientException):
+            pass
+        # 同一時間只有一個 worker 向 FlareSolverr 請求驗證
+        with self.clearance.solving:
+            current, cookies, user_agent = self.clearance.snapshot()
+            if current != generation:
+                # 等待期間其他 worker 已經更新驗證，先用新的驗證再請求一次
+                try:
+                    return self._fetch(url, cookies, user_agent)
+                except (cloudscraper.exceptions.CloudflareChallengeError, ClientException):
+                    pass
+            return self._solve(url)
+
     def get(self, url):
+        with span('fetch'):
+            return self._get_with_retry(url)
+
+    def _get_with_retry(self, url):
         retry = 0
         self.logger.debug(f'開始請求，請求次數: {retry}')
         while retry < self.config.retry:
@@ -60,16 +178,94 @@ class Client(metaclass=Singleton):
             retry += 1
         self.logger.error(f'請求失敗，已超過最大重試次數: {self.config.retry}')
         return None
-    
+
+    def close(self):
+        self.requests.close()
+
+
+class ClientFactory:
+    """
+    ClientFactory creates one Client (session) per worker thread, all sharing the same clearance.
+    Factories are shared per configuration (see `shared`), so crawlers with the same
+    FlareSolverr settings share one clearance, and a different configuration gets its own factory.
+
+    Functions:
+        - shared: get the factory of a configuration
+        - client: get the client of the current thread (created on first use, recreated after fork)
+        - get: request a page with the client of the current thread
+        - aget: request a page from asyncio without blocking the event loop
+        - close: close every session created by the factory
+    """
+    _factories: Dict[Tuple, 'ClientFactory'] = {}
+    _factories_lock = threading.Lock()
+
+    def __init__(self, config, clearance: Optional[Clearance] = None) -> None:
+        self.config = config
+        self.clearance = clearance or Clearance()
+        # 連線池大小 (未設定時使用 requests 的預設值)
+        self.pool_connections = getattr(config, 'pool_connections', 10)
+        self.pool_maxsize = getattr(config, 'pool_maxsize', 10)
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.clients = []
+
+    @classmethod
+    def shared(cls, config) -> 'ClientFactory':
+        key = tuple(sorted(config.dict().items()))
+        with cls._factories_lock:
+            factory = cls._factories.get(key)
+            if factory is None:
+                factory = cls._factories[key] = cls(config)
+            return factory
+
+    def client(self) -> Client:
+        if self.pid != os.getpid():
+            # fork 之後父 process 的 session (連線) 與 lock 不能沿用，保留驗證重新建立
+            generation, cookies, user_agent = self.clearance.snapshot()
+            self.clearance = Clearance(cookies, user_agent)
+            self._reset()
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = Client(self.config, self.clearance, self.pool_connections, self.pool_maxsize)
+            self.local.client = client
+            with self.lock:
+                self.clients.append(client)
+        return client
+
+    def get(self, url):
+        return self.client().get(url)
+
+    async def aget(self, url):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, url)
+
+    def close(self):
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for client in clients:
+            client.close()
+        self.local = threading.local()
+
+    def __getstate__(self):
+        # process worker 只需要設定與目前的驗證，session 在子 process 中重新建立
+        return {'config': self.config, 'clearance': self.clearance}
+
+    def __setstate__(self, state):
+        self.__init__(state['config'], state['clearance'])
+
+
 if __name__ == '__main__':
-    
+
     class FlareSolverrConfig:
         flaresolverr_url: str = 'http://localhost:8191/v1'
         max_timeout = 60
         retry: int = 5
         delay: int = 5
-        
+
     config = FlareSolverrConfig()
-    client = Client(config)
+    client = ClientFactory(config)
     for i in range(2):
-        print(client.get('https://www.google.com/'))
\ No newline at end of file
+        print(client.get('https://www.google.com/'))
@@ -1,13 +1,14 @@
 
 
 import logging
-from typing import List
-from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Tuple, Type
 from sqlalchemy.engine import Engine
-from orm.model import *
 from conf import AppConfig
-from scrapers.client import Client
+from scrapers.client import ClientFactory
 from scrapers.meta import Singleton
+from scrapers.model import AdmissionRecord
+from scrapers.profiling import method_context, span
+from scrapers.sinks import Sink, SqlSink
 from scrapers.webparser import *
 
 
@@ -18,14 +19,36 @@ class Crawler(metaclass=Singleton):
     
     Functions:
         - crawl: process crawling logic, and save the crawled data to the database
+        - fetch_universities: fetch the university list pages of a year
+        - fetch_departments: fetch the department list of one university
+        - admission_page_url: url of the admission list page of a department
+        - crawl_university: crawl the departments and admissions of one university
         - init_parsers: initialize parsers to the crawler
         - get_parser: get a parser by name
+        - save: hand parsed results to every sink (database, NDJSON/CSV files)
+        - record: convert parsed results into an AdmissionRecord
     """
+    # 入學管道代號 (exam, star, cross, vtech, techreg)
+    method = ''
+    # 入學管道名稱 (AdmissionType.name)
+    method_name = ''
+    # 榜單是否需要 OCR (不需要時不初始化 OCR 引擎、不載入 OCR 快取)
+    uses_ocr = False
+    # 榜單解析器 (決定 `scrape.fields` 可以指定的欄位)
+    admission_parser: Type[Parser] = Parser
+    
     def __init__(self, config: AppConfig, db: Engine) -> None:
         self.logger = logging.getLogger('crawler')
         
         self.db = db
-        self.client = Client(config.flaresolverr)
+        # 請求客戶端 (每個執行緒各自的 session，共用 Cloudflare 驗證)
+        self.client = ClientFactory.shared(config.flaresolverr)
+        # 網站根網址 (e.g. https://www.com.tw/)
+        self.base_url = config.scrape.base_url
+        # 爬取結果的輸出 (由 Scraper 依設定檔設定，預設只寫入資料庫)
+        self.sinks: List[Sink] = [SqlSink(db)]
+        # 要解析的欄位 (None 代表全部)
+        self.fields = config.scrape.fields.get(self.method)
         self.parsers = {} 
         self.init_parsers()
     
@@ -41,17 +64,103 @@ class Crawler(metaclass=Singleton):
             raise ValueError(f'Parser {name} is not a {parser_type.__name__}')
         return parser
 
-    def crawl(self, year: str):
+    def save(self, *args):
+        # 輸出到所有 sink (參數同各爬蟲的 `record`)，寫入資料庫的耗時由 sink 或背景寫入執行緒記錄為 save
+        with span('enqueue'):
+            record = self.record(*args)
+            for sink in self.sinks:
+                sink.write(record)
+
+    def record(self, *args) -> AdmissionRecord:
         raise NotImplementedError
+
+    def admission_record(self, year: str, university: SchoolModel, department: Any,
+                         values: Dict[str, Any], rows: List[Dict[str, Any]]) -> AdmissionRecord:
+        # 一個科系的榜單 (values: AdmissionList 欄位) 與上榜人資料 (rows: AdmissionPerson 欄位)
+        return AdmissionRecord(self.method, self.method_name, year, university.school_id, university.school_name,
+                               department.department_id, department.department_name, values, rows)
+
+    def ensure_departments(self, university: SchoolModel, departments: List[Any]):
+        # 爬取榜單前先把該校所有科系交給 sink (資料庫會一次建立缺少的校系)
+        keys = [(university.school_id, department.department_id, university.school_name, department.department_name)
+                for department in departments]
+        for sink in self.sinks:
+            sink.prepare(keys)
+
+    def fetch_universities(self, year: str) -> Dict[str, List[SchoolModel]]:
+        """
+        爬取學校列表，回傳 {學校列表名稱: 學校} (只有學測查榜有普大 '' 與科大 'tech' 兩個列表)
+        """
+        tag = self.method.capitalize()
+        self.logger.info(f'[{tag}] 開始爬取學校列表')
+        university_list_html = self.client.get(self.university_list_url.format(year=year))
+        university_parser = self.get_parser('university', UniversityListParser)
+        university_result = university_parser.parse(university_list_html)
+        if university_result:
+            self.logger.info(f'[{tag}] 爬取學校列表成功, 共計 {len(university_result)} 所學校')
+        else:
+            self.logger.info(f'[{tag}] 爬取學校列表失敗')
+        return {'': university_result or []}
+
+    def fetch_departments(self, year: str, university: SchoolModel, listing: str = '') -> List[Any]:
+        """
+        爬取一所學校的科系列表 (失敗時回傳空列表)
+        """
+        tag = self.method.capitalize()
+        self.logger.info(f'[{tag}] 開始爬取 {university.school_name} 的科系列表')
+        
+        department_list_html = self.client.get(self.department_list_url.format(school_id=university.school_id, year=year))
+        department_parser = self.get_parser('department', Parser)
+        department_result = department_parser.parse(department_list_html)
+        if not department_result:
+            self.logger.info(f'[{tag}] 爬取科系列表失敗')
+            return []
+        self.logger.info(f'[{tag}] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
+        return department_result
+
+    def admission_page_url(self, year: str, department: Any, listing: str = '') -> str:
+        return self.admission_url.format(school_department_id=department.department_id, year=year)
+
+    def crawl_university(self, year: str, university: SchoolModel, listing: str = '') -> int:
+        """
+        爬取一所學校所有科系的榜單，回傳科系數
+        """
+        tag = self.method.capitalize()
+        department_result = self.fetch_departments(year, university, listing)
+        if not department_result:
+            return 0
+        self.ensure_departments(university, department_result)
+        
+        for department in department_result:
+            self.logger.info(f'[{tag}] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
+            
+            # 爬取各個科系的榜單
+            admission_html = self.client.get(self.admission_page_url(year, department, listing))
+            admission_parser = self.get_parser('admission', Parser)
+            admission_result = admission_parser.parse(admission_html)
+            if admission_result:
+                # 存入資料庫
+                self.save(year, university, department, admission_result)
+        return len(department_result)
+
+    def crawl(self, year: str):
+        # 爬取學校列表，再爬取各個學校的科系 (各階段耗時依入學管道分類)
+        with method_context(self.method):
+            for listing, universities in self.fetch_universities(year).items():
+                for university in universities:
+                    self.crawl_university(year, university, listing)
     
 class ExamCrawler(Crawler):
-    
+    method = 'exam'
+    method_name = '分科測驗'
+    admission_parser = ExamAdmissionListParser
+
     def __init__(self, config: AppConfig, db: Engine) -> None:
         super().__init__(config, db)
         
-        self.university_list_url = 'https://www.com.tw/exam/university_list{year}.html'
-        self.department_list_url = 'https://www.com.tw/exam/university_{school_id}_{year}.html'
-        self.admission_url = 'https://www.com.tw/exam/check_{school_department_id}_NO_0_{year}_0_3.html'
+        self.university_list_url = self.base_url + 'exam/university_list{year}.html'
+        self.department_list_url = self.base_url + 'exam/university_{school_id}_{year}.html'
+        self.admission_url = self.base_url + 'exam/check_{school_department_id}_NO_0_{year}_0_3.html'
     
     def init_parsers(self) -> None:
         self.parsers.update({
@@ -60,128 +169,33 @@ class ExamCrawler(Crawler):
             'admission': ExamAdmissionListParser(),
         })
     
-    def crawl(self, year: str):
-        # 爬取學校列表
-        self.logger.info('[Exam] 開始爬取學校列表')
-        university_list_html = self.client.get(self.university_list_url.format(year=year))
-        university_parser = self.get_parser('university', UniversityListParser)
-        university_result = university_parser.parse(university_list_html)
-        if university_result:
-            self.logger.info(f'[Exam] 爬取學校列表成功, 共計 {len(university_result)} 所學校')
-            
-            # 爬取各個學校的科系列表
-            for university in university_result:
-                self.logger.info(f'[Exam] 開始爬取 {university.school_name} 的科系列表')
-                
-                department_list_html = self.client.get(self.department_list_url.format(school_id=university.school_id, year=year))
-                department_parser = self.get_parser('department', ExamDepartmentListParser)
-                department_result = department_parser.parse(department_list_html)
-                if department_result:
-                    self.logger.info(f'[Exam] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
-                    
-                    for department in department_result:
-                        self.logger.info(f'[Exam] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
-                        
-                        # 爬取各個科系的榜單
-                        admission_html = self.client.get(self.admission_url.format(school_department_id=department.department_id, year=year))
-                        admission_parser = self.get_parser('admission', ExamAdmissionListParser)
-                        admission_result = admission_parser.parse(admission_html)
-                        if admission_result:
-                            # 存入資料庫
-                            self.save(year, university, department, admission_result)
-                else:
-                    self.logger.info('[Exam] 爬取科系列表失敗')
-        else:
-            self.logger.info('[Exam] 爬取學校列表失敗')
-    
-    def save(self, year: str, university: SchoolModel, department: ExamDepartmentModel, admissions: ExamAdmissionDetailModel):
-        with Session(self.db) as session:
-            # Step1. 找到入學管道的 id
-            method = session.query(AdmissionType).filter(AdmissionType.name == '分科測驗').first()
-            if not method:
-                # 如果沒有分科測驗的入學管道, 則新增一個
-                session.add(AdmissionType(name='分科測驗'))
-                session.commit()
-                method = session.query(AdmissionType).filter(AdmissionType.name == '分科測驗').first()
-            # Step2. 找到學校的 id
-            school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                            SchoolDepartment.depart_code == department.department_id).first()
-            if not school:
-                # 如果沒有該學校與校系, 則新增一個
-                session.add(SchoolDepartment(school_name=university.school_name, 
-                                             depart_name=department.department_name,
-                                             school_code=university.school_id,
-                                             depart_code=department.department_id))
-                session.commit()
-                school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                                SchoolDepartment.depart_code == department.department_id).first()
-            # Step 3. 存入榜單資訊
-            admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                 AdmissionList.method_id == method.id,
-                                                                 AdmissionList.school_department_id == school.id).first()
-            if not admission_info:
-                session.add(AdmissionList(
-                    year=year,
-                    method_id=method.id,
-                    school_department_id=school.id,
-                    average_score=department.admission_score,
-                    weight=department.admission_weights,
-                    same_grade_order=admissions.order,
-                    general_grade=admissions.general_grade,
-                    native_grade=admissions.native_grade,
-                    veteran_grade=admissions.veteran_grade,
-                    oversea_grade=admissions.oversea_grade,
-                ))
-                session.commit()
-                admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                     AdmissionList.method_id == method.id,
-                                                                     AdmissionList.school_department_id == school.id).first()
-            else:
-                session.query(AdmissionList).filter(AdmissionList.id == admission_info.id).update({
-                    AdmissionList.year: year,
-                    AdmissionList.method_id: method.id,
-                    AdmissionList.school_department_id: school.id,
-                    AdmissionList.average_score: department.admission_score,
-                    AdmissionList.weight: department.admission_weights,
-                    AdmissionList.same_grade_order: admissions.order,
-                    AdmissionList.general_grade: admissions.general_grade,
-                    AdmissionList.native_grade: admissions.native_grade,
-                    AdmissionList.veteran_grade: admissions.veteran_grade,
-                    AdmissionList.oversea_grade: admissions.oversea_grade,
-                })
-                session.commit()
-                
-            # Step 4. 存入上榜資訊
-            for admission in admissions.admission_list:
-                person = session.query(AdmissionPerson).filter(AdmissionPerson.admission_list_id == admission_info.id,
-                                                               AdmissionPerson.admission_ticket == admission.ticket).first()
-                if not person:
-                    try:
-                        session.add(AdmissionPerson(
-                            admission_list_id=admission_info.id,
-                            admission_ticket=admission.ticket,
-                            exam_area=admission.exam_area,
-                            admission_status='已錄取',
-                        ))
-                    except ValueError as e:
-                        self.logger.warning('[Exam] 存入錄取資訊失敗, 原因: {}, 可能是欄位錯誤'.format(e))
-                else:
-                    session.query(AdmissionPerson).filter(AdmissionPerson.id == person.id).update({
-                        AdmissionPerson.admission_list_id: admission_info.id,
-                        AdmissionPerson.admission_ticket: admission.ticket,
-                        AdmissionPerson.exam_area: admission.exam_area,
-                        AdmissionPerson.admission_status: '已錄取',
-                    })
-            session.commit()
+    def record(self, year: str, university: SchoolModel, department: ExamDepartmentModel, admissions: ExamAdmissionDetailModel) -> AdmissionRecord:
+        return self.admission_record(year, university, department, {
+            'average_score': department.admission_score,
+            'weight': department.admission_weights,
+            'same_grade_order': admissions.order,
+            'general_grade': admissions.general_grade,
+            'native_grade': admissions.native_grade,
+            'veteran_grade': admissions.veteran_grade,
+            'oversea_grade': admissions.oversea_grade,
+        }, [{
+            'admission_ticket': admission.ticket,
+            'exam_area': admission.exam_area,
+            'admission_status': '已錄取',
+        } for admission in admissions.admission_list])
+
 
 class StarCrawler(Crawler):
-    
+    method = 'star'
+    method_name = '大學繁星'
+    admission_parser = StarAdmissionListParser
+
     def __init__(self, config: AppConfig, db: Engine) -> None:
         super().__init__(config, db)
         
-        self.university_list_url = 'https://www.com.tw/star/university_list{year}.html'
-        self.department_list_url = 'https://www.com.tw/star/university_{school_id}_{year}.html'
-        self.admission_url = 'https://www.com.tw/star/check_{school_department_id}_NO_0_{year}_0_3.html'
+        self.university_list_url = self.base_url + 'star/university_list{year}.html'
+        self.department_list_url = self.base_url + 'star/university_{school_id}_{year}.html'
+        self.admission_url = self.base_url + 'star/check_{school_department_id}_NO_0_{year}_0_3.html'
     
     def init_parsers(self) -> None:
         self.parsers.update({
@@ -190,387 +204,152 @@ class StarCrawler(Crawler):
             'admission': StarAdmissionListParser(),
         })
     
-    def crawl(self, year: str):
-        # 爬取學校列表
-        self.logger.info('[Star] 開始爬取學校列表')
-        university_list_html = self.client.get(self.university_list_url.format(year=year))
-        university_parser = self.get_parser('university', UniversityListParser)
-        university_result = university_parser.parse(university_list_html)
-        if university_result:
-            self.logger.info(f'[Star] 爬取學校列表成功, 共計 {len(university_result)} 所學校')
-            
-            # 爬取各個學校的科系列表
-            for university in university_result:
-                self.logger.info(f'[Star] 開始爬取 {university.school_name} 的科系列表')
-                
-                department_list_html = self.client.get(self.department_list_url.format(school_id=university.school_id, year=year))
-                department_parser = self.get_parser('department', StarDepartmentListParser)
-                department_result = department_parser.parse(department_list_html)
-                if department_result:
-                    self.logger.info(f'[Star] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
-                    
-                    for department in department_result:
-                        self.logger.info(f'[Star] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
-                        
-                        # 爬取各個科系的榜單
-                        admission_html = self.client.get(self.admission_url.format(school_department_id=department.department_id, year=year))
-                        admission_parser = self.get_parser('admission', StarAdmissionListParser)
-                        admission_result = admission_parser.parse(admission_html)
-                        if admission_result:
-                            # 存入資料庫
-                            self.save(year, university, department, admission_result)
-                else:
-                    self.logger.info('[Star] 爬取科系列表失敗')
-        else:
-            self.logger.info('[Star] 爬取學校列表失敗')
-    
-    def save(self, year: str, university: SchoolModel, department: StarDepartmentModel, admissions: List[StarAdmissionModel]):
-        with Session(self.db) as session:
-            # Step1. 找到入學管道的 id
-            method = session.query(AdmissionType).filter(AdmissionType.name == '大學繁星').first()
-            if not method:
-                # 如果沒有大學繁星的入學管道, 則新增一個
-                session.add(AdmissionType(name='大學繁星'))
-                session.commit()
-                method = session.query(AdmissionType).filter(AdmissionType.name == '大學繁星').first()
-            # Step2. 找到學校的 id
-            school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                            SchoolDepartment.depart_code == department.department_id).first()
-            if not school:
-                # 如果沒有該學校與校系, 則新增一個
-                session.add(SchoolDepartment(school_name=university.school_name, 
-                                             depart_name=department.department_name,
-                                             school_code=university.school_id,
-                                             depart_code=department.department_id))
-                session.commit()
-                school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                                SchoolDepartment.depart_code == department.department_id).first()
-            # Step 3. 存入榜單資訊
-            admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                 AdmissionList.method_id == method.id,
-                                                                 AdmissionList.school_department_id == school.id).first()
-            if not admission_info:
-                session.add(AdmissionList(
-                    year=year,
-                    method_id=method.id,
-                    school_department_id=school.id,
-                ))
-                session.commit()
-                admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                     AdmissionList.method_id == method.id,
-                                                                     AdmissionList.school_department_id == school.id).first()
-            else:
-                session.query(AdmissionList).filter(AdmissionList.id == admission_info.id).update({
-                    AdmissionList.year: year,
-                    AdmissionList.method_id: method.id,
-                    AdmissionList.school_department_id: school.id,
-                })
-                session.commit()
-            # Step 4. 存入上榜資訊
-            for admission in admissions:
-                person = session.query(AdmissionPerson).filter(AdmissionPerson.admission_list_id == admission_info.id,
-                                                               AdmissionPerson.admission_ticket == admission.ticket).first()
-                if not person:
-                    try:
-                        session.add(AdmissionPerson(
-                            admission_list_id=admission_info.id,
-                            admission_ticket=admission.ticket,
-                            exam_area=admission.exam_area,
-                            admission_status='已錄取',
-                        ))
-                    except ValueError as e:
-                        self.logger.warning('[Star] 存入錄取資訊失敗, 原因: {}, 可能是欄位錯誤'.format(e))
-                else:
-                    session.query(AdmissionPerson).filter(AdmissionPerson.id == person.id).update({
-                        AdmissionPerson.admission_list_id: admission_info.id,
-                        AdmissionPerson.admission_ticket: admission.ticket,
-                        AdmissionPerson.exam_area: admission.exam_area,
-                        AdmissionPerson.admission_status: '已錄取',
-                    })
-            session.commit()
-            
+    def record(self, year: str, university: SchoolModel, department: StarDepartmentModel, admissions: List[StarAdmissionModel]) -> AdmissionRecord:
+        return self.admission_record(year, university, department, {}, [{
+            'admission_ticket': admission.ticket,
+            'exam_area': admission.exam_area,
+            'admission_status': '已錄取',
+        } for admission in admissions])
+
+
 class CrossCrawler(Crawler):
+    method = 'cross'
+    method_name = '學測查榜'
+    uses_ocr = True
+    admission_parser = CrossAdmissionListParser
+
     def __init__(self, config: AppConfig, db: Engine) -> None:
         super().__init__(config, db)
         
-        self.university_list_url = 'https://www.com.tw/cross/university_list{year}.html'
-        self.university_tech_list_url = 'https://www.com.tw/cross/tech_university_list{year}.html'
+        self.university_list_url = self.base_url + 'cross/university_list{year}.html'
+        self.university_tech_list_url = self.base_url + 'cross/tech_university_list{year}.html'
         
-        self.department_list_url = 'https://www.com.tw/cross/university_{school_id}_{year}.html'
-        self.department_tech_list_url = 'https://www.com.tw/cross/university_1{school_id}_{year}.html'
+        self.department_list_url = self.base_url + 'cross/university_{school_id}_{year}.html'
+        self.department_tech_list_url = self.base_url + 'cross/university_1{school_id}_{year}.html'
         
-        self.admission_url = 'https://www.com.tw/cross/check_{school_department_id}_NO_1_{year}_0_0.html'
-        self.admission_tech_url = 'https://www.com.tw/cross/check_1{school_department_id}_NO_1_{year}_1_1.html'
+        self.admission_url = self.base_url + 'cross/check_{school_department_id}_NO_1_{year}_0_0.html'
+        self.admission_tech_url = self.base_url + 'cross/check_1{school_department_id}_NO_1_{year}_1_1.html'
     
     def init_parsers(self) -> None:
         self.parsers.update({
             'university': UniversityListParser(),
             'department': CrossDepartmentListParser(),
-            'admission': CrossAdmissionListParser(),
+            'admission': CrossAdmissionListParser(self.fields),
         })
     
-    def crawl(self, year: str):
-        # 爬取普通大學的榜單
+    def fetch_universities(self, year: str) -> Dict[str, List[SchoolModel]]:
+        # 普通大學與科技大學各有一個學校列表
+        university_parser = self.get_parser('university', UniversityListParser)
         self.logger.info('[Cross] 開始爬取普大個人申請學校列表')
         university_list_html = self.client.get(self.university_list_url.format(year=year))
-        university_parser = self.get_parser('university', UniversityListParser)
         university_result = university_parser.parse(university_list_html)
         if university_result:
             self.logger.info(f'[Cross] 爬取普大學校列表成功, 共計 {len(university_result)} 所學校')
-            
-            # 爬取各個學校的科系列表
-            for university in university_result:
-                self.logger.info(f'[Cross] 開始爬取 {university.school_name} 的科系列表')
-                
-                department_list_html = self.client.get(self.department_list_url.format(school_id=university.school_id, year=year))
-                department_parser = self.get_parser('department', CrossDepartmentListParser)
-                department_result = department_parser.parse(department_list_html)
-                if department_result:
-                    self.logger.info(f'[Cross] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
-                    
-                    for department in department_result:
-                        self.logger.info(f'[Cross] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
-                        
-                        # 爬取各個科系的榜單
-                        admission_html = self.client.get(self.admission_url.format(school_department_id=department.department_id, year=year))
-                        admission_parser = self.get_parser('admission', CrossAdmissionListParser)
-                        admission_result = admission_parser.parse(admission_html)
-                        if admission_result:
-                            # 存入資料庫
-                            self.save(year, university, department, admission_result, False)
-                else:
-                    self.logger.info('[Cross] 爬取普大科系列表失敗')
         else:
             self.logger.info('[Cross] 爬取普大學校列表失敗')
             
-        # 爬取科技大學的榜單
         self.logger.info('[Cross] 開始爬取科技大學個人申請學校列表')
         tech_list_html = self.client.get(self.university_tech_list_url.format(year=year))
         tech_result = university_parser.parse(tech_list_html)
         if tech_result:
             self.logger.info(f'[Cross] 爬取科技大學列表成功, 共計 {len(tech_result)} 所學校')
-            
-            for university in tech_result:
-                self.logger.info(f'[Cross] 開始爬取 {university.school_name} 的科系列表')
-                
-                tech_department_list_html = self.client.get(self.department_tech_list_url.format(school_id=university.school_id, year=year))
-                tech_department_result = department_parser.parse(tech_department_list_html)
-                if tech_department_result:
-                    self.logger.info(f'[Cross] 爬取 {university.school_name} 的科系列表成功, 共計 {len(tech_department_result)} 個科系')
-                    
-                    for department in tech_department_result:
-                        self.logger.info(f'[Cross] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
-                        
-                        admission_html = self.client.get(self.admission_tech_url.format(school_department_id=department.department_id, year=year))
-                        admission_result = admission_parser.parse(admission_html)
-                        if admission_result:
-                            self.save(year, university, department, admission_result, True)
-                else:
-                    self.logger.info('[Cross] 爬取科技大學科系列表失敗')
         else:
             self.logger.info('[Cross] 爬取科技大學學校列表失敗')
+        return {'': university_result or [], 'tech': tech_result or []}
+    
+    def fetch_departments(self, year: str, university: SchoolModel, listing: str = '') -> List[CrossDepartmentModel]:
+        is_tech_university = listing == 'tech'
+        kind = '科技大學' if is_tech_university else '普大'
+        department_list_url = self.department_tech_list_url if is_tech_university else self.department_list_url
+        self.logger.info(f'[Cross] 開始爬取 {university.school_name} 的科系列表')
         
+        department_list_html = self.client.get(department_list_url.format(school_id=university.school_id, year=year))
+        department_parser = self.get_parser('department', CrossDepartmentListParser)
+        department_result = department_parser.parse(department_list_html)
+        if not department_result:
+            self.logger.info(f'[Cross] 爬取{kind}科系列表失敗')
+            return []
+        self.logger.info(f'[Cross] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
+        return department_result
+    
+    def admission_page_url(self, year: str, department: CrossDepartmentModel, listing: str = '') -> str:
+        admission_url = self.admission_tech_url if listing == 'tech' else self.admission_url
+        return admission_url.format(school_department_id=department.department_id, year=year)
+    
+    def crawl_university(self, year: str, university: SchoolModel, listing: str = '') -> int:
+        is_tech_university = listing == 'tech'
+        department_result = self.fetch_departments(year, university, listing)
+        if not department_result:
+            return 0
+        self.ensure_departments(university, department_result)
+        
+        for department in department_result:
+            self.logger.info(f'[Cross] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
+            
+            # 爬取各個科系的榜單
+            admission_html = self.client.get(self.admission_page_url(year, department, listing))
+            admission_parser = self.get_parser('admission', CrossAdmissionListParser)
+            admission_result = admission_parser.parse(admission_html)
+            if admission_result:
+                # 存入資料庫
+                self.save(year, university, department, admission_result, is_tech_university)
+        return len(department_result)
     
-    def save(self, year: str, university: SchoolModel, department: CrossDepartmentModel, admissions: List[CrossAdmissionModel], is_tech_university: bool = False):
-        with Session(self.db) as session:
-            # Step1. 找到入學管道的 id
-            method = session.query(AdmissionType).filter(AdmissionType.name == '學測查榜').first()
-            if not method:
-                # 如果沒有學測查榜的入學管道, 則新增一個
-                session.add(AdmissionType(name='學測查榜'))
-                session.commit()
-                method = session.query(AdmissionType).filter(AdmissionType.name == '學測查榜').first()
-            # Step2. 找到學校的 id
-            school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                            SchoolDepartment.depart_code == department.department_id).first()
-            if not school:
-                # 如果沒有該學校與校系, 則新增一個
-                session.add(SchoolDepartment(school_name=university.school_name, 
-                                             depart_name=department.department_name,
-                                             school_code=university.school_id,
-                                             depart_code=department.department_id))
-                session.commit()
-                school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                                SchoolDepartment.depart_code == department.department_id).first()
-            # Step 3. 存入榜單資訊
-            admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                 AdmissionList.method_id == method.id,
-                                                                 AdmissionList.school_department_id == school.id).first()
-            if not admission_info:
-                session.add(AdmissionList(
-                    year=year,
-                    method_id=method.id,
-                    school_department_id=school.id,
-                    university_apply='大學個人申請' if not is_tech_university else '科大四技申請'
-                ))
-                session.commit()
-                admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                     AdmissionList.method_id == method.id,
-                                                                     AdmissionList.school_department_id == school.id).first()
-            else:
-                session.query(AdmissionList).filter(AdmissionList.id == admission_info.id).update({
-                    AdmissionList.year: year,
-                    AdmissionList.method_id: method.id,
-                    AdmissionList.school_department_id: school.id,
-                    AdmissionList.university_apply: '大學個人申請' if not is_tech_university else '科大四技申請',
-                })
-                session.commit()
-                
-            # Step 4. 存入上榜資訊
-            for admission in admissions:
-                for school in admission.schools:
-                    if school.school_name == university.school_name and school.department_name == department.department_name:
-                        person = session.query(AdmissionPerson).filter(AdmissionPerson.admission_list_id == admission_info.id,
-                                                                        AdmissionPerson.admission_ticket == admission.ticket).first()
-                        if not person:
-                            try:
-                                session.add(AdmissionPerson(
-                                    admission_list_id=admission_info.id,
-                                    admission_ticket=admission.ticket,
-                                    name=admission.name,
-                                    exam_area=admission.exam_area,
-                                    admission_status=school.status,
-                                ))
-                            except ValueError as e:
-                                self.logger.warning('[Cross] 存入錄取資訊失敗, 原因: {}, 可能是欄位錯誤'.format(e))
-                        else:
-                            session.query(AdmissionPerson).filter(AdmissionPerson.id == person.id).update({
-                                AdmissionPerson.admission_list_id: admission_info.id,
-                                AdmissionPerson.admission_ticket: admission.ticket,
-                                AdmissionPerson.name: admission.name,
-                                AdmissionPerson.exam_area: admission.exam_area,
-                                AdmissionPerson.admission_status: school.status,
-                            })
-            session.commit()
+    def record(self, year: str, university: SchoolModel, department: CrossDepartmentModel, admissions: List[CrossAdmissionModel], is_tech_university: bool = False) -> AdmissionRecord:
+        return self.admission_record(year, university, department, {
+            'university_apply': '大學個人申請' if not is_tech_university else '科大四技申請',
+        }, [{
+            'admission_ticket': admission.ticket,
+            'name': admission.name,
+            'exam_area': admission.exam_area,
+            'admission_status': school.status,
+        } for admission in admissions for school in admission.schools
+            if school.school_name == university.school_name and school.department_name == department.department_name])
+
 
 class VtechCrawler(Crawler):
+    method = 'vtech'
+    method_name = '統測甄選'
+    uses_ocr = True
+    admission_parser = VtechAdmissionParser
+
     def __init__(self, config: AppConfig, db: Engine) -> None:
         super().__init__(config, db)
         
-        self.university_list_url = 'https://www.com.tw/vtech/university_list{year}.html'
-        self.department_list_url = 'https://www.com.tw/vtech/university_{school_id}_{year}.html'
-        self.admission_url = 'https://www.com.tw/vtech/check_{school_department_id}_NO_1_{year}_1_3.html'
+        self.university_list_url = self.base_url + 'vtech/university_list{year}.html'
+        self.department_list_url = self.base_url + 'vtech/university_{school_id}_{year}.html'
+        self.admission_url = self.base_url + 'vtech/check_{school_department_id}_NO_1_{year}_1_3.html'
     
     def init_parsers(self) -> None:
         self.parsers.update({
             'university': UniversityListParser(),
             'department': VtechDepartmentListParser(),
-            'admission': VtechAdmissionParser(),
+            'admission': VtechAdmissionParser(self.fields),
         })
     
-    def crawl(self, year: str):
-        self.logger.info('[Vtech] 開始爬取學校列表')
-        university_list_html = self.client.get(self.university_list_url.format(year=year))
-        university_parser = self.get_parser('university', UniversityListParser)
-        university_result = university_parser.parse(university_list_html)
-        if university_result:
-            self.logger.info(f'[Vtech] 爬取學校列表成功, 共計 {len(university_result)} 所學校')
-            
-            # 爬取各個學校的科系列表
-            for university in university_result:
-                self.logger.info(f'[Vtech] 開始爬取 {university.school_name} 的科系列表')
-                
-                department_list_html = self.client.get(self.department_list_url.format(school_id=university.school_id, year=year))
-                department_parser = self.get_parser('department', VtechDepartmentListParser)
-                department_result = department_parser.parse(department_list_html)
-                if department_result:
-                    self.logger.info(f'[Vtech] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
-                    
-                    for department in department_result:
-                        self.logger.info(f'[Vtech] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
-                        
-                        # 爬取各個科系的榜單
-                        admission_html = self.client.get(self.admission_url.format(school_department_id=department.department_id, year=year))
-                        admission_parser = self.get_parser('admission', VtechAdmissionParser)
-                        admission_result = admission_parser.parse(admission_html)
-                        if admission_result:
-                            # 存入資料庫
-                            self.save(year, university, department, admission_result)
-                else:
-                    self.logger.info('[Vtech] 爬取科系列表失敗')
-        else:
-            self.logger.info('[Vtech] 爬取學校列表失敗')
-            
-    def save(self, year: str, university: SchoolModel, department: VtechDepartmentModel, admissions: List[VtechAdmissionModel]):
-        with Session(self.db) as session:
-            # Step1. 找到入學管道的 id
-            method = session.query(AdmissionType).filter(AdmissionType.name == '統測甄選').first()
-            if not method:
-                # 如果沒有統測甄選的入學管道, 則新增一個
-                session.add(AdmissionType(name='統測甄選'))
-                session.commit()
-                method = session.query(AdmissionType).filter(AdmissionType.name == '統測甄選').first()
-            # Step2. 找到學校的 id
-            school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                            SchoolDepartment.depart_code == department.department_id).first()
-            if not school:
-                # 如果沒有該學校與校系, 則新增一個
-                session.add(SchoolDepartment(school_name=university.school_name, 
-                                             depart_name=department.department_name,
-                                             school_code=university.school_id,
-                                             depart_code=department.department_id))
-                session.commit()
-                school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                                SchoolDepartment.depart_code == department.department_id).first()
-            # Step 3. 存入榜單資訊
-            admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                 AdmissionList.method_id == method.id,
-                                                                 AdmissionList.school_department_id == school.id).first()
-            if not admission_info:
-                session.add(AdmissionList(
-                    year=year,
-                    method_id=method.id,
-                    school_department_id=school.id,
-                    group_code=department.group,
-                ))
-                session.commit()
-                admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                     AdmissionList.method_id == method.id,
-                                                                     AdmissionList.school_department_id == school.id).first()
-            else:
-                session.query(AdmissionList).filter(AdmissionList.id == admission_info.id).update({
-                    AdmissionList.year: year,
-                    AdmissionList.method_id: method.id,
-                    AdmissionList.school_department_id: school.id,
-                    AdmissionList.group_code: department.group,
-                })
-                session.commit()
-                
-            # Step 4. 存入上榜資訊
-            for admission in admissions:
-                for school in admission.schools:
-                    if school.school_name == university.school_name and school.department_name == department.department_name:
-                        person = session.query(AdmissionPerson).filter(AdmissionPerson.admission_list_id == admission_info.id,
-                                                                        AdmissionPerson.admission_ticket == admission.ticket).first()
-                        if not person:
-                            try:
-                                session.add(AdmissionPerson(
-                                    admission_list_id=admission_info.id,
-                                    admission_ticket=admission.ticket,
-                                    name=admission.name,
-                                    admission_status=school.status,
-                                    second_stage_status=school.status,
-                                ))
-                            except ValueError as e:
-                                self.logger.warning('[Vtech] 存入錄取資訊失敗, 原因: {}, 可能是欄位錯誤'.format(e))
-                        else:
-                            session.query(AdmissionPerson).filter(AdmissionPerson.id == person.id).update({
-                                AdmissionPerson.admission_list_id: admission_info.id,
-                                AdmissionPerson.admission_ticket: admission.ticket,
-                                AdmissionPerson.name: admission.name,
-                                AdmissionPerson.admission_status: school.status,
-                                AdmissionPerson.second_stage_status: school.status,
-                            })
-            session.commit()
+    def record(self, year: str, university: SchoolModel, department: VtechDepartmentModel, admissions: List[VtechAdmissionModel]) -> AdmissionRecord:
+        return self.admission_record(year, university, department, {
+            'group_code': department.group,
+        }, [{
+            'admission_ticket': admission.ticket,
+            'name': admission.name,
+            'admission_status': school.status,
+            'second_stage_status': school.status,
+        } for admission in admissions for school in admission.schools
+            if school.school_name == university.school_name and school.department_name == department.department_name])
+
 
-        
 class TechregCrawler(Crawler):
+    method = 'techreg'
+    method_name = '統測分發'
+    admission_parser = TechregAdmissionParser
+
     def __init__(self, config: AppConfig, db: Engine) -> None:
         super().__init__(config, db)    
         
-        self.university_list_url = 'https://www.com.tw/techreg/university_list{year}.html'
-        self.department_list_url = 'https://www.com.tw/techreg/university_{school_id}_{year}.html'
-        self.admission_url = 'https://www.com.tw/techreg/check_{school_department_id}_{year}.html'
+        self.university_list_url = self.base_url + 'techreg/university_list{year}.html'
+        self.department_list_url = self.base_url + 'techreg/university_{school_id}_{year}.html'
+        self.admission_url = self.base_url + 'techreg/check_{school_department_id}_{year}.html'
 
     def init_parsers(self) -> None:
         self.parsers.update({
@@ -579,113 +358,31 @@ class TechregCrawler(Crawler):
             'admission': TechregAdmissionParser(),
         })
     
-    def crawl(self, year: str):
-        self.logger.info('[Techreg] 開始爬取學校列表')
-        university_list_html = self.client.get(self.university_list_url.format(year=year))
-        university_parser = self.get_parser('university', UniversityListParser)
-        university_result = university_parser.parse(university_list_html)
-        if university_result:
-            self.logger.info(f'[Techreg] 爬取學校列表成功, 共計 {len(university_result)} 所學校')
-            
-            # 爬取各個學校的科系列表
-            for university in university_result:
-                self.logger.info(f'[Techreg] 開始爬取 {university.school_name} 的科系列表')
-                
-                department_list_html = self.client.get(self.department_list_url.format(school_id=university.school_id, year=year))
-                department_parser = self.get_parser('department', TechregDepartmentParser)
-                department_result = department_parser.parse(department_list_html)
-                if department_result:
-                    self.logger.info(f'[Techreg] 爬取 {university.school_name} 的科系列表成功, 共計 {len(department_result)} 個科系')
-                    
-                    for department in department_result:
-                        self.logger.info(f'[Techreg] 現在爬取學校科系: {university.school_name} {department.department_name} 年度: {year}')
-                        
-                        # 爬取各個科系的榜單
-                        admission_html = self.client.get(self.admission_url.format(school_department_id=department.department_id, year=year))
-                        admission_parser = self.get_parser('admission', TechregAdmissionParser)
-                        admission_result = admission_parser.parse(admission_html)
-                        if admission_result:
-                            # 存入資料庫
-                            self.save(year, university, department, admission_result)
-                else:
-                    self.logger.info('[Techreg] 爬取科系列表失敗')
-        else:
-            self.logger.info('[Techreg] 爬取學校列表失敗')
-            
-    def save(self, year: str, university: SchoolModel, department: TechregDepartmentModel, admissions: TechregAdmissionDetailModel):
-        with Session(self.db) as session:
-            # Step1. 找到入學管道的 id
-            method = session.query(AdmissionType).filter(AdmissionType.name == '統測分發').first()
-            if not method:
-                # 如果沒有統測分發的入學管道, 則新增一個
-                session.add(AdmissionType(name='統測分發'))
-                session.commit()
-                method = session.query(AdmissionType).filter(AdmissionType.name == '統測分發').first()
-            # Step2. 找到學校的 id
-            school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                            SchoolDepartment.depart_code == department.department_id).first()
-            if not school:
-                # 如果沒有該學校與校系, 則新增一個
-                session.add(SchoolDepartment(school_name=university.school_name, 
-                                             depart_name=department.department_name,
-                                             school_code=university.school_id,
-                                             depart_code=department.department_id))
-                session.commit()
-                school = session.query(SchoolDepartment).filter(SchoolDepartment.school_code == university.school_id, 
-                                                                SchoolDepartment.depart_code == department.department_id).first()
-            # Step 3. 存入榜單資訊
-            admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                 AdmissionList.method_id == method.id,
-                                                                 AdmissionList.school_department_id == school.id).first()
-            if not admission_info:
-                session.add(AdmissionList(
-                    year=year,
-                    method_id=method.id,
-                    school_department_id=school.id,
-                    group_code=department.group,
-                    average_score=department.average_score,
-                    general_grade=admissions.general_grade,
-                    native_grade=admissions.native_grade,
-                    veteran_grade=admissions.veteran_grade,
-                    oversea_grade=admissions.oversea_grade,
-                ))
-                session.commit()
-                admission_info = session.query(AdmissionList).filter(AdmissionList.year == year,
-                                                                     AdmissionList.method_id == method.id,
-                                                                     AdmissionList.school_department_id == school.id).first()
-            else:
-                session.query(AdmissionList).filter(AdmissionList.id == admission_info.id).update({
-                    AdmissionList.year: year,
-                    AdmissionList.method_id: method.id,
-                    AdmissionList.school_department_id: school.id,
-                    AdmissionList.group_code: department.group,
-                    AdmissionList.average_score: department.average_score,
-                    AdmissionList.general_grade: admissions.general_grade,
-                    AdmissionList.native_grade: admissions.native_grade,
-                    AdmissionList.veteran_grade: admissions.veteran_grade,
-                    AdmissionList.oversea_grade: admissions.oversea_grade,
-                })
-                session.commit()
-                
-            # Step 4. 存入上榜資訊
-            for admission in admissions.admission_list:
-                person = session.query(AdmissionPerson).filter(AdmissionPerson.admission_list_id == admission_info.id,
-                                                               AdmissionPerson.admission_ticket == admission.ticket).first()
-                if not person:
-                    try:
-                        session.add(AdmissionPerson(
-                            admission_list_id=admission_info.id,
-                            admission_ticket=admission.ticket,
-                            name=admission.name,
-                            admission_status='已錄取',
-                        ))
-                    except ValueError as e:
-                        self.logger.warning('[Techreg] 存入錄取資訊失敗, 原因: {}, 可能是欄位錯誤'.format(e))
-                else:
-                    session.query(AdmissionPerson).filter(AdmissionPerson.id == person.id).update({
-                        AdmissionPerson.admission_list_id: admission_info.id,
-                        AdmissionPerson.admission_ticket: admission.ticket,
-                        AdmissionPerson.name: admission.name,
-                        AdmissionPerson.admission_status: '已錄取',
-                    })
-            session.commit()
\ No newline at end of file
+    def record(self, year: str, university: SchoolModel, department: TechregDepartmentModel, admissions: TechregAdmissionDetailModel) -> AdmissionRecord:
+        return self.admission_record(year, university, department, {
+            'group_code': department.group,
+            'average_score': department.average_score,
+            'general_grade': admissions.general_grade,
+            'native_grade': admissions.native_grade,
+            'veteran_grade': admissions.veteran_grade,
+            'oversea_grade': admissions.oversea_grade,
+        }, [{
+            'admission_ticket': admission.ticket,
+            'name': admission.name,
+            'admission_status': '已錄取',
+        } for admission in admissions.admission_list])
+
+
+def field_names() -> Dict[str, Tuple[str, ...]]:
+    # 各入學管道可以指定的欄位 (榜單解析器一定會解析與可以略過的欄位)
+    return {crawler.method: crawler.admission_parser.field_names() for crawler in Crawler.__subclasses__()}
+
+def check_fields(fields: Dict[str, List[str]]):
+    # 檢查 `scrape.fields` 的入學管道與欄位名稱，未知的名稱拋出 ValueError
+    known = field_names()
+    for method, names in fields.items():
+        if method not in known:
+            raise ValueError(f'unknown method: {method} (expected one of: {", ".join(known)})')
+        unknown = [name for name in names if name not in known[method]]
+        if unknown:
+            raise ValueError(f'unknown fields for {method}: {", ".join(unknown)} (expected: {", ".join(known[method])})')
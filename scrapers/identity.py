@@ -0,0 +1,123 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from orm.model import AdmissionType, SchoolDepartment
+from scrapers.meta import Singleton
+
+
+# (學校代碼, 校系代碼, 學校名稱, 系所名稱)
+DepartmentKey = Tuple[str, str, str, str]
+
+class IdentityMap(metaclass=Singleton):
+    """
+    IdentityMap caches the ids of the dimension tables (AdmissionType, SchoolDepartment) for the whole run.
+    Both tables are preloaded with one query each, ids are resolved in memory,
+    and missing rows are created in batches.
+
+    Rows created inside a session stay private to that session until it commits,
+    so a rolled back transaction never leaves stale ids in the cache.
+
+    Functions:
+        - method_id: get (or create) the id of an admission method
+        - department_ids: get (or create) the ids of many school departments at once
+        - department_id: get (or create) the id of a school department
+    """
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('identity')
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.methods: Dict[str, int] = {}
+        self.departments: Dict[Tuple[str, str], int] = {}
+
+    def preload(self, session: Session):
+        with self.lock:
+            if self.loaded:
+                return
+            self.methods = dict(session.query(AdmissionType.name, AdmissionType.id))
+            self.departments = {(school_code, depart_code): id for id, school_code, depart_code in
+                                session.query(SchoolDepartment.id, SchoolDepartment.school_code, SchoolDepartment.depart_code)}
+            self.loaded = True
+            self.logger.info(f'預先載入 {len(self.methods)} 個入學管道、{len(self.departments)} 個校系')
+
+    def method_id(self, session: Session, name: str) -> int:
+        self.preload(session)
+        pending = self._pending(session)
+        with self.lock:
+            method_id = self.methods.get(name, pending['methods'].get(name))
+        if method_id is None:
+            # 如果沒有該入學管道, 則新增一個
+            method_id = session.execute(insert(AdmissionType.__table__).values(Name=name)).inserted_primary_key[0]
+            pending['methods'][name] = method_id
+        return method_id
+
+    def department_ids(self, session: Session, departments: Iterable[DepartmentKey],
+                       created: Optional[Dict[Tuple[str, str], int]] = None) -> Dict[Tuple[str, str], int]:
+        # created: 有提供時加入這次新增的校系
+        self.preload(session)
+        pending = self._pending(session)
+        result, missing = {}, {}
+        with self.lock:
+            for school_code, depart_code, school_name, depart_name in departments:
+                key = (school_code, depart_code)
+                department_id = self.departments.get(key, pending['departments'].get(key))
+                if department_id is None:
+                    missing[key] = (school_code, depart_code, school_name, depart_name)
+                else:
+                    result[key] = department_id
+        if missing:
+            # 如果沒有該學校與校系, 則批次新增
+            inserted = self._create_departments(session, list(missing.values()))
+            pending['departments'].update(inserted)
+            result.update(inserted)
+            if created is not None:
+                created.update(inserted)
+        return result
+
+    def department_id(self, session: Session, school_code: str, depart_code: str, school_name: str, depart_name: str) -> int:
+        return self.department_ids(session, [(school_code, depart_code, school_name, depart_name)])[(school_code, depart_code)]
+
+    def clear(self):
+        with self.lock:
+            self.loaded = False
+            self.methods, self.departments = {}, {}
+
+    def _create_departments(self, session: Session, rows: List[DepartmentKey]) -> Dict[Tuple[str, str], int]:
+        table = SchoolDepartment.__table__
+        values = [{'SchoolCode': school_code, 'DepartmentCode': depart_code, 'SchoolName': school_name, 'DepartmentName': depart_name}
+                  for school_code, depart_code, school_name, depart_name in rows]
+        if session.bind.dialect.name == 'postgresql':
+            # 一次 INSERT ... RETURNING 取回所有 ID
+            returned = session.execute(insert(table).values(values).returning(table.c.Id, table.c.SchoolCode, table.c.DepartmentCode))
+            return {(school_code, depart_code): id for id, school_code, depart_code in returned}
+
+        # 其他資料庫: executemany 新增後，再用一次查詢取回 ID
+        session.execute(insert(table), values)
+        wanted = {(row[0], row[1]) for row in rows}
+        return {(school_code, depart_code): id for id, school_code, depart_code in
+                session.query(SchoolDepartment.id, SchoolDepartment.school_code, SchoolDepartment.depart_code)
+                       .filter(SchoolDepartment.school_code.in_({row[0] for row in rows}))
+                if (school_code, depart_code) in wanted}
+
+    def _pending(self, session: Session) -> Dict[str, Dict]:
+        # 尚未 commit 的新 ID 只放在該 session，commit 後才放進共用快取
+        pending = session.info.get('identity_pending')
+        if pending is None:
+            pending = session.info['identity_pending'] = {'methods': {}, 'departments': {}}
+            event.listen(session, 'after_commit', self._on_commit)
+            event.listen(session, 'after_rollback', self._on_rollback)
+        return pending
+
+    def _on_commit(self, session: Session):
+        pending = session.info.get('identity_pending')
+        if pending:
+            with self.lock:
+                self.methods.update(pending['methods'])
+                self.departments.update(pending['departments'])
+            pending['methods'], pending['departments'] = {}, {}
+
+    def _on_rollback(self, session: Session):
+        pending = session.info.get('identity_pending')
+        if pending:
+            pending['methods'], pending['departments'] = {}, {}
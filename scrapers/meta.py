@@ -7,7 +7,7 @@ class Singleton(type):
     """
     
     __instance = {}
-    __lock = threading.Lock()
+    __lock = threading.RLock()
     
     def __call__(cls, *args, **kwargs):
         if cls not in cls.__instance:
@@ -0,0 +1,286 @@
+import math
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from scrapers.meta import Singleton
+
+
+"""
+執行指標 (metrics)
+
+行程內的指標登錄表 (counter、gauge、histogram，可加上 label)，各模組在 import 時登錄自己的指標並在執行時更新，
+可選擇啟動本機的 HTTP exporter，以 Prometheus 的文字格式 (text exposition format 0.0.4) 在 `/metrics` 輸出，
+不需要另外安裝 prometheus_client。
+
+每秒請求數等比率由 Prometheus 以 counter 計算 (e.g. `rate(scraper_client_requests_total[1m])`)。
+"""
+
+# histogram 預設的區間上限 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+
+class Metric:
+    """
+    Metric is a named family of samples, one per combination of label values.
+
+    Functions:
+        - labels: the child of the given label values
+        - collect: (suffix, label names, label values, value) of every sample
+    """
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[Tuple[str, Sequence[str], LabelValues, float]]:
+        raise NotImplementedError
+
+
+class _Value:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value: float):
+        with self.lock:
+            self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        # 輸出時才呼叫 function 取得目前的值 (e.g. 佇列長度)
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def collect(self):
+        return [('', self.labelnames, key, child.get()) for key, child in list(self.children.items())]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def time(self) -> '_Timer':
+        return _Timer(self)
+
+
+class _Timer:
+    # with histogram.time(): ... 記錄區塊執行的秒數
+    def __init__(self, histogram: _Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def collect(self):
+        samples = []
+        names = self.labelnames + ('le',)
+        for key, child in list(self.children.items()):
+            with child.lock:
+                counts, count, total = list(child.counts), child.count, child.sum
+            cumulative = 0
+            for bound, bucket in zip(child.buckets, counts):
+                cumulative += bucket
+                samples.append(('_bucket', names, key + (_format_value(bound),), cumulative))
+            samples.append(('_bucket', names, key + ('+Inf',), count))
+            samples.append(('_sum', self.labelnames, key, total))
+            samples.append(('_count', self.labelnames, key, count))
+        return samples
+
+
+class Metrics(metaclass=Singleton):
+    """
+    Metrics is the process-wide registry of counters, gauges and histograms,
+    rendered in the Prometheus text exposition format and optionally served over HTTP.
+
+    Functions:
+        - counter / gauge / histogram: get or register a metric
+        - render: all metrics in the text exposition format
+        - start: serve GET /metrics on a background thread
+        - shutdown: stop the HTTP exporter
+    """
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('metrics')
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+                if not metric.labelnames:
+                    # 沒有 label 的指標一開始就輸出 0
+                    metric.labels()
+            elif type(metric) is not cls:
+                raise ValueError(f'metric {name} is already registered as a {metric.type}')
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for suffix, names, values, value in metric.collect():
+                lines.append(f'{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, host: str = '127.0.0.1', port: int = 9108):
+        if self.running:
+            return
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-exporter', daemon=True)
+        self.thread.start()
+        self.logger.info(f'指標輸出啟動: http://{host}:{self.server.server_port}/metrics')
+
+    def shutdown(self):
+        if not self.running:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server, self.thread = None, None
+
+    def _handler(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0].rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                data = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                registry.logger.debug(f'{self.address_string()} {format % args}')
+
+        return Handler
+
+
+# 各階段等待處理的數量 (writer: 寫入佇列的科系數、ocr: 辨識中的圖片數、watch: 等待或進行中的學校爬取)
+QUEUE_DEPTH = Metrics().gauge('scraper_queue_depth', 'Items waiting in each pipeline stage', ('stage',))
@@ -1,14 +1,23 @@
+import sys
 from dataclasses import dataclass
-from typing import List
+from typing import Any, Dict, List, Optional
 
 
-@dataclass
+"""
+爬取下來的資料
+
+解析後的資料建立後就不會再修改 (frozen)，並使用 __slots__ 省下每個物件的 __dict__
+(學測查榜一個年度會有數十萬個 SchoolAdmissionStatusModel)；Python 3.10 以前的 dataclass 不支援 slots
+"""
+_model = dataclass(frozen=True, slots=True) if sys.version_info >= (3, 10) else dataclass(frozen=True)
+
+@_model
 class AvailableYearsModel:
     method: str
     method_name: str
     available_years: List[str]
     
-@dataclass
+@_model
 class SchoolModel:
     release_status: str
     release_date: str
@@ -16,7 +25,7 @@ class SchoolModel:
     school_name: str
     school_href: str
 
-@dataclass
+@_model
 class ExamDepartmentModel:
     department_id: str
     department_name: str
@@ -24,14 +33,14 @@ class ExamDepartmentModel:
     admission_score: str
     admission_weights: str
 
-@dataclass
+@_model
 class ExamAdmissionModel:
     ticket: str
     exam_area: str
     school_name: str
     school_depart: str
 
-@dataclass
+@_model
 class ExamAdmissionDetailModel:
     weights: str
     order: str
@@ -41,54 +50,54 @@ class ExamAdmissionDetailModel:
     oversea_grade: str
     admission_list: List[ExamAdmissionModel]
     
-@dataclass
+@_model
 class StarDepartmentModel:
     department_id: str
     department_name: str
     admission_href: str
     
-@dataclass
+@_model
 class StarAdmissionModel:
     ticket: str
     exam_area: str
     school_name: str
     school_depart: str
 
-@dataclass
+@_model
 class CrossDepartmentModel:
     department_id: str
     department_name: str
     admission_href: str
     release_status: str
     
-@dataclass
+@_model
 class SchoolAdmissionStatusModel:
     admission: bool
     school_name: str
     department_name: str
-    status: str
+    status: Optional[str]
 
-@dataclass
+@_model
 class CrossAdmissionModel:
     ticket: str
-    exam_area: str
-    name: str
+    exam_area: Optional[str]
+    name: Optional[str]
     schools: List[SchoolAdmissionStatusModel]
     
-@dataclass
+@_model
 class VtechDepartmentModel:
     department_id: str
     department_name: str
     admission_href: str
     group: str
     
-@dataclass
+@_model
 class VtechAdmissionModel:
     ticket: str
-    name: str
+    name: Optional[str]
     schools: List[SchoolAdmissionStatusModel]
     
-@dataclass
+@_model
 class TechregDepartmentModel:
     department_id: str
     department_name: str
@@ -96,15 +105,30 @@ class TechregDepartmentModel:
     average_score: str
     group: str
 
-@dataclass
+@_model
 class TechregAdmissionModel:
     ticket: str
     name: str
     
-@dataclass
+@_model
 class TechregAdmissionDetailModel:
     general_grade: str
     native_grade: str
     veteran_grade: str
     oversea_grade: str
     admission_list: List[TechregAdmissionModel]
+
+@_model
+class AdmissionRecord:
+    # 一個科系的榜單 (爬蟲解析後輸出到各 sink 的資料)
+    method: str
+    method_name: str
+    year: str
+    school_code: str
+    school_name: str
+    department_code: str
+    department_name: str
+    # AdmissionList 欄位
+    values: Dict[str, Any]
+    # AdmissionPerson 欄位 (每位上榜人一個 dict)
+    rows: List[Dict[str, Any]]
@@ -1,14 +1,16 @@
 import re
 import os
-import cv2
 import json
 import base64
-import pytesseract
-import numpy as np
+import threading
 from io import BytesIO
 from PIL import Image
+from typing import Dict, Optional, Tuple
 from scrapers.utils import clean_string
 from scrapers.meta import Singleton
+from scrapers.metrics import Metrics
+from scrapers.profiling import span
+from scrapers.ocr_cache import PerceptualCache, CACHE_FILE_VERSION, digest_key, upgrade_cache_data
 # from utils import clean_string
 # from meta import Singleton
 
@@ -45,6 +47,30 @@ OCR Engine Mode (OEM):
   3    Default, based on what is available.
 """
 
+# 各種 OCR 模式對應的 tesseract 參數
+SINGLE_LINE_CONFIG = '--psm 7 --oem 3'
+MULTI_LINE_CONFIG = '--psm 6 --oem 3'
+SINGLE_CHARACTER_CONFIG = '--psm 10 --oem 3'
+SINGLE_LINE_NUMBER_CONFIG = '--psm 7 --oem 3 -c tessedit_char_whitelist=0123456789'
+# 指標中的辨識模式名稱
+OCR_MODES = {
+    SINGLE_LINE_CONFIG: 'single_line',
+    MULTI_LINE_CONFIG: 'multi_line',
+    SINGLE_CHARACTER_CONFIG: 'single_character',
+    SINGLE_LINE_NUMBER_CONFIG: 'single_line_number',
+}
+# 各辨識模式的 OCR 請求數 (依快取結果: exact、perceptual、miss) 與 tesseract 辨識耗時
+OCR_REQUESTS = Metrics().counter('scraper_ocr_requests_total', 'OCR requests by mode and cache result', ('mode', 'result'))
+OCR_SECONDS = Metrics().histogram('scraper_ocr_seconds', 'Tesseract recognition time by mode', ('mode',))
+
+def ocr_mode(config: str) -> str:
+    return OCR_MODES.get(config, 'other')
+
+def set_tesseract_cmd(tesseract_cmd: str):
+    # pytesseract 在第一次辨識時才載入 (不需要 OCR 的入學管道不必載入)
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
 base64_regex_pattern = re.compile(r'^.+?(;base64),')
 def base64_to_image(base64_string, mode='RGB'):
     base64_string = base64_regex_pattern.sub('', base64_string)
@@ -101,12 +127,17 @@ def binary_image(image, threshold=128, mode='RGB'):
     return binary_image.convert(mode)
 
 def erode(image, kernel=(3,3), iterations=1, mode='RGB'):
+    # cv2、numpy 載入很慢，只有姓名字形需要，使用時才載入
+    import cv2
+    import numpy as np
     image = binary_image(image, mode=mode)
     image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
     erosion = cv2.erode(image, np.ones(kernel, np.uint8), iterations=iterations)
     return Image.fromarray(erosion)
 
 def dilate(image, kernel=(3,3), iterations=1, mode='RGB'):
+    import cv2
+    import numpy as np
     image = binary_image(image, mode=mode)
     image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
     dilation = cv2.dilate(image, np.ones(kernel, np.uint8), iterations=iterations)
@@ -115,45 +146,146 @@ def dilate(image, kernel=(3,3), iterations=1, mode='RGB'):
 class OCR(metaclass=Singleton):
     
     def __init__(self) -> None:
-        self.engine = pytesseract.image_to_string
+        # OCR 引擎 (第一次辨識時才載入 pytesseract)
+        self.engine = None
+        # 第一層: 圖片字串完全相同
         self.cache = {}
+        # 第二層: 正規化點陣圖的感知雜湊，漢明距離在門檻內視為同一張圖
+        self.perceptual = PerceptualCache()
+        # 快取命中次數 (爬蟲執行緒、放榜監看與 OCR 服務的 callback 會同時更新)
+        self.hits = {'exact': 0, 'perceptual': 0, 'miss': 0}
+        self.hits_lock = threading.Lock()
+        # 快取檔案在第一次查詢時才載入 (不需要 OCR 的爬取不必讀取整個快取檔)
+        self.cache_path: Optional[str] = None
+        self.loaded = False
+        self.load_lock = threading.Lock()
     
-    def ocr(self, image, lang, **kwargs) -> str:
+    def configure(self, cache_path: str, perceptual_threshold: int):
+        self.cache_path = cache_path
+        self.perceptual.threshold = perceptual_threshold
+        self.loaded = False
+    
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self.load_lock:
+            if self.loaded:
+                return
+            if self.cache_path:
+                # 保留載入前已經放進快取的結果
+                current = self.cache
+                self.load_cache(self.cache_path)
+                self.cache.update(current)
+            self.loaded = True
+    
+    def cache_key(self, image) -> str:
+        # 以圖片字串 (PIL Image 則先轉成 base64 字串) 的 SHA-1 當作 key，讓快取檔保持精簡
+        if not isinstance(image, str):
+            image = image_to_base64(image)
+        return digest_key(image)
+    
+    def count(self, kind: str, config: str):
+        # kind: exact、perceptual 或 miss
+        with self.hits_lock:
+            self.hits[kind] += 1
+        OCR_REQUESTS.labels(ocr_mode(config), kind).inc()
+    
+    def hit_counts(self) -> Dict[str, int]:
+        with self.hits_lock:
+            return dict(self.hits)
+    
+    def lookup(self, hash_key: str, image, lang: str, config: str,
+               count_miss: bool = True) -> Tuple[Optional[str], Optional[Tuple[str, int]]]:
+        """
+        依序查詢兩層快取，回傳 (快取的文字, 感知雜湊)，感知雜湊在寫回快取時使用
+
+        count_miss: 為 False 時沒有命中不計數，由呼叫端決定 (e.g. OCR 服務中同一張圖片正在辨識時算命中)
+        """
+        self.ensure_loaded()
+        if self.cache.get(hash_key) is not None:
+            self.count('exact', config)
+            return self.cache[hash_key], None
+        
+        fingerprint = None
+        if self.perceptual.enabled:
+            if isinstance(image, str):
+                image = base64_to_image(image, mode='RGBA')
+            fingerprint = self.perceptual.fingerprint(image, lang, config)
+            text = self.perceptual.get(fingerprint)
+            if text is not None:
+                self.count('perceptual', config)
+                # 補進第一層，下次同一張圖就不需要再計算雜湊
+                self.cache[hash_key] = text
+                return text, fingerprint
+        if count_miss:
+            self.count('miss', config)
+        return None, fingerprint
+    
+    def store(self, hash_key: str, fingerprint: Optional[Tuple[str, int]], text: str):
+        self.cache[hash_key] = text
+        if fingerprint is not None:
+            self.perceptual.set(fingerprint, text)
+    
+    def recognize(self, image, lang, **kwargs) -> str:
+        # 不經過快取，直接呼叫 OCR 引擎 (OCR 服務的 worker process 也是呼叫這個函式)
+        if self.engine is None:
+            import pytesseract
+            self.engine = pytesseract.image_to_string
         if isinstance(image, str):
-            hash_key = image
             image = base64_to_image(image)
-        else:
-            hash_key = image_to_base64(image)
-            
-        if self.cache.get(hash_key) is not None:
-            return self.cache[hash_key]
-        res = clean_string(self.engine(image, lang=lang, **kwargs))
-        self.cache[hash_key] = res
+        return clean_string(self.engine(image, lang=lang, **kwargs))
+    
+    def ocr(self, image, lang, **kwargs) -> str:
+        hash_key = self.cache_key(image)
+        res, fingerprint = self.lookup(hash_key, image, lang, kwargs.get('config', ''))
+        if res is not None:
+            return res
+        with span('ocr'), OCR_SECONDS.labels(ocr_mode(kwargs.get('config', ''))).time():
+            res = self.recognize(image, lang, **kwargs)
+        self.store(hash_key, fingerprint, res)
         return res
 
+    def stats(self) -> Dict[str, float]:
+        hits = self.hit_counts()
+        total = sum(hits.values())
+        return {
+            'exact_hits': hits['exact'],
+            'perceptual_hits': hits['perceptual'],
+            'misses': hits['miss'],
+            'exact_hit_rate': hits['exact'] / total if total else 0.0,
+            'perceptual_hit_rate': hits['perceptual'] / total if total else 0.0,
+        }
+
     def single_line_ocr(self, image, lang='eng', **kwargs) -> str:
-        kwargs['config'] = '--psm 7 --oem 3'
+        kwargs['config'] = SINGLE_LINE_CONFIG
         return self.ocr(image, lang, **kwargs)
     
     def multi_line_ocr(self, image, lang='eng', **kwargs) -> str:
-        kwargs['config'] = '--psm 6 --oem 3'
+        kwargs['config'] = MULTI_LINE_CONFIG
         return self.ocr(image, lang, **kwargs)
     
     def single_character_ocr(self, image, lang='eng', **kwargs) -> str:
-        kwargs['config'] = '--psm 10 --oem 3'
+        kwargs['config'] = SINGLE_CHARACTER_CONFIG
         return self.ocr(image, lang, **kwargs)
 
     def single_line_number_ocr(self, image, lang='eng', **kwargs) -> str:
-        kwargs['config'] = '--psm 7 --oem 3 -c tessedit_char_whitelist=0123456789'
+        kwargs['config'] = SINGLE_LINE_NUMBER_CONFIG
         return self.ocr(image, lang, **kwargs)
     
+    def dump_cache(self) -> Dict[str, Dict]:
+        return {'exact': dict(self.cache), 'perceptual': self.perceptual.dump()}
+    
+    def restore_cache(self, data: Dict[str, Dict]):
+        self.cache = dict(data.get('exact', {}))
+        self.perceptual.load(data.get('perceptual', {}))
+    
     def load_cache(self, path):
         if not os.path.exists(path):
             return 
         
         with open(path, 'r', encoding='utf8') as f:
-            self.cache = json.load(f)
+            self.restore_cache(upgrade_cache_data(json.load(f)))
 
     def save_cache(self, path):
         with open(path, 'w', encoding='utf8') as f:
-            self.cache = json.dump(self.cache, f)
\ No newline at end of file
+            json.dump({'version': CACHE_FILE_VERSION, **self.dump_cache()}, f, ensure_ascii=False)
@@ -0,0 +1,234 @@
+import gzip
+import json
+import hashlib
+import threading
+from datetime import datetime
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+"""
+OCR 快取的第二層: 以正規化後點陣圖的感知雜湊 (perceptual hash) 當作 key。
+
+同一個字形在不同頁面、不同年度可能會有不同的 PNG 編碼或反鋸齒，精確字串 key 會查不到，
+這時候改用漢明距離 (Hamming distance) 在 BK-tree 中尋找足夠接近的點陣圖，距離在門檻內就直接回傳快取的文字。
+
+另外提供快取的匯出、匯入與合併，讓新的爬蟲節點可以直接使用其他節點累積的快取。
+"""
+
+# 本機 OCR 快取檔案格式版本
+CACHE_FILE_VERSION = 3
+# 匯出檔格式 (gzip 壓縮的 JSON)
+EXPORT_FORMAT = 'admission-ocr-cache'
+EXPORT_VERSION = 1
+# 合併快取時的衝突處理策略
+MERGE_STRATEGIES = ('majority', 'first', 'last')
+
+def digest_key(image_string: str) -> str:
+    return hashlib.sha1(image_string.encode('utf-8')).hexdigest()
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def perceptual_hash(image: 'Image.Image', max_side: int = 64) -> Tuple[int, int, int]:
+    """
+    將圖片正規化 (透明背景補白、灰階、二值化，長邊縮到 max_side 以內) 後，
+    每個像素當作一個 bit，回傳 (寬, 高, 雜湊值)
+    """
+    # PIL 在第一次計算時才載入 (匯出、匯入快取時不需要)
+    from PIL import Image
+    image = image.convert('RGBA')
+    background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+    background.paste(image, (0, 0), image)
+    image = background.convert('L')
+    if max(image.size) > max_side:
+        ratio = max_side / max(image.size)
+        image = image.resize((max(1, int(image.width * ratio)), max(1, int(image.height * ratio))), Image.BILINEAR)
+    bitmap = image.point(lambda x: 0 if x < 128 else 255, '1')
+    return image.width, image.height, int.from_bytes(bitmap.tobytes(), 'big')
+
+
+class BKTree:
+    """
+    BKTree indexes integer hashes by Hamming distance.
+    Each node is [hash, value, {distance: child}].
+    """
+    def __init__(self) -> None:
+        self.root: Optional[list] = None
+        self.size = 0
+
+    def add(self, key: int, value: str):
+        if self.root is None:
+            self.root = [key, value, {}]
+            self.size += 1
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> Optional[Tuple[int, str]]:
+        # 回傳距離最近且在 radius 以內的 (距離, 值)
+        if self.root is None:
+            return None
+        best = None
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius and (best is None or distance < best[0]):
+                best = (distance, node[1])
+                if distance == 0:
+                    break
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return best
+
+    def items(self) -> List[Tuple[int, str]]:
+        result = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            result.append((node[0], node[1]))
+            stack.extend(node[2].values())
+        return result
+
+
+class PerceptualCache:
+    """
+    PerceptualCache keeps one BK-tree per (lang, config, width, height) bucket,
+    so only bitmaps recognized in the same OCR mode and of the same size are compared.
+    """
+    def __init__(self, threshold: int = 2, max_side: int = 64) -> None:
+        # 漢明距離門檻 (負數代表停用)
+        self.threshold = threshold
+        self.max_side = max_side
+        self.trees: Dict[str, BKTree] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold >= 0
+
+    def fingerprint(self, image: 'Image.Image', lang: str, config: str) -> Tuple[str, int]:
+        width, height, value = perceptual_hash(image, self.max_side)
+        return f'{lang}|{config}|{width}x{height}', value
+
+    def get(self, fingerprint: Tuple[str, int]) -> Optional[str]:
+        bucket, value = fingerprint
+        with self.lock:
+            tree = self.trees.get(bucket)
+            found = tree.search(value, self.threshold) if tree else None
+        return found[1] if found else None
+
+    def set(self, fingerprint: Tuple[str, int], text: str):
+        bucket, value = fingerprint
+        with self.lock:
+            self.trees.setdefault(bucket, BKTree()).add(value, text)
+
+    def __len__(self) -> int:
+        return sum(tree.size for tree in self.trees.values())
+
+    def dump(self) -> Dict[str, Dict[str, str]]:
+        with self.lock:
+            return {bucket: {format(key, 'x'): text for key, text in tree.items()} for bucket, tree in self.trees.items()}
+
+    def load(self, data: Dict[str, Dict[str, str]]):
+        with self.lock:
+            self.trees = {}
+            for bucket, entries in data.items():
+                tree = self.trees.setdefault(bucket, BKTree())
+                for key, text in entries.items():
+                    tree.add(int(key, 16), text)
+
+
+def upgrade_cache_data(data: Dict) -> Dict[str, Dict]:
+    """
+    將各版本的本機快取內容轉換成 {'exact': ..., 'perceptual': ...}
+    """
+    # 舊版快取檔只有第一層 (圖片字串 -> 文字)
+    if data.get('version') not in (2, CACHE_FILE_VERSION):
+        data = {'exact': data}
+    exact = data.get('exact', {})
+    # 版本 3 以前的 key 是完整的圖片字串，轉換成 SHA-1
+    if data.get('version') != CACHE_FILE_VERSION:
+        exact = {digest_key(key): text for key, text in exact.items()}
+    return {'exact': exact, 'perceptual': data.get('perceptual', {})}
+
+def export_cache(data: Dict[str, Dict], path: str):
+    with gzip.open(path, 'wt', encoding='utf8') as f:
+        json.dump({
+            'format': EXPORT_FORMAT,
+            'version': EXPORT_VERSION,
+            'exported_at': datetime.now().isoformat(timespec='seconds'),
+            'exact': data.get('exact', {}),
+            'perceptual': data.get('perceptual', {}),
+        }, f, ensure_ascii=False, separators=(',', ':'))
+
+def read_cache_file(path: str) -> Dict[str, Dict]:
+    """
+    讀取匯出檔 (gzip) 或本機快取檔 (JSON)
+    """
+    with open(path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    opener = gzip.open if is_gzip else open
+    with opener(path, 'rt', encoding='utf8') as f:
+        data = json.load(f)
+    if data.get('format') == EXPORT_FORMAT:
+        if data.get('version', 0) > EXPORT_VERSION:
+            raise ValueError(f'不支援的 OCR 快取匯出版本: {data.get("version")}')
+        return {'exact': data.get('exact', {}), 'perceptual': data.get('perceptual', {})}
+    return upgrade_cache_data(data)
+
+def _merge_entries(sources: List[Dict[str, str]], strategy: str) -> Tuple[Dict[str, str], int]:
+    candidates: Dict[str, List[str]] = {}
+    for source in sources:
+        for key, text in source.items():
+            candidates.setdefault(key, []).append(text)
+
+    merged, conflicts = {}, 0
+    for key, texts in candidates.items():
+        if len(set(texts)) > 1:
+            conflicts += 1
+        if strategy == 'first':
+            merged[key] = texts[0]
+        elif strategy == 'last':
+            merged[key] = texts[-1]
+        else:
+            # 多數決，同票時以先出現的來源為準
+            counts = Counter(texts)
+            merged[key] = max(texts, key=lambda text: counts[text])
+    return merged, conflicts
+
+def merge_caches(sources: List[Dict[str, Dict]], strategy: str = 'majority') -> Tuple[Dict[str, Dict], int]:
+    """
+    合併多份快取，回傳 (合併後的快取, 衝突的 key 數量)
+
+    strategy:
+        - majority: 同一張圖片以多數來源的辨識結果為準 (同票時取先出現的來源)
+        - first: 以先出現的來源為準
+        - last: 以後出現的來源為準
+    """
+    if strategy not in MERGE_STRATEGIES:
+        raise ValueError(f'strategy must be one of: {", ".join(MERGE_STRATEGIES)}')
+
+    exact, conflicts = _merge_entries([source.get('exact', {}) for source in sources], strategy)
+    perceptual = {}
+    buckets = {bucket for source in sources for bucket in source.get('perceptual', {})}
+    for bucket in buckets:
+        entries, bucket_conflicts = _merge_entries([source.get('perceptual', {}).get(bucket, {}) for source in sources], strategy)
+        perceptual[bucket] = entries
+        conflicts += bucket_conflicts
+    return {'exact': exact, 'perceptual': perceptual}, conflicts
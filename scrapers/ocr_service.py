@@ -0,0 +1,184 @@
+import time
+import logging
+import threading
+from typing import Dict, Optional, Set, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from scrapers.meta import Singleton
+from scrapers.metrics import Metrics, QUEUE_DEPTH
+from scrapers.profiling import Spans, current_method, span
+from scrapers.ocr import *
+
+
+"""
+OCR 服務: 以多個 worker process 平行執行 tesseract，每個 process 各自持有一個已初始化的 OCR 引擎。
+解析器送出圖片後會立即拿到 Future，等整頁都送出後再一次取回結果，
+讓同一頁的准考證、姓名字形、二階甄試狀態圖片可以平行辨識。
+"""
+
+# worker 實際工作的時間佔 (經過時間 × worker 數量) 的比例 (沒有啟動 worker pool 時為 0)
+WORKER_UTILIZATION = Metrics().gauge('scraper_ocr_worker_utilization', 'Fraction of OCR worker process time spent recognizing')
+
+# worker process 內的 OCR 引擎 (每個 process 各自一份)
+_worker_engine: Optional[OCR] = None
+
+def _init_worker(tesseract_cmd: str):
+    global _worker_engine
+    set_tesseract_cmd(tesseract_cmd)
+    _worker_engine = OCR()
+
+def _run_ocr(image, lang: str, config: str):
+    # 回傳辨識結果以及 worker 實際工作的秒數 (用來計算使用率)
+    start = time.perf_counter()
+    text = _worker_engine.recognize(image, lang, config=config)
+    return text, time.perf_counter() - start
+
+
+class OCRService(metaclass=Singleton):
+    """
+    OCRService dispatches OCR requests to a pool of worker processes and returns futures.
+    When the pool is not started (workers = 0), requests are recognized inline and
+    already-completed futures are returned, so parsers use the same code path either way.
+
+    Functions:
+        - configure: start the worker pool on the first cache miss
+        - start: start the worker pool
+        - submit: submit an image and get a future of the recognized text
+        - dry_run: record cache misses instead of recognizing them (crawl plan estimation)
+        - shutdown: wait for pending requests and stop the worker pool
+        - stats: queue depth and worker utilization
+    """
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('ocr')
+        self.ocr = OCR()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.workers = 0
+        # configure 設定的 (worker 數量, tesseract 路徑)，第一次快取沒有命中時才啟動 worker pool
+        self.deferred: Optional[Tuple[int, str]] = None
+        self.start_lock = threading.Lock()
+        self.lock = threading.Lock()
+        # 同一張圖片正在辨識中時，共用同一個 Future
+        self.pending: Dict[str, Future] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.perf_counter()
+        # 預估模式 (--plan): 快取沒有命中的圖片不辨識 (回傳空字串)，只記錄不重複的圖片
+        self.estimating = False
+        self.estimated_misses: Set[str] = set()
+        QUEUE_DEPTH.labels('ocr').set_function(lambda: self.submitted - self.completed)
+        WORKER_UTILIZATION.set_function(lambda: self.stats()['utilization'])
+
+    def configure(self, workers: int, tesseract_cmd: str):
+        self.deferred = (workers, tesseract_cmd) if workers > 0 else None
+
+    def dry_run(self, enabled: bool = True):
+        self.estimating = enabled
+        self.estimated_misses = set()
+
+    def start(self, workers: int, tesseract_cmd: str):
+        if self.executor or workers <= 0:
+            return
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tesseract_cmd,))
+        self.started_at = time.perf_counter()
+        self.logger.info(f'OCR 服務啟動，worker 數量: {workers}')
+
+    def submit(self, image, lang: str, config: str) -> Future:
+        cache_key = self.ocr.cache_key(image)
+        # 沒有命中時先不計數: 同一張圖片正在辨識中時共用結果，算是命中
+        cached, fingerprint = self.ocr.lookup(cache_key, image, lang, config, count_miss=False)
+        if cached is not None:
+            return self._done(cached)
+        if self.estimating:
+            self.ocr.count('miss', config)
+            with self.lock:
+                self.estimated_misses.add(f'{cache_key}|{lang}|{config}')
+            return self._done('')
+
+        if self.deferred and not self.executor:
+            with self.start_lock:
+                if self.deferred:
+                    self.start(*self.deferred)
+                    self.deferred = None
+        if not self.executor:
+            self.ocr.count('miss', config)
+            with span('ocr'), OCR_SECONDS.labels(ocr_mode(config)).time():
+                text = self.ocr.recognize(image, lang, config=config)
+            self.ocr.store(cache_key, fingerprint, text)
+            return self._done(text)
+
+        pending_key = f'{cache_key}|{lang}|{config}'
+        with self.lock:
+            result = self.pending.get(pending_key)
+            if result is None:
+                result = Future()
+                self.pending[pending_key] = result
+                self.submitted += 1
+                shared = False
+            else:
+                shared = True
+        if shared:
+            # 完全相同的圖片已經送出辨識，共用同一個 Future
+            self.ocr.count('exact', config)
+            return result
+        self.ocr.count('miss', config)
+
+        # 完成的 callback 在其他執行緒執行，先記下送出時的入學管道
+        method = current_method()
+        future = self.executor.submit(_run_ocr, image, lang, config)
+        future.add_done_callback(lambda f: self._on_done(f, result, cache_key, fingerprint, pending_key, config, method))
+        return result
+
+    def _on_done(self, future: Future, result: Future, cache_key: str, fingerprint, pending_key: str, config: str, method: str):
+        with self.lock:
+            self.pending.pop(pending_key, None)
+            self.completed += 1
+        try:
+            text, busy = future.result()
+        except Exception as e:
+            result.set_exception(e)
+            return
+        with self.lock:
+            self.busy_seconds += busy
+        # worker process 實際辨識的秒數
+        OCR_SECONDS.labels(ocr_mode(config)).observe(busy)
+        Spans().record('ocr', busy, method)
+        self.ocr.store(cache_key, fingerprint, text)
+        result.set_result(text)
+
+    def single_line_ocr(self, image, lang='eng') -> Future:
+        return self.submit(image, lang, SINGLE_LINE_CONFIG)
+
+    def multi_line_ocr(self, image, lang='eng') -> Future:
+        return self.submit(image, lang, MULTI_LINE_CONFIG)
+
+    def single_character_ocr(self, image, lang='eng') -> Future:
+        return self.submit(image, lang, SINGLE_CHARACTER_CONFIG)
+
+    def single_line_number_ocr(self, image, lang='eng') -> Future:
+        return self.submit(image, lang, SINGLE_LINE_NUMBER_CONFIG)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            elapsed = time.perf_counter() - self.started_at
+            capacity = elapsed * self.workers
+            return {
+                'workers': self.workers,
+                'queue_depth': self.submitted - self.completed,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'utilization': self.busy_seconds / capacity if capacity > 0 else 0.0,
+            }
+
+    def shutdown(self):
+        if not self.executor:
+            return
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        self.logger.info(f'OCR 服務關閉，統計: {self.stats()}')
+
+    @staticmethod
+    def _done(value) -> Future:
+        future = Future()
+        future.set_result(value)
+        return future
@@ -0,0 +1,192 @@
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from conf import AppConfig
+from scrapers.client import ClientFactory
+from scrapers.crawlers import Crawler
+from scrapers.model import SchoolModel
+from scrapers.ocr import OCR
+from scrapers.ocr_service import OCRService
+from scrapers.profiling import Spans, method_context
+from scrapers.scraper import Scraper
+from scrapers.webparser import AvailableYearsParser, Parser
+
+
+"""
+爬取計畫 (dry-run, `--plan`)
+
+大量回填之前先估算成本: 只爬取學校列表與科系列表，展開每個入學管道、學年度的完整榜單網址 (frontier)，
+再從每組 frontier 平均抽樣幾頁榜單，以實際的解析器解析 (OCR 服務改為預估模式: 快取命中的圖片照常取用，
+沒有命中的圖片不辨識，只記錄不重複的圖片)，依抽樣結果推估:
+    - 請求數與耗時: 依設定的每請求秒數 (未設定則使用規劃時量到的平均)、OCR 秒數與 worker 數量
+    - OCR 數量: 送出的圖片數、快取命中數，以及扣除快取命中與重複圖片後實際需要辨識的數量
+    - 寫入筆數: 榜單 (每個科系一筆) 與上榜人
+不寫入資料庫、不呼叫 tesseract，結果以 JSON 輸出，讓排程工具決定何時、如何執行。
+"""
+
+# (學校, 科系, 學校列表名稱)
+Target = Tuple[SchoolModel, Any, str]
+
+def spread(items: List[Any], count: int) -> List[Any]:
+    """
+    平均取出 count 個項目 (包含頭尾)
+    """
+    if count <= 0 or not items:
+        return []
+    if len(items) <= count:
+        return list(items)
+    if count == 1:
+        return [items[0]]
+    return [items[round(index * (len(items) - 1) / (count - 1))] for index in range(count)]
+
+
+class Planner:
+    """
+    Planner expands the crawl frontier of each method and year from the university and department lists,
+    samples admission pages with OCR in dry-run mode, and projects requests, OCR volume, rows and time of the crawl.
+
+    Functions:
+        - available_years: years to plan per method (fetches the home page unless both method and year are given)
+        - plan: build the whole plan (JSON serializable)
+        - plan_method: expand the frontier and sample the admission pages of one method and year
+        - sample: parse sampled admission pages and count OCR requests, cache hits and rows
+    """
+    def __init__(self, crawlers: Dict[str, Crawler], config: AppConfig) -> None:
+        self.logger = logging.getLogger('plan')
+        self.crawlers = crawlers
+        self.config = config
+        self.client = ClientFactory.shared(config.flaresolverr)
+
+    def available_years(self, scrape_method: Optional[str] = None, scrape_year: Optional[str] = None) -> Dict[str, List[str]]:
+        if scrape_method and scrape_year:
+            return {scrape_method: [scrape_year]}
+        parsed = AvailableYearsParser().parse(self.client.get(self.config.scrape.base_url)) or []
+        return {current.method: [year for year in current.available_years if scrape_year in (None, year)]
+                for current in parsed if current.method in self.crawlers and scrape_method in (None, current.method)}
+
+    def sample(self, crawler: Crawler, year: str, targets: List[Target]) -> Dict[str, int]:
+        ocr = OCR()
+        service = OCRService()
+        before = ocr.hit_counts()
+        pages, failed, rows = 0, 0, 0
+        service.dry_run()
+        try:
+            for university, department, listing in targets:
+                admission_html = self.client.get(crawler.admission_page_url(year, department, listing))
+                if admission_html is None:
+                    failed += 1
+                    continue
+                admission_result = crawler.get_parser('admission', Parser).parse(admission_html)
+                pages += 1
+                if admission_result:
+                    rows += len(crawler.record(year, university, department, admission_result).rows)
+            misses = len(service.estimated_misses)
+        finally:
+            service.dry_run(False)
+        after = ocr.hit_counts()
+        hits = {name: after[name] - before.get(name, 0) for name in after}
+        return {
+            'pages': pages,
+            'failed': failed,
+            'rows': rows,
+            'ocr_requests': sum(hits.values()),
+            'ocr_exact_hits': hits['exact'],
+            'ocr_perceptual_hits': hits['perceptual'],
+            # 抽樣頁面中沒有命中快取的不重複圖片
+            'ocr_misses': misses,
+        }
+
+    def plan_method(self, method: str, year: str) -> Dict[str, Any]:
+        crawler = self.crawlers[method]
+        with method_context(method):
+            listings = crawler.fetch_universities(year)
+            frontier: List[Dict[str, str]] = []
+            targets: List[Target] = []
+            department_pages = 0
+            for listing, universities in listings.items():
+                for university in universities:
+                    department_pages += 1
+                    for department in crawler.fetch_departments(year, university, listing):
+                        targets.append((university, department, listing))
+                        frontier.append({
+                            'listing': listing,
+                            'school_id': university.school_id,
+                            'school_name': university.school_name,
+                            'department_id': department.department_id,
+                            'department_name': department.department_name,
+                            'url': crawler.admission_page_url(year, department, listing),
+                        })
+            sampled = self.sample(crawler, year, spread(targets, self.config.plan.sample_pages))
+
+        def project(value: int) -> int:
+            # 抽樣頁面的平均乘上榜單頁數
+            return round(value / sampled['pages'] * len(frontier)) if sampled['pages'] else 0
+        requests = {
+            'university_list': len(listings),
+            'department_list': department_pages,
+            'admission': len(frontier),
+        }
+        requests['total'] = sum(requests.values())
+        self.logger.info(f'[{method.capitalize()}] {year} 學年度共 {department_pages} 所學校、{len(frontier)} 個榜單頁面')
+        return {
+            'method': method,
+            'method_name': crawler.method_name,
+            'year': year,
+            'universities': department_pages,
+            'departments': len(frontier),
+            'requests': requests,
+            'sample': sampled,
+            'estimate': {
+                'ocr_requests': project(sampled['ocr_requests']),
+                'ocr_cache_hits': project(sampled['ocr_exact_hits'] + sampled['ocr_perceptual_hits']),
+                'ocr_calls': project(sampled['ocr_misses']),
+                'admission_lists': len(frontier),
+                'admission_persons': project(sampled['rows']),
+            },
+            'frontier': frontier,
+        }
+
+    def plan(self, scrape_method: Optional[str] = None, scrape_year: Optional[str] = None) -> Dict[str, Any]:
+        started = time.time()
+        years = self.available_years(scrape_method, scrape_year)
+        plans = [self.plan_method(method, year) for method, method_years in years.items() for year in method_years]
+
+        # 規劃時實際量到的每請求秒數
+        fetch = Spans().report().get('fetch', {}).get('*', {})
+        measured = fetch['mean_ms'] / 1000 if fetch else None
+        request_seconds = self.config.plan.request_seconds if self.config.plan.request_seconds is not None else (measured or 0.0)
+        ocr_workers = max(1, self.config.ocr.workers)
+        # 未同時指定入學管道與學年度時另外請求首頁，且每個入學管道、學年度爬完後等待
+        full_run = not (scrape_method and scrape_year)
+        for item in plans:
+            estimate = item['estimate']
+            estimate['seconds'] = round(item['requests']['total'] * request_seconds
+                                        + estimate['ocr_calls'] * self.config.plan.ocr_seconds / ocr_workers, 1)
+        totals = {
+            'requests': sum(item['requests']['total'] for item in plans) + (1 if full_run else 0),
+            'admission_pages': sum(item['departments'] for item in plans),
+            'ocr_requests': sum(item['estimate']['ocr_requests'] for item in plans),
+            'ocr_cache_hits': sum(item['estimate']['ocr_cache_hits'] for item in plans),
+            'ocr_calls': sum(item['estimate']['ocr_calls'] for item in plans),
+            'admission_lists': sum(item['estimate']['admission_lists'] for item in plans),
+            'admission_persons': sum(item['estimate']['admission_persons'] for item in plans),
+            'wait_seconds': Scraper.method_interval * len(plans) if full_run else 0,
+        }
+        totals['seconds'] = round(sum(item['estimate']['seconds'] for item in plans) + totals['wait_seconds']
+                                  + (request_seconds if full_run else 0), 1)
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(started)),
+            'base_url': self.config.scrape.base_url,
+            'rates': {
+                'request_seconds': round(request_seconds, 4),
+                'measured_request_seconds': round(measured, 4) if measured is not None else None,
+                'ocr_seconds': self.config.plan.ocr_seconds,
+                'ocr_workers': ocr_workers,
+                'method_interval': Scraper.method_interval if full_run else 0,
+            },
+            # 規劃本身送出的請求數
+            'plan_requests': fetch.get('count', 0),
+            'plan_seconds': round(time.time() - started, 3),
+            'totals': totals,
+            'plans': plans,
+        }
@@ -0,0 +1,210 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from scrapers.meta import Singleton
+
+
+"""
+階段耗時與效能分析 (profiling)
+
+在每個階段 (fetch: `Client.get`、parse: 每個 `Parser.parse`、ocr: 每次 tesseract 辨識、
+enqueue: 爬蟲把科系交給各 sink (放入寫入佇列、寫入檔案)、save: 科系寫入資料庫與 commit (背景寫入執行緒中依入學管道記錄))
+外層記錄耗時 (span)，依階段與入學管道統計，結束時輸出總時間、平均與 p95，找出爬取變慢的原因是網路、
+BeautifulSoup、Tesseract 還是 SQL。
+
+另外可以針對指定的階段抽樣執行 cProfile (每 N 個 span 分析一次，結果合併成一份)，
+並可選擇以 tracemalloc 抽樣記錄記憶體快照，輸出到指定的目錄。
+"""
+
+STAGES = ('fetch', 'parse', 'ocr', 'enqueue', 'save')
+
+# 目前執行中的入學管道 (爬蟲設定，span 依此分類)
+_method: ContextVar[str] = ContextVar('method', default='')
+
+# 每個 (階段, 入學管道) 保留最近幾個 span 的秒數計算 p95 (放榜監看會長時間執行，次數與總時間另外累計)
+SAMPLE_WINDOW = 10000
+# tracemalloc 快照最多保留幾份
+MAX_SNAPSHOTS = 20
+# 報表與快照列出的項目數
+TOP_ENTRIES = 30
+
+
+@contextmanager
+def method_context(method: str) -> Iterator[None]:
+    token = _method.set(method)
+    try:
+        yield
+    finally:
+        _method.reset(token)
+
+def current_method() -> str:
+    return _method.get()
+
+
+class Spans(metaclass=Singleton):
+    """
+    Spans records the duration of every stage span per crawl method and
+    optionally profiles a sample of the spans of one stage with cProfile / tracemalloc.
+
+    Functions:
+        - span: time a block as a stage (context manager)
+        - record: record a measured duration
+        - profile: profile a sample of a stage without recording its duration (context manager)
+        - enable_profiling: profile one of every `rate` spans of a stage
+        - report: count, total, mean and p95 per stage and per method
+        - finish: write the profiling outputs and the report to the output directory
+    """
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('profiling')
+        self.lock = threading.Lock()
+        # (階段, 入學管道) -> 最近 SAMPLE_WINDOW 個 span 的秒數、span 次數與總秒數
+        self.samples: Dict[Tuple[str, str], deque] = {}
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self.totals: Dict[Tuple[str, str], float] = {}
+
+        self.profile_stage: Optional[str] = None
+        self.profile_rate = 10
+        self.output: Optional[str] = None
+        self.profiler: Optional[cProfile.Profile] = None
+        # cProfile 一次只能分析一個執行緒
+        self.profile_lock = threading.Lock()
+        self.memory = False
+        self.spans = 0
+        self.profiled = 0
+        self.snapshots = 0
+
+    @contextmanager
+    def span(self, stage: str, method: Optional[str] = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            with self.profile(stage):
+                yield
+        finally:
+            self.record(stage, time.perf_counter() - start, method)
+
+    def record(self, stage: str, seconds: float, method: Optional[str] = None):
+        key = (stage, current_method() if method is None else method)
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = self.samples[key] = deque(maxlen=SAMPLE_WINDOW)
+            samples.append(seconds)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.totals[key] = self.totals.get(key, 0.0) + seconds
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        # 耗時另外以 record 記錄的階段 (e.g. 背景寫入執行緒依批次分攤 commit 時間)
+        if stage == self.profile_stage:
+            with self._profiled(stage):
+                yield
+        else:
+            yield
+
+    def enable_profiling(self, stage: str, output: str, rate: int = 10, memory: bool = False):
+        if stage not in STAGES:
+            raise ValueError(f'profile stage must be one of: {", ".join(STAGES)}')
+        os.makedirs(output, exist_ok=True)
+        self.profile_stage = stage
+        self.profile_rate = max(1, rate)
+        self.output = output
+        self.profiler = cProfile.Profile()
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        self.logger.info(f'效能分析: 每 {self.profile_rate} 個 {stage} 階段分析一次，輸出至 {output}')
+
+    @contextmanager
+    def _profiled(self, stage: str) -> Iterator[None]:
+        with self.lock:
+            self.spans += 1
+            sampled = self.spans % self.profile_rate == 0
+        # 其他執行緒正在分析時略過這次抽樣
+        if not sampled or not self.profile_lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+            self.profiled += 1
+            if self.memory and self.snapshots < MAX_SNAPSHOTS:
+                self._snapshot(stage)
+        finally:
+            self.profile_lock.release()
+
+    def _snapshot(self, stage: str):
+        self.snapshots += 1
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        path = os.path.join(self.output, f'tracemalloc-{stage}-{self.snapshots:03d}.txt')
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, mode='w', encoding='utf-8') as f:
+            f.write(f'current: {current / 1024 / 1024:.1f} MiB, peak: {peak / 1024 / 1024:.1f} MiB\n\n')
+            for stat in snapshot.statistics('lineno')[:TOP_ENTRIES]:
+                f.write(f'{stat}\n')
+
+    def report(self) -> Dict[str, Dict[str, dict]]:
+        """
+        回傳 {階段: {入學管道 (全部為 '*'): {count, total_seconds, mean_ms, p95_ms}}}
+
+        count、total_seconds 與 mean_ms 涵蓋所有 span，p95_ms 只依最近 SAMPLE_WINDOW 個 span 計算
+        """
+        with self.lock:
+            samples = {key: (list(values), self.counts[key], self.totals[key]) for key, values in self.samples.items()}
+        merged: Dict[Tuple[str, str], Tuple[List[float], int, float]] = {}
+        for (stage, method), (values, count, total) in samples.items():
+            values_all, count_all, total_all = merged.get((stage, '*'), ([], 0, 0.0))
+            merged[(stage, '*')] = (values_all + values, count_all + count, total_all + total)
+            merged[(stage, method or '-')] = (values, count, total)
+        report: Dict[str, Dict[str, dict]] = {}
+        for (stage, method), (values, count, total) in sorted(merged.items()):
+            values = sorted(values)
+            report.setdefault(stage, {})[method] = {
+                'count': count,
+                'total_seconds': round(total, 3),
+                'mean_ms': round(total / count * 1000, 3),
+                'p95_ms': round(values[min(len(values) - 1, int(0.95 * len(values)))] * 1000, 3),
+            }
+        return report
+
+    def format_report(self) -> str:
+        lines = [f'{"stage":<7} {"method":<8} {"count":>8} {"total(s)":>10} {"mean(ms)":>10} {"p95(ms)":>10}']
+        for stage, methods in self.report().items():
+            for method, row in methods.items():
+                lines.append(f'{stage:<7} {method:<8} {row["count"]:>8} {row["total_seconds"]:>10.3f} {row["mean_ms"]:>10.3f} {row["p95_ms"]:>10.3f}')
+        return '\n'.join(lines)
+
+    def finish(self):
+        self.logger.info(f'各階段耗時統計:\n{self.format_report()}')
+        if not self.output:
+            return
+        with open(os.path.join(self.output, 'spans.json'), mode='w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        if self.profiler and self.profiled:
+            stage = self.profile_stage
+            self.profiler.dump_stats(os.path.join(self.output, f'{stage}.prof'))
+            summary = io.StringIO()
+            pstats.Stats(self.profiler, stream=summary).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+            with open(os.path.join(self.output, f'{stage}.txt'), mode='w', encoding='utf-8') as f:
+                f.write(summary.getvalue())
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.logger.info(f'效能分析結果已輸出至 {self.output} (分析 {self.profiled} 個 {self.profile_stage} 階段，記憶體快照 {self.snapshots} 份)')
+
+def span(stage: str, method: Optional[str] = None):
+    return Spans().span(stage, method)
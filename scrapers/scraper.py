@@ -1,24 +1,30 @@
 import logging
 import time
 from conf import AppConfig
-from typing import Dict, List
+from typing import Dict, List, Optional
 from sqlalchemy.engine import Engine
-from scrapers.client import Client
+from orm.backfill import Backfill
+from orm.changefeed import ChangeLog
+from scrapers.client import ClientFactory
 from scrapers.model import AvailableYearsModel
 from scrapers.webparser import AvailableYearsParser 
+from scrapers.sinks import Sink, SqlSink, build_sinks
 from scrapers.crawlers import *
 
 
 class Scraper:
     
     base_url = 'https://www.com.tw/'
+    # 爬完一個入學管道的一個學年度後等待的秒數
+    method_interval = 60
     
-    def __init__(self, config: AppConfig, db: Engine):
+    def __init__(self, config: AppConfig, db: Engine, backfill: Optional[Backfill] = None):
         self.logger = logging.getLogger('scraper')
         
         self.config = config
         self.db = db
-        self.client = Client(config.flaresolverr)
+        self.base_url = config.scrape.base_url
+        self.client = ClientFactory.shared(config.flaresolverr)
         self.crawlers: Dict[str, Crawler] = {
             'cross': CrossCrawler(config, db),
             'vtech': VtechCrawler(config, db),
@@ -26,6 +32,32 @@ class Scraper:
             'exam': ExamCrawler(config, db),
             'star': StarCrawler(config, db),
         }
+        # 榜單變動事件 (寫入資料庫時才會產生)
+        self.changelog: Optional[ChangeLog] = None
+        if config.changefeed.enabled and 'sql' in config.sink.targets:
+            self.changelog = ChangeLog(config.changefeed.path, config.changefeed.fsync)
+        # 爬取結果的輸出 (所有爬蟲共用)
+        self.sinks: List[Sink] = build_sinks(config.sink, db, backfill, self.changelog)
+        for crawler in self.crawlers.values():
+            crawler.sinks = self.sinks
+
+    def change_stats(self) -> Dict[str, Dict[str, int]]:
+        # 各入學管道榜單未變動 (略過寫入) 與有變動的科系數 (只有寫入資料庫時會比對)
+        sql = next((sink for sink in self.sinks if isinstance(sink, SqlSink)), None)
+        if sql is None:
+            return {}
+        return {method: {'unchanged': sql.unchanged.get(method, 0), 'changed': sql.changed.get(method, 0)} for method in self.crawlers}
+
+    def close(self):
+        # 寫出各 sink 剩餘的資料，並輸出各 sink 的寫入統計
+        for sink in self.sinks:
+            sink.close()
+            self.logger.info(f'輸出 {sink.name} 統計: {sink.stats()}')
+        if self.changelog:
+            self.changelog.close()
+            self.logger.info(f'變動事件統計: {self.changelog.stats()}')
+        # 關閉所有 worker 的 session
+        self.client.close()
 
     def fetch_available_years(self) -> List[AvailableYearsModel]:
         resp = self.client.get(self.base_url)
@@ -61,8 +93,8 @@ class Scraper:
                         raise KeyError(f'找不到 {current.method} 入學管道的爬蟲')
                     
                     crawler.crawl(year)
-                    self.logger.info('爬取完成，等待 60 秒，再次爬取下一筆資料')
-                    time.sleep(60)
+                    self.logger.info(f'爬取完成，等待 {self.method_interval} 秒，再次爬取下一筆資料')
+                    time.sleep(self.method_interval)
                 except Exception as e:
                     self.logger.error(f'{e}')
                 
\ No newline at end of file
@@ -0,0 +1,349 @@
+import os
+import csv
+import gzip
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+from orm.model import AdmissionList
+from orm.bulk import PERSON_FIELDS, content_fingerprint, diff_admission_persons, upsert_admission_persons
+from orm.backfill import Backfill
+from orm.changefeed import ChangeLog, person_events, published_events
+from orm.scores import score_values
+from conf.config import SinkConfig
+from scrapers.identity import DepartmentKey, IdentityMap
+from scrapers.model import AdmissionRecord
+from scrapers.metrics import Metrics
+from scrapers.profiling import span
+from scrapers.writer import BatchWriter, COMMIT_SECONDS, COMMITS, ROWS_WRITTEN
+
+
+"""
+結果輸出 (sink)
+
+爬蟲解析完一個科系後產生 AdmissionRecord，交給所有啟用的 sink:
+    - SqlSink: 寫入資料庫 (有啟動背景寫入執行緒時批次 commit)
+    - FileSink: 以附加方式串流寫入 NDJSON 或 CSV 檔 (可 gzip 壓縮)，定期 flush
+
+只需要檔案時可以不啟用 SqlSink，省去 ORM 與資料庫寫入的成本。每個 sink 各自統計寫入的科系數、筆數與耗時。
+"""
+
+SINK_TYPES = ('sql', 'ndjson', 'csv')
+
+# 科系識別欄位
+RECORD_FIELDS = ('method', 'year', 'school_code', 'school_name', 'department_code', 'department_name')
+# 榜單欄位 (AdmissionList 的原始字串欄位)
+LIST_FIELDS = ('average_score', 'weight', 'same_grade_order', 'general_grade', 'native_grade', 'veteran_grade',
+               'oversea_grade', 'university_apply', 'group_code')
+# CSV 每位上榜人一列
+CSV_FIELDS = RECORD_FIELDS + LIST_FIELDS + PERSON_FIELDS
+
+# 各 sink 寫入的科系數與筆數
+SINK_RECORDS = Metrics().counter('scraper_sink_records_total', 'Department records written by sink', ('sink',))
+SINK_ROWS = Metrics().counter('scraper_sink_rows_total', 'Admission person rows written by sink', ('sink',))
+
+# session.info 中暫存 SqlSink 統計的 key: {SqlSink: 尚未 commit 的統計}
+_PENDING_STATS = 'sink_stats'
+
+
+class Sink:
+    """
+    Sink is the base class of result sinks. Crawlers hand every parsed department to each enabled sink.
+
+    Functions:
+        - prepare: called with all departments of a school before their admissions are written
+        - write: write one department record
+        - flush: make everything written so far durable (committed / flushed to the file)
+        - close: flush buffered data and release resources
+        - stats: records, rows and throughput of this sink
+    """
+    name = ''
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('sink')
+        self.stats_lock = threading.Lock()
+        self.records = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+
+    def prepare(self, departments: List[DepartmentKey]):
+        pass
+
+    def write(self, record: AdmissionRecord):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                'records': self.records,
+                'rows': self.rows,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'rows_per_second': round(self.rows / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            }
+
+    def _measure(self, records: int, rows: int, seconds: float):
+        SINK_RECORDS.labels(self.name).inc(records)
+        SINK_ROWS.labels(self.name).inc(rows)
+        with self.stats_lock:
+            self.records += records
+            self.rows += rows
+            self.busy_seconds += seconds
+
+
+class SqlSink(Sink):
+    """
+    SqlSink writes department records to the database, through the batch writer when it is running.
+    A department whose content fingerprint did not change is skipped, otherwise only the diff is written.
+    With a change log, the new lists and admission changes are emitted as events once they are committed.
+    Records, rows and changed/unchanged counts are also counted once the session commits,
+    so a batch that is rolled back and replayed is not counted twice.
+
+    Functions:
+        - submit: run a write job on the batch writer, or inline with its own transaction
+        - write_record: write one department record with the given session (called by the batch writer)
+        - write_persons: write admission persons (staged in backfill mode)
+    """
+    name = 'sql'
+
+    def __init__(self, db: Engine, backfill: Optional[Backfill] = None, changelog: Optional[ChangeLog] = None) -> None:
+        super().__init__()
+        self.db = db
+        # 入學管道、校系 ID 的快取 (所有爬蟲共用)
+        self.identity = IdentityMap()
+        # 背景寫入執行緒 (所有爬蟲共用)
+        self.writer = BatchWriter()
+        # 回填模式
+        self.backfill = backfill
+        # 榜單變動事件
+        self.changelog = changelog
+        # 各入學管道榜單內容未變動 (略過寫入) 與有變動的科系數
+        self.unchanged: Dict[str, int] = {}
+        self.changed: Dict[str, int] = {}
+
+    def submit(self, write: Callable[..., int], *args):
+        # 有啟動寫入執行緒時交給它批次寫入，否則直接寫入並 commit
+        if self.writer.running:
+            self.writer.submit(write, args)
+            return
+        with span('save'), Session(self.db) as session:
+            rows = write(session, *args) or 0
+            with COMMIT_SECONDS.time():
+                session.commit()
+        COMMITS.inc()
+        ROWS_WRITTEN.inc(rows)
+
+    def prepare(self, departments: List[DepartmentKey]):
+        # 一次建立該校缺少的校系，之後存入榜單時只需要在記憶體中查詢 ID
+        self.submit(self.write_departments, departments)
+
+    def write_departments(self, session: Session, departments: List[DepartmentKey]) -> int:
+        # 只計算新增的校系 (已經存在的校系只是查詢 ID)
+        created: Dict[Any, int] = {}
+        self.identity.department_ids(session, departments, created)
+        return len(created)
+
+    def write(self, record: AdmissionRecord):
+        self.submit(self.write_record, record)
+
+    def flush(self):
+        # 沒有啟動寫入執行緒時每次寫入都已經 commit
+        self.writer.flush()
+
+    def write_record(self, session: Session, record: AdmissionRecord) -> int:
+        start = time.perf_counter()
+        changed, rows = self._write_record(session, record)
+        pending = session.info.setdefault(_PENDING_STATS, {}).setdefault(self, {
+            'records': 0, 'rows': 0, 'seconds': 0.0, 'unchanged': {}, 'changed': {}})
+        pending['records'] += 1
+        pending['rows'] += rows
+        pending['seconds'] += time.perf_counter() - start
+        counts = pending['changed' if changed else 'unchanged']
+        counts[record.method] = counts.get(record.method, 0) + 1
+        return rows
+
+    def _accept_stats(self, pending: Dict[str, Any]):
+        self._measure(pending['records'], pending['rows'], pending['seconds'])
+        with self.stats_lock:
+            for name in ('unchanged', 'changed'):
+                counts = getattr(self, name)
+                for method, count in pending[name].items():
+                    counts[method] = counts.get(method, 0) + count
+
+    def _write_record(self, session: Session, record: AdmissionRecord) -> Tuple[bool, int]:
+        """
+        寫入一個科系的榜單與上榜人資料，回傳 (榜單內容是否有變動, 寫入筆數)
+
+        榜單內容指紋與上次相同時略過寫入，不同時只寫入新增、更新、刪除的上榜人
+        """
+        # Step1. 找到入學管道的 id
+        method_id = self.identity.method_id(session, record.method_name)
+        # Step2. 找到學校的 id
+        school_id = self.identity.department_id(session, record.school_code, record.department_code,
+                                                record.school_name, record.department_name)
+        # Step 3. 存入榜單資訊 (分數另存一份數值欄位)
+        values = dict(record.values, **score_values(record.values))
+        fingerprint = content_fingerprint(values, record.rows)
+        admission_info = session.query(AdmissionList).filter(AdmissionList.year == record.year,
+                                                             AdmissionList.method_id == method_id,
+                                                             AdmissionList.school_department_id == school_id).first()
+        if admission_info and fingerprint is not None and admission_info.fingerprint == fingerprint:
+            # 內容與上次爬取相同
+            self.logger.debug(f'[{record.method}] 榜單未變動，略過寫入: {record.school_name} {record.department_name} 年度: {record.year}')
+            return False, 0
+        # 回填模式的指紋與新榜單事件延後到上榜人合併成功後才寫入
+        staging = self.staging
+        if not admission_info:
+            admission_info = AdmissionList(
+                year=record.year,
+                method_id=method_id,
+                school_department_id=school_id,
+                fingerprint=None if staging else fingerprint,
+                **values,
+            )
+            session.add(admission_info)
+            # flush 取得榜單 ID，不需要 commit 後再查詢一次
+            session.flush()
+            written = self.write_persons(session, admission_info.id, record.rows)
+            events = None
+            if self.changelog:
+                persons = {row['admission_ticket']: row for row in record.rows if row.get('admission_ticket')}
+                events = published_events(record, persons)
+            if staging:
+                self.backfill.defer(session, admission_info.id, fingerprint, self.changelog, events)
+            elif events:
+                self.changelog.stage(session, events)
+            return True, written
+
+        session.query(AdmissionList).filter(AdmissionList.id == admission_info.id).update(
+            {getattr(AdmissionList, key): value for key, value in dict(values, **({} if staging else {'fingerprint': fingerprint})).items()})
+        if staging:
+            self.backfill.defer(session, admission_info.id, fingerprint)
+        # Step 4. 存入上榜資訊 (既有的榜單只寫入差異)
+        changes = [] if self.changelog else None
+        written = self.write_persons(session, admission_info.id, record.rows, diff=True, changes=changes)
+        if changes:
+            self.changelog.stage(session, person_events(record, changes))
+        return True, written
+
+    @property
+    def staging(self) -> bool:
+        return bool(self.backfill and self.backfill.active)
+
+    def write_persons(self, session: Session, admission_list_id: int, rows: List[Dict[str, Any]], diff: bool = False,
+                      changes: Optional[list] = None) -> int:
+        # 回填模式先寫入暫存表，結束時才合併
+        if self.staging:
+            return self.backfill.stage(session, admission_list_id, rows)
+        if diff:
+            return sum(diff_admission_persons(session, admission_list_id, rows, changes))
+        return upsert_admission_persons(session, admission_list_id, rows)
+
+
+@event.listens_for(Session, 'after_commit')
+def _accept_stats(session: Session):
+    for sink, pending in session.info.pop(_PENDING_STATS, {}).items():
+        sink._accept_stats(pending)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stats(session: Session):
+    session.info.pop(_PENDING_STATS, None)
+
+
+class FileSink(Sink):
+    """
+    FileSink appends department records to an NDJSON (one department per line, persons nested)
+    or CSV (one person per row) file, optionally gzip compressed.
+    Buffered data is flushed every `flush_records` records or `flush_interval` seconds,
+    so the file can be read while the crawl is still running.
+    """
+    def __init__(self, path: str, format: str = 'ndjson', compress: bool = True,
+                 flush_records: int = 100, flush_interval: float = 5.0) -> None:
+        super().__init__()
+        if format not in ('ndjson', 'csv'):
+            raise ValueError('file sink format must be one of: ndjson, csv')
+        self.name = format
+        suffix = f'.{format}.gz' if compress else f'.{format}'
+        self.path = path if path.endswith(suffix) else path + suffix
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        # 附加寫入: gzip 會在檔案後面接一個新的 member，解壓縮時會自動串接
+        self.file = (gzip.open(self.path, mode='at', encoding='utf-8', newline='') if compress
+                     else open(self.path, mode='a', encoding='utf-8', newline=''))
+        self.csv = None
+        if format == 'csv':
+            self.csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            if new_file:
+                self.csv.writeheader()
+        self.pending = 0
+        self.flushed_at = time.perf_counter()
+        self.logger.info(f'輸出 {format} 至 {self.path}')
+
+    def write(self, record: AdmissionRecord):
+        start = time.perf_counter()
+        document = {
+            'method': record.method,
+            'year': record.year,
+            'school_code': record.school_code,
+            'school_name': record.school_name,
+            'department_code': record.department_code,
+            'department_name': record.department_name,
+            **{field: record.values.get(field) for field in LIST_FIELDS},
+        }
+        persons = [{field: row.get(field) for field in PERSON_FIELDS} for row in record.rows]
+        with self.lock:
+            if self.csv:
+                self.csv.writerows(dict(document, **person) for person in persons)
+            else:
+                self.file.write(json.dumps(dict(document, persons=persons), ensure_ascii=False) + '\n')
+            self.pending += 1
+            if self.pending >= self.flush_records or time.perf_counter() - self.flushed_at >= self.flush_interval:
+                self._flush()
+        self._measure(1, len(persons), time.perf_counter() - start)
+
+    def flush(self):
+        with self.lock:
+            if not self.file.closed:
+                self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self._flush()
+            self.file.close()
+
+    def stats(self) -> dict:
+        return dict(super().stats(), path=self.path)
+
+    def _flush(self):
+        # gzip 以 Z_SYNC_FLUSH 輸出目前為止的資料，讀取端可以解壓縮到最後一筆完整的資料
+        self.file.flush()
+        self.pending = 0
+        self.flushed_at = time.perf_counter()
+
+
+def build_sinks(config: SinkConfig, db: Engine, backfill: Optional[Backfill] = None,
+                changelog: Optional[ChangeLog] = None) -> List[Sink]:
+    sinks: List[Sink] = []
+    for target in config.targets:
+        if target == 'sql':
+            sinks.append(SqlSink(db, backfill, changelog))
+        else:
+            sinks.append(FileSink(config.path, target, config.compress, config.flush_records, config.flush_interval))
+    return sinks
@@ -1,5 +1,6 @@
 import re
-from typing import List, Tuple
+import sys
+from typing import List, Optional, Tuple
 
 
 """
@@ -8,6 +9,12 @@ from typing import List, Tuple
 def clean_string(s: str) -> str:
     return s.replace(u'\xa0', ' ').replace('\n', ' ').strip()
 
+"""
+重複出現很多次的字串 (學校名稱、科系名稱、錄取狀態、考區) 只保留一份
+"""
+def intern_string(s: Optional[str]) -> Optional[str]:
+    return sys.intern(s) if s else s
+
 """
 將字串切割後，再將每個元素清理，並且去除空白的元素
 """
@@ -30,10 +37,10 @@ def split_school_department(s: str) -> Tuple[str, str]:
     m = regex_school_department_pattern.findall(s)
     if len(m) > 0 and len(m[0]) == 3:
         # 切割成功
-        return clean_string(m[0][0]), clean_string(m[0][2])
+        return intern_string(clean_string(m[0][0])), intern_string(clean_string(m[0][2]))
     else:
         # fallback 成一般的切割
-        return clean_split(s, ' ', 1)
+        return [intern_string(x) for x in clean_split(s, ' ', 1)]
 
 """
 將含有大學ID字串、大學名稱的字串切割成大學ID、大學名稱
@@ -0,0 +1,146 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from conf.config import WatchConfig
+from scrapers.model import SchoolModel
+from scrapers.crawlers import Crawler
+from scrapers.metrics import Metrics, QUEUE_DEPTH
+from scrapers.profiling import method_context
+
+
+"""
+放榜監看 (watch mode)
+
+放榜當天長時間執行，只以短間隔輪詢當年度各入學管道的學校列表頁面 (`university_list`)，
+比對 `UniversityListParser` 解析出的放榜狀態 (`release_status`)，狀態改變的學校立即平行爬取其科系榜單，
+不必等待整個入學管道重新爬取一輪。
+
+輪詢間隔會自動調整: 有學校放榜時回到最短間隔，沒有變化時逐漸拉長到最長間隔。
+每次放榜記錄從偵測到狀態改變到資料寫入 (commit) 完成的時間 (time-to-ingest)。
+"""
+
+# (入學管道代號, 學校列表名稱, 學校代碼)
+SchoolKey = Tuple[str, str, str]
+
+# 每次放榜的 time-to-ingest
+INGEST_SECONDS = Metrics().histogram('scraper_watch_ingest_seconds', 'Time from detecting a release to its data being committed',
+                                     buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+
+
+class Watcher:
+    """
+    Watcher polls the university lists of the current year on an adaptive interval
+    and crawls the departments of every school whose release status changed as soon as the change is seen.
+
+    Functions:
+        - poll: fetch the university lists once and start crawls for the changed schools
+        - run: poll until interrupted
+        - stats: polls, releases and time-to-ingest of the releases
+    """
+    def __init__(self, crawlers: Dict[str, Crawler], years: Dict[str, str], config: WatchConfig) -> None:
+        self.logger = logging.getLogger('watch')
+        self.crawlers = crawlers
+        # 各入學管道監看的學年度
+        self.years = years
+        self.config = config
+        self.interval = config.min_interval
+        self.executor = ThreadPoolExecutor(max_workers=max(1, config.workers), thread_name_prefix='watch')
+        # 上一次輪詢看到的放榜狀態
+        self.statuses: Dict[SchoolKey, str] = {}
+        self.lock = threading.Lock()
+        self.polls = 0
+        self.failed = 0
+        # 各次放榜的 time-to-ingest (秒)
+        self.ingest_seconds: List[float] = []
+        # 等待或進行中的學校爬取
+        self.pending = 0
+        QUEUE_DEPTH.labels('watch').set_function(lambda: self.pending)
+
+    def poll(self) -> int:
+        """
+        輪詢一次所有學校列表，回傳放榜狀態改變的學校數 (第一次輪詢只記錄目前的狀態)
+        """
+        first = self.polls == 0
+        changed = 0
+        for method, crawler in self.crawlers.items():
+            year = self.years[method]
+            try:
+                with method_context(method):
+                    listings = crawler.fetch_universities(year)
+            except Exception as e:
+                self.logger.error(f'[{method}] 輪詢學校列表失敗, 原因: {e}')
+                continue
+            for listing, universities in listings.items():
+                for university in universities:
+                    key = (method, listing, university.school_id)
+                    with self.lock:
+                        previous = self.statuses.get(key)
+                        self.statuses[key] = university.release_status
+                    if not university.release_status or university.release_status == previous:
+                        continue
+                    if first and not self.config.initial_crawl:
+                        continue
+                    changed += 1
+                    self.logger.info(f'[{method}] {university.school_name} 放榜狀態改變: {previous or "未放榜"} -> {university.release_status}')
+                    with self.lock:
+                        self.pending += 1
+                    self.executor.submit(self._crawl, crawler, year, university, listing, time.perf_counter(), key, previous)
+        self.polls += 1
+        return changed
+
+    def run(self, max_polls: Optional[int] = None):
+        self.logger.info(f'開始監看放榜: {self.years}，輪詢間隔 {self.config.min_interval} ~ {self.config.max_interval} 秒')
+        try:
+            while max_polls is None or self.polls < max_polls:
+                start = time.perf_counter()
+                if self.poll():
+                    self.interval = self.config.min_interval
+                else:
+                    self.interval = min(self.interval * self.config.backoff, self.config.max_interval)
+                if max_polls is None or self.polls < max_polls:
+                    time.sleep(max(0.0, self.interval - (time.perf_counter() - start)))
+        except KeyboardInterrupt:
+            self.logger.info('停止監看，等待進行中的爬取完成')
+        finally:
+            self.executor.shutdown(wait=True)
+            self.logger.info(f'放榜監看統計: {self.stats()}')
+
+    def stats(self) -> dict:
+        with self.lock:
+            samples = sorted(self.ingest_seconds)
+            failed = self.failed
+        return {
+            'polls': self.polls,
+            'schools': len(self.statuses),
+            'releases': len(samples),
+            'failed': failed,
+            'interval_seconds': round(self.interval, 1),
+            'p50_ingest_seconds': round(samples[len(samples) // 2], 3) if samples else 0.0,
+            'max_ingest_seconds': round(samples[-1], 3) if samples else 0.0,
+        }
+
+    def _crawl(self, crawler: Crawler, year: str, university: SchoolModel, listing: str, detected_at: float,
+               key: SchoolKey, previous: Optional[str]):
+        try:
+            with method_context(crawler.method):
+                departments = crawler.crawl_university(year, university, listing)
+            # 等待各 sink 寫入完成才算完成
+            for sink in crawler.sinks:
+                sink.flush()
+        except Exception as e:
+            self.logger.error(f'[{crawler.method}] 爬取 {university.school_name} 失敗, 原因: {e}')
+            with self.lock:
+                self.failed += 1
+                self.pending -= 1
+                # 恢復爬取前的放榜狀態，下次輪詢會再次爬取這所學校 (期間狀態又改變時以新的狀態為準)
+                if self.statuses.get(key) == university.release_status:
+                    self.statuses[key] = previous
+            return
+        seconds = time.perf_counter() - detected_at
+        INGEST_SECONDS.observe(seconds)
+        with self.lock:
+            self.ingest_seconds.append(seconds)
+            self.pending -= 1
+        self.logger.info(f'[{crawler.method}] {university.school_name} 放榜資料寫入完成: {departments} 個科系，time-to-ingest {seconds:.2f} 秒')
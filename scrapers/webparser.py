@@ -1,9 +1,14 @@
-from typing import Any, Dict, List
+import functools
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import Future
 from bs4 import BeautifulSoup
 from scrapers.ocr import *
+from scrapers.ocr_service import OCRService
 from scrapers.model import *
 from scrapers.utils import *
 from scrapers.meta import Singleton
+from scrapers.metrics import Metrics
+from scrapers.profiling import span
 # from model import *
 # from ocr import *
 # from utils import *
@@ -14,18 +19,149 @@ class Parser():
     """
     Parser is an abstract class that defines the interface for all parsers.
     All parsers must implement the parse method.
+    Parsers with expensive extractions list them in `optional_fields`,
+    those fields are skipped (left as None) when they are not requested.
+    Admission parsers list the fields they always parse in `required_fields`;
+    requesting a field that is in neither raises ValueError.
+    Parsers decompose their BeautifulSoup tree once extraction finishes, so the tree
+    (with its large base64 image attributes) is freed right away instead of by the cycle collector.
     
     Functions:
         - parse: parse the html content and return model
+        - wants: whether a field is requested
+        - field_names: fields that can be requested (required and optional)
     """
+    # 一定會解析的欄位
+    required_fields: Tuple[str, ...] = ()
+    # 可以略過的欄位 (例如需要 OCR 的欄位)
+    optional_fields: Tuple[str, ...] = ()
+    
+    def __init__(self, fields: Optional[List[str]] = None):
+        # None 代表解析全部欄位
+        self.fields = set(fields) if fields else None
+        unknown = sorted(self.fields - set(self.field_names())) if self.fields else []
+        if unknown:
+            # 拼錯的欄位名稱會讓可以略過的欄位全部被略過
+            raise ValueError(f'{type(self).__name__} unknown fields: {", ".join(unknown)} (expected: {", ".join(self.field_names())})')
+    
+    @classmethod
+    def field_names(cls) -> Tuple[str, ...]:
+        return cls.required_fields + cls.optional_fields
+    
+    def wants(self, field: str) -> bool:
+        return self.fields is None or field not in self.optional_fields or field in self.fields
+    
     def parse(self, html_content: str):
         raise NotImplementedError
 
+    def __init_subclass__(cls, **kwargs):
+        # 記錄每個解析器 parse 的耗時
+        super().__init_subclass__(**kwargs)
+        if 'parse' in cls.__dict__:
+            cls.parse = _timed_parse(cls.__name__, cls.__dict__['parse'])
+
+# 各解析器解析一頁的耗時
+PARSE_SECONDS = Metrics().histogram('scraper_parse_seconds', 'Time spent parsing a page by parser class', ('parser',))
+
+def _timed_parse(name: str, parse):
+    histogram = PARSE_SECONDS.labels(name)
+    @functools.wraps(parse)
+    def timed(self, html_content: str):
+        with span('parse'), histogram.time():
+            return parse(self, html_content)
+    return timed
+
+def join_ocr_parts(parts: List[Any]) -> str:
+    """
+    將字串與 OCR Future 組成的片段接成字串 (OCR 結果會經過 clean_string)
+    """
+    return ''.join(clean_string(part.result()) if isinstance(part, Future) else part for part in parts)
+
+def submit_name_ocr(ocr_service: OCRService, name_element) -> List[Any]:
+    """
+    送出姓名字形圖片的 OCR 請求，回傳由 '*' 與 Future 組成的片段
+    """
+    name = []
+    match_img_pattern = '<img.*?/>'
+    match_star_pattern = '(?:>)([*])(?:<)'
+    imgs = [m.end() for m in re.finditer(match_img_pattern, str(name_element))]
+    star = [m.end() for m in re.finditer(match_star_pattern, str(name_element))]
+    if imgs and star:
+        star_position = star[0]
+        image_element = name_element.find_next('img')
+        for img_position in imgs:
+            if img_position > star_position:
+                name.append('*')
+            image = put_center(image_element.get('src'), (255,255,255), scale=2)
+            image = dilate(image, kernel=(2,2), iterations=2)
+            name.append(ocr_service.single_character_ocr(image, lang='chi_tra_mjh'))
+            image_element = image_element.find_next_sibling('img')
+        if star_position > imgs[-1]:
+            name.append('*')
+    else:
+        name.append('*')
+    return name
+
+def submit_school_status_ocr(ocr_service: OCRService, school_element, with_status: bool = True) -> List[Tuple[bool, str, str, Optional[List[Any]]]]:
+    """
+    解析各校系錄取情況，二階甄試備取名次圖片送出 OCR 請求，
+    回傳 (是否分發錄取, 學校, 科系, 狀態片段) 的列表 (with_status 為 False 時不解析二階甄試狀態，狀態片段為 None)
+    """
+    school_admission_status = []
+    school_depart_element = school_element.find_next('table')
+    school_row = school_depart_element.find_next('tr')
+    while school_row:
+        school_item_elements = school_row.find_all('td', recursive=False)
+        if school_item_elements and len(school_item_elements) == 3:
+            # 檢查是否分發錄取
+            is_admission = True if school_item_elements[0].find('img', {'title': '分發錄取'}) else False
+            # 學校、科系
+            school_depart_text = clean_string(school_item_elements[1].select_one('a').text)
+            if school_depart_text:
+                school, depart = split_school_department(school_depart_text)
+                if not with_status:
+                    school_admission_status.append((is_admission, school, depart, None))
+                    school_row = school_row.find_next_sibling('tr')
+                    continue
+                # 二階甄試
+                release_status_element = school_item_elements[2].select_one('img')
+                release_date = clean_string(school_item_elements[2].select_one('div.retestdate').text)
+                if release_status_element:
+                    if len(release_status_element.parent.get('class')) == 0:
+                        release_status = ['未錄取']
+                    else:
+                        prefix_string = clean_string(school_item_elements[2].text)
+                        admit = clean_string(release_status_element.parent.get('class')[0]) == 'leftred'
+                        if admit:
+                            # 正取不需要辨識名次圖片
+                            release_status = [prefix_string, '正取']
+                        else:
+                            release_img = release_status_element.get('src')
+                            release_img = crop_image_by_x_axis(release_img, start_x=45)
+                            release_img = replace_transparent_background(release_img)
+                            release_status = [prefix_string, '備取', ocr_service.single_line_number_ocr(release_img)]
+                else:
+                    release_status = ['' if not release_date else release_date]
+                school_admission_status.append((is_admission, school, depart, release_status))
+        school_row = school_row.find_next_sibling('tr')
+    return school_admission_status
+
+def resolve_school_status(school_admission_status: List[Tuple[bool, str, str, Optional[List[Any]]]]) -> List[SchoolAdmissionStatusModel]:
+    """
+    取回二階甄試狀態的 OCR 結果
+    """
+    return [
+        SchoolAdmissionStatusModel(is_admission, school, depart, intern_string(join_ocr_parts(release_status)) if release_status is not None else None)
+        for is_admission, school, depart, release_status in school_admission_status
+    ]
+
+
 class AvailableYearsParser(Parser):
     """
     從首頁 `https://www.com.tw/` 解析出可用的學年度
     """
     def __init__(self):
+        super().__init__()
         self.admission_method = {
             '分科測驗': 'exam',
             '大學繁星': 'star',
@@ -57,6 +193,7 @@ class AvailableYearsParser(Parser):
                     method_name=nav_text,
                     available_years=available
                 ))
+        resp.decompose()
         return available_years
 
 class UniversityListParser(Parser):
@@ -94,6 +231,7 @@ class UniversityListParser(Parser):
                     ))
             row = row.find_next_sibling('tr')
             
+        resp.decompose()
         return schools
 
 class ExamDepartmentListParser(Parser):
@@ -118,9 +256,12 @@ class ExamDepartmentListParser(Parser):
                     admission_weights=admission_weights
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return departments
 
 class ExamAdmissionListParser(Parser):
+    required_fields = ('ticket', 'exam_area', 'schools')
+    
     def parse(self, html_content: str) -> ExamAdmissionDetailModel:
         def parse_info(table_element):
             result = {}
@@ -171,11 +312,12 @@ class ExamAdmissionListParser(Parser):
                 school, depart = split_school_department(item_elements[4].text)
                 admissions.append(ExamAdmissionModel(
                     ticket=ticket_examarea[0],
-                    exam_area=ticket_examarea[-1],
+                    exam_area=intern_string(ticket_examarea[-1]),
                     school_name=school,
                     school_depart=depart,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return ExamAdmissionDetailModel(
             weights=info['weights'],
             order=info['order'],
@@ -204,9 +346,12 @@ class StarDepartmentListParser(Parser):
                     admission_href=admission_href,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return departments
 
 class StarAdmissionListParser(Parser):
+    required_fields = ('ticket', 'exam_area', 'schools')
+    
     def parse(self, html_content: str) -> List[StarAdmissionModel]:
         resp = BeautifulSoup(html_content, 'lxml')
         main_content = resp.find('div', id='mainContent')
@@ -221,11 +366,12 @@ class StarAdmissionListParser(Parser):
                 school, depart = split_school_department(item_elements[4].text)
                 admissions.append(StarAdmissionModel(
                     ticket=ticket_examarea[0],
-                    exam_area=ticket_examarea[-1],
+                    exam_area=intern_string(ticket_examarea[-1]),
                     school_name=school,
                     school_depart=depart,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return admissions
 
 class CrossDepartmentListParser(Parser):
@@ -248,13 +394,18 @@ class CrossDepartmentListParser(Parser):
                     release_status=release_status,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return departments
     
 class CrossAdmissionListParser(Parser):
+    # 准考證號碼與校系 (用來對應榜單) 一定會解析
+    required_fields = ('ticket', 'schools')
+    optional_fields = ('exam_area', 'name', 'status')
+    
     def parse(self, html_content: str) -> List[CrossAdmissionModel]:
-        adminssion = []
-        # ocr object
-        ocr_obj = OCR()
+        pending = []
+        # ocr service (送出圖片後取得 Future，整頁送出後再一次取回結果)
+        ocr_service = OCRService()
         
         resp = BeautifulSoup(html_content, 'lxml')
         main_content = resp.find('div', id='mainContent')
@@ -267,77 +418,29 @@ class CrossAdmissionListParser(Parser):
                 
                 # 准考證號碼、考區
                 ticket_examarea_element = item_elements[2]
-                ticket = clean_string(ocr_obj.single_line_number_ocr(ticket_examarea_element.select_one('img').get('src')))
-                examarea = clean_split(ticket_examarea_element.select_one('a').text, ':')[-1]
+                ticket = ocr_service.single_line_number_ocr(ticket_examarea_element.select_one('img').get('src'))
+                examarea = intern_string(clean_split(ticket_examarea_element.select_one('a').text, ':')[-1]) if self.wants('exam_area') else None
 
                 # 名稱 OCR (準確度不高)
-                # name = ''
-                name = ''
-                name_element = item_elements[3]
-                match_img_pattern = '<img.*?/>'
-                match_star_pattern = '(?:>)([*])(?:<)'
-                imgs = [m.end() for m in re.finditer(match_img_pattern, str(name_element))]
-                star = [m.end() for m in re.finditer(match_star_pattern, str(name_element))]
-                if imgs and star:
-                    star_position = star[0]
-                    image_element = name_element.find_next('img')
-                    for img_position in imgs:
-                        if img_position > star_position:
-                            name += '*'
-                        image = put_center(image_element.get('src'), (255,255,255), scale=2)
-                        image = dilate(image, kernel=(2,2), iterations=2)
-                        name += clean_string(ocr_obj.single_character_ocr(image, lang='chi_tra_mjh'))
-                        image_element = image_element.find_next_sibling('img')
-                    if star_position > imgs[-1]:
-                        name += '*'
-                else:
-                    name = '*'
+                name = submit_name_ocr(ocr_service, item_elements[3]) if self.wants('name') else None
 
                 # 學校錄取情況
-                school_admission_status = []
-                school_depart_element = item_elements[4].find_next('table')
-                school_row = school_depart_element.find_next('tr')
-                while school_row:
-                    school_item_elements = school_row.find_all('td', recursive=False)
-                    if school_item_elements and len(school_item_elements) == 3:
-                        # 檢查是否分發錄取
-                        is_admission = True if school_item_elements[0].find('img', {'title': '分發錄取'}) else False
-                        # 學校、科系
-                        school_depart_text = clean_string(school_item_elements[1].select_one('a').text)
-                        if school_depart_text:
-                            school, depart = split_school_department(school_depart_text)
-                            # 二階甄試
-                            release_status_element = school_item_elements[2].select_one('img')
-                            release_date = clean_string(school_item_elements[2].select_one('div.retestdate').text)
-                            if release_status_element:
-                                if len(release_status_element.parent.get('class')) == 0:
-                                    admit = False
-                                    release_status = '未錄取'
-                                else:
-                                    prefix_string = clean_string(school_item_elements[2].text)
-                                    admit = clean_string(release_status_element.parent.get('class')[0]) == 'leftred'
-                                    release_img = release_status_element.get('src')
-                                    release_img = crop_image_by_x_axis(release_img, start_x=45)
-                                    release_img = replace_transparent_background(release_img)
-                                    release_status = clean_string(ocr_obj.single_line_number_ocr(release_img))
-                                    release_status = '正取' if admit else '備取' + release_status
-                                    release_status = prefix_string + release_status
-                            else:
-                                release_status = '' if not release_date else release_date
-                            school_admission_status.append(SchoolAdmissionStatusModel(
-                                is_admission,
-                                school,
-                                depart,
-                                release_status
-                            ))
-                    school_row = school_row.find_next_sibling('tr')
-                adminssion.append(CrossAdmissionModel(
-                    ticket,
-                    examarea,
-                    name,
-                    school_admission_status
-                ))
+                school_admission_status = submit_school_status_ocr(ocr_service, item_elements[4], self.wants('status'))
+                pending.append((ticket, examarea, name, school_admission_status))
             row = row.find_next_sibling('tr')
+        
+        # 整頁送出 OCR 後就拆除樹，等待辨識結果時不必保留
+        resp.decompose()
+        
+        # 取回 OCR 結果
+        adminssion = []
+        for ticket, examarea, name, school_admission_status in pending:
+            adminssion.append(CrossAdmissionModel(
+                join_ocr_parts([ticket]),
+                examarea,
+                join_ocr_parts(name) if name is not None else None,
+                resolve_school_status(school_admission_status)
+            ))
         return adminssion
     
 class VtechDepartmentListParser(Parser):
@@ -360,14 +463,19 @@ class VtechDepartmentListParser(Parser):
                     group=group,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return departments
 
 class VtechAdmissionParser(Parser):
+    # 准考證號碼與校系 (用來對應榜單) 一定會解析
+    required_fields = ('ticket', 'schools')
+    optional_fields = ('name', 'status')
+    
     def parse(self, html_content: str) -> List[VtechAdmissionModel]:
-        adminssion = []
+        pending = []
         
-        # ocr object
-        ocr_obj = OCR()
+        # ocr service (送出圖片後取得 Future，整頁送出後再一次取回結果)
+        ocr_service = OCRService()
         
         resp = BeautifulSoup(html_content, 'lxml')
         main_content = resp.find('div', id='mainContent')
@@ -379,75 +487,27 @@ class VtechAdmissionParser(Parser):
             if item_elements and len(item_elements) == 5:
                 # 准考證號碼
                 ticket_examarea_element = item_elements[2]
-                ticket = clean_string(ocr_obj.single_line_number_ocr(ticket_examarea_element.select_one('img').get('src')))
+                ticket = ocr_service.single_line_number_ocr(ticket_examarea_element.select_one('img').get('src'))
 
                 # 名稱 OCR (準確度不高)
-                # name = ''
-                name = ''
-                name_element = item_elements[3]
-                match_img_pattern = '<img.*?/>'
-                match_star_pattern = '(?:>)([*])(?:<)'
-                imgs = [m.end() for m in re.finditer(match_img_pattern, str(name_element))]
-                star = [m.end() for m in re.finditer(match_star_pattern, str(name_element))]
-                if imgs and star:
-                    star_position = star[0]
-                    image_element = name_element.find_next('img')
-                    for img_position in imgs:
-                        if img_position > star_position:
-                            name += '*'
-                        image = put_center(image_element.get('src'), (255,255,255), scale=2)
-                        image = dilate(image, kernel=(2,2), iterations=2)
-                        name += clean_string(ocr_obj.single_character_ocr(image, lang='chi_tra_mjh'))
-                        image_element = image_element.find_next_sibling('img')
-                    if star_position > imgs[-1]:
-                        name += '*'
-                else:
-                    name = '*'
+                name = submit_name_ocr(ocr_service, item_elements[3]) if self.wants('name') else None
                 
                 # 學校錄取情況
-                school_admission_status = []
-                school_depart_element = item_elements[4].find_next('table')
-                school_row = school_depart_element.find_next('tr')
-                while school_row:
-                    school_item_elements = school_row.find_all('td', recursive=False)
-                    if school_item_elements and len(school_item_elements) == 3:
-                        # 檢查是否分發錄取
-                        is_admission = True if school_item_elements[0].find('img', {'title': '分發錄取'}) else False
-                        # 學校、科系
-                        school_depart_text = clean_string(school_item_elements[1].select_one('a').text)
-                        if school_depart_text:
-                            school, depart = split_school_department(school_depart_text)
-                            # 二階甄試
-                            release_status_element = school_item_elements[2].select_one('img')
-                            release_date = clean_string(school_item_elements[2].select_one('div.retestdate').text)
-                            if release_status_element:
-                                if len(release_status_element.parent.get('class')) == 0:
-                                    admit = False
-                                    release_status = '未錄取'
-                                else:
-                                    prefix_string = clean_string(school_item_elements[2].text)
-                                    admit = clean_string(release_status_element.parent.get('class')[0]) == 'leftred'
-                                    release_img = release_status_element.get('src')
-                                    release_img = crop_image_by_x_axis(release_img, start_x=45)
-                                    release_img = replace_transparent_background(release_img)
-                                    release_status = clean_string(ocr_obj.single_line_number_ocr(release_img))
-                                    release_status = '正取' if admit else '備取' + release_status
-                                    release_status = prefix_string + release_status
-                            else:
-                                release_status = '' if not release_date else release_date
-                            school_admission_status.append(SchoolAdmissionStatusModel(
-                                is_admission,
-                                school,
-                                depart,
-                                release_status
-                            ))
-                    school_row = school_row.find_next_sibling('tr')
-                adminssion.append(VtechAdmissionModel(
-                    ticket,
-                    name,
-                    school_admission_status
-                ))
+                school_admission_status = submit_school_status_ocr(ocr_service, item_elements[4], self.wants('status'))
+                pending.append((ticket, name, school_admission_status))
             row = row.find_next_sibling('tr')
+        
+        # 整頁送出 OCR 後就拆除樹，等待辨識結果時不必保留
+        resp.decompose()
+        
+        # 取回 OCR 結果
+        adminssion = []
+        for ticket, name, school_admission_status in pending:
+            adminssion.append(VtechAdmissionModel(
+                join_ocr_parts([ticket]),
+                join_ocr_parts(name) if name is not None else None,
+                resolve_school_status(school_admission_status)
+            ))
         return adminssion
     
 class TechregDepartmentParser(Parser):
@@ -472,9 +532,12 @@ class TechregDepartmentParser(Parser):
                     average_score=average_score,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return departments
 
 class TechregAdmissionParser(Parser):
+    required_fields = ('ticket', 'name')
+    
     def parse(self, html_content: str) -> TechregAdmissionDetailModel:
         def parse_info(table_element):
             result = {}
@@ -517,6 +580,7 @@ class TechregAdmissionParser(Parser):
                     name=name,
                 ))
             row = row.find_next_sibling('tr')
+        resp.decompose()
         return TechregAdmissionDetailModel(
             general_grade=info['general_grade'],
             native_grade=info['native_grade'],
@@ -528,7 +592,7 @@ class TechregAdmissionParser(Parser):
 if __name__ == '__main__':
     import os
     print(os.getcwd())
-    pytesseract.pytesseract.tesseract_cmd = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
+    set_tesseract_cmd('C:\\Program Files\\Tesseract-OCR\\tesseract.exe')
     with open(os.path.join(os.getcwd(), 'scrapers\\resources\\vtech_test.html'), 'r', encoding='utf-8') as f:
         html_content = f.read()
         result = VtechAdmissionParser().parse(html_content)
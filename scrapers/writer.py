@@ -0,0 +1,231 @@
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+from scrapers.meta import Singleton
+from scrapers.metrics import Metrics, QUEUE_DEPTH
+from scrapers.profiling import Spans, current_method
+
+
+"""
+背景寫入執行緒 (write-behind)
+
+爬蟲解析完一個科系後只把結果放進有上限的佇列，由單一寫入執行緒把多個科系合併成一個 transaction，
+累積的資料筆數達到門檻或距離上次 commit 超過指定秒數才 commit，抓取與解析不再等待磁碟同步。
+每個科系的寫入時間加上平均分攤的 commit 時間記錄為送出時入學管道的 save 階段。
+"""
+
+# 寫入函式: write(session, *args) -> 寫入筆數
+WriteFunc = Callable[..., int]
+# 寫入工作: (寫入函式, 參數, 放入佇列的時間, 入學管道)
+Job = Tuple[WriteFunc, Tuple[Any, ...], float, str]
+
+# 通知寫入執行緒結束
+_STOP = object()
+
+# commit 的筆數、次數、失敗的科系數與 commit 耗時 (沒有啟動寫入執行緒時由 SqlSink 記錄)
+ROWS_WRITTEN = Metrics().counter('scraper_db_rows_written_total', 'Rows written to the database')
+COMMITS = Metrics().counter('scraper_db_commits_total', 'Database commits')
+WRITE_FAILURES = Metrics().counter('scraper_db_write_failures_total', 'Department records that failed to be written')
+COMMIT_SECONDS = Metrics().histogram('scraper_db_commit_seconds', 'Database commit latency')
+
+
+class _Flush:
+    # 通知寫入執行緒立即 commit 目前的批次，完成後設定 done
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+class BatchWriter(metaclass=Singleton):
+    """
+    BatchWriter receives write jobs through a bounded queue and applies them on a background thread,
+    grouping many jobs into one transaction that is committed by row count or by time.
+    When a batch fails, it is rolled back and replayed job by job so one bad department does not drop the others.
+
+    Functions:
+        - start: start the writer thread
+        - submit: enqueue a write job (blocks while the queue is full)
+        - flush: commit every job submitted so far and wait for it
+        - shutdown: commit pending jobs and stop the writer thread
+        - stats: write latency, commit latency and queue backlog
+    """
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('writer')
+        self.db: Optional[Engine] = None
+        self.queue: Optional[queue.Queue] = None
+        self.thread: Optional[threading.Thread] = None
+        self.batch_rows = 5000
+        self.flush_interval = 5.0
+        self.lock = threading.Lock()
+
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.rows = 0
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        # 從放入佇列到 commit 完成的時間
+        self.latency_seconds = 0.0
+        self.max_latency_seconds = 0.0
+        # 爬蟲因佇列已滿而等待的時間
+        self.blocked_seconds = 0.0
+        self.max_backlog = 0
+        QUEUE_DEPTH.labels('writer').set_function(lambda: self.queue.qsize() if self.queue else 0)
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, db: Engine, queue_size: int = 64, batch_rows: int = 5000, flush_interval: float = 5.0):
+        if self.running:
+            return
+        self.db = db
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+        self.thread.start()
+        self.logger.info(f'寫入執行緒啟動，佇列上限: {queue_size}，每 {batch_rows} 筆或 {flush_interval} 秒 commit 一次')
+
+    def submit(self, write: WriteFunc, args: Tuple[Any, ...]):
+        start = time.perf_counter()
+        self.queue.put((write, args, start, current_method()))
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.submitted += 1
+            self.blocked_seconds += waited
+            self.max_backlog = max(self.max_backlog, self.queue.qsize())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # 不等待 batch_rows / flush_interval，立即 commit 已送出的資料 (e.g. 放榜監看需要盡快寫入)
+        if not self.running:
+            return True
+        marker = _Flush()
+        self.queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def shutdown(self):
+        if not self.running:
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+        self.logger.info(f'寫入執行緒結束，統計: {self.stats()}')
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'failed': self.failed,
+                'rows': self.rows,
+                'commits': self.commits,
+                'backlog': self.queue.qsize() if self.queue else 0,
+                'max_backlog': self.max_backlog,
+                'avg_commit_ms': round(self.commit_seconds / self.commits * 1000, 2) if self.commits else 0.0,
+                'max_commit_ms': round(self.max_commit_seconds * 1000, 2),
+                'avg_latency_ms': round(self.latency_seconds / self.written * 1000, 2) if self.written else 0.0,
+                'max_latency_ms': round(self.max_latency_seconds * 1000, 2),
+                'producer_blocked_seconds': round(self.blocked_seconds, 3),
+            }
+
+    def _run(self):
+        batch: List[Job] = []
+        # 批次中每個工作的寫入秒數
+        spent: List[float] = []
+        session: Optional[Session] = None
+        rows, opened_at = 0, 0.0
+        stopping = False
+        flushing: Optional[_Flush] = None
+        while not stopping:
+            timeout = max(0.0, self.flush_interval - (time.perf_counter() - opened_at)) if batch else None
+            try:
+                job = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                job = None
+
+            if job is _STOP:
+                stopping = True
+            elif isinstance(job, _Flush):
+                flushing = job
+            elif job is not None:
+                if session is None:
+                    session, opened_at = Session(self.db), time.perf_counter()
+                batch.append(job)
+                start = time.perf_counter()
+                try:
+                    write, args, _, _ = job
+                    with Spans().profile('save'):
+                        rows += write(session, *args) or 0
+                    spent.append(time.perf_counter() - start)
+                except Exception as e:
+                    self.logger.warning(f'批次寫入失敗，改為逐筆重試, 原因: {e}')
+                    session.rollback()
+                    self._replay(session, batch)
+                    session.close()
+                    batch, spent, session, rows = [], [], None, 0
+                    continue
+
+            # 筆數達到門檻、超過時間、要求 flush 或結束時 commit
+            if batch and (stopping or flushing or rows >= self.batch_rows or time.perf_counter() - opened_at >= self.flush_interval):
+                self._commit(session, batch, spent, rows)
+                session.close()
+                batch, spent, session, rows = [], [], None, 0
+            if flushing:
+                flushing.done.set()
+                flushing = None
+
+    def _commit(self, session: Session, batch: List[Job], spent: List[float], rows: int):
+        start = time.perf_counter()
+        try:
+            with Spans().profile('save'):
+                session.commit()
+        except Exception as e:
+            self.logger.warning(f'批次 commit 失敗，改為逐筆重試, 原因: {e}')
+            session.rollback()
+            self._replay(session, batch)
+            return
+        commit_seconds = time.perf_counter() - start
+        self._record(batch, rows, commit_seconds)
+        # commit 時間平均分攤給批次中的每個科系
+        for (_, _, _, method), seconds in zip(batch, spent):
+            Spans().record('save', seconds + commit_seconds / len(batch), method)
+
+    def _replay(self, session: Session, batch: List[Job]):
+        # 逐筆寫入並 commit，失敗的只略過該筆
+        for job in batch:
+            write, args, _, method = job
+            start = time.perf_counter()
+            try:
+                with Spans().profile('save'):
+                    rows = write(session, *args) or 0
+                    session.commit()
+            except Exception as e:
+                session.rollback()
+                self.logger.error(f'存入資料庫失敗, 原因: {e}')
+                with self.lock:
+                    self.failed += 1
+                WRITE_FAILURES.inc()
+                continue
+            seconds = time.perf_counter() - start
+            self._record([job], rows, seconds)
+            Spans().record('save', seconds, method)
+
+    def _record(self, batch: List[Job], rows: int, commit_seconds: float):
+        now = time.perf_counter()
+        COMMITS.inc()
+        ROWS_WRITTEN.inc(rows)
+        COMMIT_SECONDS.observe(commit_seconds)
+        with self.lock:
+            self.commits += 1
+            self.commit_seconds += commit_seconds
+            self.max_commit_seconds = max(self.max_commit_seconds, commit_seconds)
+            self.written += len(batch)
+            self.rows += rows
+            for _, _, enqueued_at, _ in batch:
+                self.latency_seconds += now - enqueued_at
+                self.max_latency_seconds = max(self.max_latency_seconds, now - enqueued_at)
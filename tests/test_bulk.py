@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from orm.bulk import content_fingerprint, diff_admission_persons
+from orm.model import AdmissionList, AdmissionPerson, AdmissionType, Base, SchoolDepartment
+
+
+def stored_list(session: Session) -> int:
+    # 建立一張榜單與兩位既有的上榜人，回傳榜單 ID
+    method = AdmissionType(name='分科測驗')
+    department = SchoolDepartment(school_code='001', school_name='國立臺灣大學', depart_code='001012', depart_name='中國文學系')
+    session.add_all([method, department])
+    session.flush()
+    admission_list = AdmissionList(year=113, method_id=method.id, school_department_id=department.id)
+    session.add(admission_list)
+    session.flush()
+    session.add_all([
+        AdmissionPerson(admission_list_id=admission_list.id, admission_ticket='10010101', admission_status='正取'),
+        AdmissionPerson(admission_list_id=admission_list.id, admission_ticket='10010102', admission_status='正取'),
+    ])
+    session.commit()
+    return admission_list.id
+
+def test_empty_ticket_does_not_delete_stored_person():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        admission_list_id = stored_list(session)
+        # 第二位的准考證號碼 OCR 辨識失敗 (空字串)
+        rows = [{'admission_ticket': '10010101', 'admission_status': '正取'},
+                {'admission_ticket': '', 'admission_status': '正取'}]
+        changes = []
+        inserted, updated, removed = diff_admission_persons(session, admission_list_id, rows, changes)
+        session.commit()
+
+        assert (inserted, updated, removed) == (0, 0, 0)
+        assert changes == []
+        tickets = {ticket for ticket, in session.query(AdmissionPerson.admission_ticket)}
+        assert tickets == {'10010101', '10010102'}
+
+def test_missing_ticket_is_deleted_when_page_is_complete():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        admission_list_id = stored_list(session)
+        changes = []
+        inserted, updated, removed = diff_admission_persons(session, admission_list_id,
+                                                            [{'admission_ticket': '10010101', 'admission_status': '正取'}], changes)
+        session.commit()
+
+        assert (inserted, updated, removed) == (0, 0, 1)
+        assert [current.admission_ticket for current, row in changes if row is None] == ['10010102']
+        assert [ticket for ticket, in session.query(AdmissionPerson.admission_ticket)] == ['10010101']
+
+def test_empty_ticket_has_no_fingerprint():
+    assert content_fingerprint({}, [{'admission_ticket': '10010101'}, {'admission_ticket': ''}]) is None
+    assert content_fingerprint({}, [{'admission_ticket': '10010101'}]) is not None